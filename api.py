@@ -1,10 +1,17 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
+import time
 import uuid
-from video_searcher import VideoSpeechContentSearcher
-import threading
-from database import db, Index, File, IndexStatus
+from video_searcher import VideoSpeechContentSearcher, SEARCH_MODES
+from vector_store import VECTOR_STORE_BACKENDS, QUANTIZATIONS, SPACES
+from database import db, Index, File
+from job_queue import JobQueue, QueueFullError
+from model_manager import asr_manager
+from retrieve import embedding_stats
+from query_embedder import query_embedder
+from watcher import FolderWatcher
+import config
 
 try:
     # load environment variables from .env file (requires `python-dotenv`)
@@ -20,6 +27,36 @@ CORS(app)  # 允许跨域请求
 # 初始化搜索器
 vs = VideoSpeechContentSearcher()
 
+# 初始化处理队列，任务交给搜索器的处理流水线执行，共享同一个ASR模型
+job_queue = JobQueue(
+    vs,
+    max_pending=config.INGEST_MAX_PENDING,
+    max_attempts=config.INGEST_MAX_ATTEMPTS,
+)
+
+# 监视目录，新增或修改的媒体文件自动加入处理队列
+folder_watcher = FolderWatcher(
+    vs,
+    job_queue,
+    backend=config.WATCH_BACKEND,
+    poll_interval=config.WATCH_POLL_INTERVAL_S,
+    settle_seconds=config.WATCH_SETTLE_S,
+)
+
+DEBUG = True
+
+def start_background_workers():
+    """启动处理队列（恢复上次未完成的任务）和目录监视"""
+    job_queue.start()
+    folder_watcher.start()
+    if config.ASR_PRELOAD:
+        asr_manager.preload()
+
+# 应用加载时就启动后台任务，使用任何WSGI服务器时都能恢复未完成的任务；
+# 只有 python api.py 的debug模式下负责重载的父进程不启动，由重载后的子进程启动
+if not (__name__ == '__main__' and DEBUG and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'):
+    start_background_workers()
+
 @app.route('/api/indexes', methods=['GET'])
 def get_indexes():
     """获取所有索引列表"""
@@ -28,7 +65,7 @@ def get_indexes():
         # 转换为字典格式以供JSON序列化
         indexes_dict = []
         for index in indexes:
-            files_dict = [{'path': f.path, 'status': f.status} for f in index.files]
+            files_dict = [{'path': f.path, 'status': f.status, 'progress': f.progress, 'duration': f.duration} for f in index.files]
             indexes_dict.append({
                 'id': index.id,
                 'name': index.name,
@@ -72,16 +109,53 @@ def create_index():
                 return jsonify({'error': f'路径不是文件: {path}'}), 400
             video_file_paths.append(path)
         
+        # 向量库后端
+        backend = data.get('vectorStore', config.VECTOR_STORE_BACKEND)
+        if backend not in VECTOR_STORE_BACKENDS:
+            return jsonify({'error': f'无效的向量库类型: {backend}'}), 400
+
+        # 距离和HNSW参数
+        distance = data.get('distance', config.DEFAULT_DISTANCE)
+        if distance not in SPACES:
+            return jsonify({'error': f'无效的距离类型: {distance}'}), 400
+        hnsw, error = parse_hnsw_params(data.get('hnsw'))
+        if error:
+            return jsonify({'error': error}), 400
+
+        settings = {'backend': backend, 'space': distance}
+        if hnsw:
+            settings['hnsw'] = hnsw
+        # 向量维度（Matryoshka截断），不设置时使用模型的完整维度
+        # 0 或 null 表示使用模型的完整维度
+        embedding_dim = data.get('embeddingDim', config.EMBEDDING_DIM)
+        if embedding_dim is not None:
+            if isinstance(embedding_dim, bool) or not isinstance(embedding_dim, int) or embedding_dim < 0:
+                return jsonify({'error': f'无效的向量维度: {embedding_dim}'}), 400
+            if embedding_dim:
+                settings['embedding_dim'] = embedding_dim
+        if backend == 'mmap':
+            # 量化只适用于mmap向量库
+            quantization = data.get('quantization', config.MMAP_QUANTIZATION)
+            if quantization not in QUANTIZATIONS:
+                return jsonify({'error': f'无效的量化方式: {quantization}'}), 400
+            settings['quantization'] = quantization
+
+        # 队列已满时拒绝请求
+        job_queue.check_capacity(len(video_file_paths))
+
         # 创建索引记录
-        index_obj = db.create_index(index_name, video_file_paths)
+        index_obj = db.create_index(index_name, video_file_paths, settings=settings)
         index_id = index_obj.id
         
-        # 启动后台处理线程
-        thread = threading.Thread(target=process_videos, args=(index_id, index_name, video_file_paths))
-        thread.start()
+        # 加入后台处理队列，队列已满时删除刚创建的索引
+        try:
+            job_queue.submit(index_id, video_file_paths)
+        except QueueFullError:
+            db.delete_index(index_id)
+            raise
         
         # 转换为字典格式以供JSON序列化
-        files_dict = [{'path': f.path, 'status': f.status} for f in index_obj.files]
+        files_dict = [{'path': f.path, 'status': f.status, 'progress': f.progress, 'duration': f.duration} for f in index_obj.files]
         index_record = {
             'id': index_obj.id,
             'name': index_obj.name,
@@ -91,6 +165,8 @@ def create_index():
         }
         
         return jsonify(index_record), 201
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429
     except Exception as e:
         return jsonify({'error': f'创建索引失败: {str(e)}'}), 500
 
@@ -104,7 +180,7 @@ def get_index_detail(index_id):
             return jsonify({'error': '索引不存在'}), 404
         
         # 转换为字典格式以供JSON序列化
-        files_dict = [{'path': f.path, 'status': f.status} for f in index_obj.files]
+        files_dict = [{'path': f.path, 'status': f.status, 'progress': f.progress, 'duration': f.duration} for f in index_obj.files]
         index_detail = {
             'id': index_obj.id,
             'name': index_obj.name,
@@ -126,6 +202,19 @@ def delete_index(index_id):
         if not index_obj:
             return jsonify({'error': '索引不存在'}), 404
         
+        # 停止监视该索引的目录
+        folder_watcher.unwatch_index(index_id)
+
+        # 删除向量数据和搜索结果缓存
+        try:
+            vs.delete_database(index_id)
+        except Exception as e:
+            print(f"删除索引 {index_id} 的向量数据失败: {str(e)}")
+
+        # 删除保存的转录结果
+        for f in index_obj.files:
+            vs.transcript_store.delete(f.path)
+
         # 删除索引
         if db.delete_index(index_id):
             return jsonify({'message': '索引删除成功'}), 200
@@ -134,6 +223,37 @@ def delete_index(index_id):
     except Exception as e:
         return jsonify({'error': f'索引删除失败: {str(e)}'}), 500
 
+@app.route('/api/indexes/<index_id>/rebuild', methods=['POST'])
+def rebuild_index(index_id):
+    """使用新的距离或HNSW参数在后台重建索引"""
+    try:
+        # 检查索引是否存在
+        index_obj = db.get_index_by_id(index_id)
+        if not index_obj:
+            return jsonify({'error': '索引不存在'}), 404
+
+        data = request.get_json(silent=True) or {}
+        distance = data.get('distance')
+        if distance is not None and distance not in SPACES:
+            return jsonify({'error': f'无效的距离类型: {distance}'}), 400
+        hnsw, error = parse_hnsw_params(data.get('hnsw'))
+        if error:
+            return jsonify({'error': error}), 400
+
+        if not vs.rebuild_index(index_id, space=distance, hnsw=hnsw):
+            return jsonify({'error': '索引正在重建中'}), 409
+        return jsonify({'message': '索引重建已开始'}), 202
+    except Exception as e:
+        return jsonify({'error': f'索引重建失败: {str(e)}'}), 500
+
+@app.route('/api/indexes/<index_id>/rebuild', methods=['GET'])
+def get_rebuild_status(index_id):
+    """获取索引重建状态"""
+    status = vs.rebuild_status(index_id)
+    if status is None:
+        return jsonify({'error': '没有重建任务'}), 404
+    return jsonify(status)
+
 @app.route('/api/indexes/<index_id>/files', methods=['POST'])
 def add_files_to_index(index_id):
     """向索引中添加文件"""
@@ -163,6 +283,9 @@ def add_files_to_index(index_id):
             if not os.path.isfile(path):
                 return jsonify({'error': f'路径不是文件: {path}'}), 400
         
+        # 队列已满时拒绝请求
+        job_queue.check_capacity(len(file_paths))
+
         # 添加文件到数据库
         new_files = []
         for path in file_paths:
@@ -180,12 +303,19 @@ def add_files_to_index(index_id):
                 'status': file_obj.status
             })
         
-        # 如果有新文件添加，启动后台处理线程
+        # 如果有新文件添加，加入后台处理队列
         if new_files:
-            thread = threading.Thread(target=process_videos, args=(index_id, index_obj.name, file_paths))
-            thread.start()
+            try:
+                job_queue.submit(index_id, [f['path'] for f in new_files])
+            except QueueFullError:
+                # 队列已满时撤销本次添加的文件
+                for f in new_files:
+                    db.remove_file_from_index(index_id, f['path'])
+                raise
         
         return jsonify({'message': '文件添加成功', 'newFiles': new_files}), 200
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429
     except Exception as e:
         return jsonify({'error': f'添加文件失败: {str(e)}'}), 500
 
@@ -205,6 +335,52 @@ def remove_file_from_index(index_id, file_path):
     except Exception as e:
         return jsonify({'error': f'删除文件失败: {str(e)}'}), 500
 
+@app.route('/api/indexes/<index_id>/watches', methods=['GET'])
+def get_watches(index_id):
+    """获取索引的监视目录"""
+    try:
+        watches = db.get_watches(index_id)
+        return jsonify([
+            {'path': w.path, 'recursive': w.recursive, 'createDate': w.create_date} for w in watches
+        ])
+    except Exception as e:
+        return jsonify({'error': f'获取监视目录失败: {str(e)}'}), 500
+
+@app.route('/api/indexes/<index_id>/watches', methods=['POST'])
+def add_watch(index_id):
+    """监视目录，目录中新增、修改和删除的媒体文件自动同步到索引"""
+    try:
+        # 检查索引是否存在
+        index_obj = db.get_index_by_id(index_id)
+        if not index_obj:
+            return jsonify({'error': '索引不存在'}), 404
+
+        data = request.get_json(silent=True) or {}
+        path = data.get('path')
+        if not path:
+            return jsonify({'error': '目录不能为空'}), 400
+        if not os.path.isdir(path):
+            return jsonify({'error': f'目录不存在: {path}'}), 400
+
+        watch = folder_watcher.watch(index_id, path, recursive=bool(data.get('recursive', True)))
+        return jsonify({'path': watch.path, 'recursive': watch.recursive, 'createDate': watch.create_date}), 201
+    except Exception as e:
+        return jsonify({'error': f'添加监视目录失败: {str(e)}'}), 500
+
+@app.route('/api/indexes/<index_id>/watches', methods=['DELETE'])
+def remove_watch(index_id):
+    """停止监视目录，已入库的文件保留在索引中"""
+    try:
+        data = request.get_json(silent=True) or {}
+        path = data.get('path')
+        if not path:
+            return jsonify({'error': '目录不能为空'}), 400
+        if not folder_watcher.unwatch(index_id, path):
+            return jsonify({'error': '监视目录不存在'}), 404
+        return jsonify({'message': '已停止监视目录'})
+    except Exception as e:
+        return jsonify({'error': f'删除监视目录失败: {str(e)}'}), 500
+
 @app.route('/api/indexes/<index_id>/search', methods=['POST'])
 def search_in_index(index_id):
     """在指定索引中搜索"""
@@ -225,9 +401,12 @@ def search_in_index(index_id):
         n_results = data.get('nResults', 10)
         video_paths = data.get('videoPaths', None)
         keyword = data.get('keyword', None)
-        print(f"index: {index_id}, query: {query}, n_results: {n_results}, video_paths: {video_paths}, keyword: {keyword}")
+        mode = data.get('mode', 'vector')
+        if mode not in SEARCH_MODES:
+            return jsonify({'error': f'无效的搜索模式: {mode}'}), 400
+        print(f"index: {index_id}, query: {query}, n_results: {n_results}, video_paths: {video_paths}, keyword: {keyword}, mode: {mode}")
 
-        documents, metadatas = vs.search_content(index_id, n_results=n_results, query=query, video_paths=video_paths, keyword=keyword)
+        documents, metadatas = vs.search_content(index_id, n_results=n_results, query=query, video_paths=video_paths, keyword=keyword, mode=mode)
         
         # 格式化搜索结果
         results = []
@@ -243,6 +422,54 @@ def search_in_index(index_id):
     except Exception as e:
         return jsonify({'error': f'搜索失败: {str(e)}'}), 500
 
+@app.route('/api/search', methods=['POST'])
+def search_in_indexes():
+    """在多个索引中同时搜索"""
+    try:
+        if not request.is_json:
+            return jsonify({'error': '请求必须为JSON格式'}), 400
+
+        data = request.get_json()
+        if not data or not isinstance(data, dict):
+            return jsonify({'error': '无效的JSON数据'}), 400
+
+        # 未指定索引时搜索全部索引
+        index_ids = data.get('indexIds')
+        if index_ids is None:
+            index_ids = [index.id for index in db.get_all_indexes()]
+        for index_id in index_ids:
+            if db.get_index_by_id(index_id) is None:
+                return jsonify({'error': f'索引不存在: {index_id}'}), 404
+
+        query = data.get('query')
+        n_results = data.get('nResults', 10)
+        video_paths = data.get('videoPaths', None)
+        keyword = data.get('keyword', None)
+        print(f"indexes: {index_ids}, query: {query}, n_results: {n_results}, video_paths: {video_paths}, keyword: {keyword}")
+
+        start = time.perf_counter()
+        hits, timings = vs.search_indexes(index_ids, n_results=n_results, query=query, video_paths=video_paths, keyword=keyword)
+
+        # 格式化搜索结果
+        results = []
+        for index_id, doc, meta, score in hits:
+            doc = doc.replace("search_document: ", "")
+            results.append({
+                'indexId': index_id,
+                'videoPath': meta.get('src_file', ''),
+                'startTime': format_time(meta.get('start', 0)),
+                'text': doc,
+                'score': score
+            })
+
+        return jsonify({
+            'results': results,
+            'timings': timings,
+            'totalTimeMs': round((time.perf_counter() - start) * 1000, 2)
+        })
+    except Exception as e:
+        return jsonify({'error': f'搜索失败: {str(e)}'}), 500
+
 @app.route('/api/indexes/<index_id>/video/details', methods=['POST'])
 def get_video_details(index_id):
     """获取视频所有索引文本详情"""
@@ -296,17 +523,63 @@ def get_video_details(index_id):
     except Exception as e:
         return jsonify({'error': f'获取视频详情失败: {str(e)}'}), 500
 
-def process_videos(index_id, index_name, video_files):
-    """后台处理视频文件"""
+@app.route('/api/indexes/<index_id>/video/transcript', methods=['POST'])
+def get_video_transcript(index_id):
+    """获取视频保存的转录结果，可以按时间范围读取"""
     try:
-        # 添加视频到索引
-        vs.add_videos(video_files, index_id)
+        data = request.get_json(silent=True) or {}
+        file_path = data.get('filePath')
+        if not file_path:
+            return jsonify({'error': '文件路径不能为空'}), 400
+
+        # 检查文件是否属于该索引
+        if db.get_index_id_by_file_path(file_path) != index_id:
+            return jsonify({'error': '文件不在该索引中'}), 404
+
+        transcript = vs.transcript_store.get(file_path)
+        if transcript is None:
+            return jsonify({'error': '没有保存的转录结果'}), 404
 
+        start, end = data.get('start'), data.get('end')
+        chunks = transcript.between(start, end)
+        result = {
+            'chunks': [{'text': text, 'start': s, 'end': e} for text, s, e in chunks],
+            'info': transcript.info,
+        }
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': f'获取转录结果失败: {str(e)}'}), 500
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """获取运行指标"""
+    try:
+        return jsonify({
+            'transcriptCache': vs.transcript_cache.stats(),
+            'transcriptStore': vs.transcript_store.stats(),
+            'asrModel': asr_manager.stats(),
+            'embedding': embedding_stats(),
+            'queryEmbeddingCache': query_embedder.stats(),
+            'searchCache': vs.search_cache.stats()
+        })
     except Exception as e:
-        print(f"处理索引{index_name} 视频时出错: {str(e)}")
-    # 更新索引状态
-    db.update_index_status(index_id, IndexStatus.COMPLETED)
+        return jsonify({'error': f'获取运行指标失败: {str(e)}'}), 500
 
+def parse_hnsw_params(params):
+    """解析HNSW参数，返回 (参数, 错误信息)"""
+    if params is None:
+        return None, None
+    if not isinstance(params, dict):
+        return None, 'HNSW参数必须为对象'
+    names = {'M': 'M', 'constructionEf': 'construction_ef', 'searchEf': 'search_ef'}
+    hnsw = {}
+    for key, value in params.items():
+        if key not in names:
+            return None, f'未知的HNSW参数: {key}'
+        if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+            return None, f'无效的HNSW参数: {key}={value}'
+        hnsw[names[key]] = value
+    return hnsw, None
 
 def format_time(seconds):
     """将秒数格式化为时间字符串"""
@@ -316,4 +589,4 @@ def format_time(seconds):
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5001)
+    app.run(debug=DEBUG, port=5001)
@@ -0,0 +1,164 @@
+"""
+Search benchmark against an existing index.
+
+Compares the index's vector store (Chroma HNSW or mmap) with the exact NumPy engine:
+per-query latency and recall@k, using the exact results as ground truth. With
+--quantization the vectors are also loaded into temporary mmap stores with each
+quantization mode to report first-pass memory, latency and recall after rescoring.
+
+    python bench.py <index_id> [--queries 200] [--k 10] [--dtype float16]
+    python bench.py <index_id> --query-file queries.txt
+    python bench.py <index_id> --quantization [--rescore 200] [--report report.md]
+"""
+import argparse
+import tempfile
+import time
+
+import chromadb
+import numpy as np
+
+from database import db
+from exact_search import ExactSearchIndex
+from vector_store import MmapVectorStore, QUANTIZATIONS, open_vector_store
+
+
+def load_store(index_id, chroma_path="chroma.db"):
+    settings = db.get_index_settings(index_id)
+    client = chromadb.PersistentClient(path=chroma_path) if settings.get("backend", "chroma") == "chroma" else None
+    store = open_vector_store(index_id, settings, client)
+    data = store.get(include_embeddings=True)
+    return store, settings, data["ids"], np.asarray(data["embeddings"], dtype=np.float32)
+
+
+def make_queries(embeddings, count, noise=0.05, seed=0):
+    """
+    Synthetic queries: stored vectors with a little gaussian noise, so they are close to
+    but not identical to an indexed segment.
+    """
+    rng = np.random.default_rng(seed)
+    picks = embeddings[rng.integers(0, len(embeddings), size=count)]
+    scale = noise * np.linalg.norm(picks, axis=1, keepdims=True) / np.sqrt(embeddings.shape[1])
+    return (picks + rng.normal(size=picks.shape).astype(np.float32) * scale).astype(np.float32)
+
+
+def load_text_queries(path, embedding_dim=None):
+    from retrieve import embed, truncate_embeddings
+
+    with open(path, "r", encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+    embeddings = truncate_embeddings(embed(["search_query: " + t for t in texts]), embedding_dim)
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def recall_at_k(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / max(len(t), 1) for f, t in zip(found, truth)]))
+
+
+def latency_summary(latencies):
+    ms = np.asarray(latencies) * 1000
+    return f"p50 {np.percentile(ms, 50):7.2f} ms  p95 {np.percentile(ms, 95):7.2f} ms  mean {ms.mean():7.2f} ms"
+
+
+def timed(func, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(func(query))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def quantization_report(ids, embeddings, queries, exact, space, k, rescore):
+    """
+    Load the vectors into temporary mmap stores with every quantization mode and
+    measure each against the exact results. Returns a list of report rows.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization in QUANTIZATIONS:
+            store = MmapVectorStore(f"{directory}/{quantization}", space=space, quantization=quantization, rescore=rescore)
+            store.add(ids, embeddings, [""] * len(ids), [{} for _ in ids])
+            # 预热：加载量化数据和内存映射
+            store.query(queries[0], k)
+            found, latencies = timed(lambda q: store.query(q, k)[0], queries)
+            if quantization == "none":
+                memory = embeddings.astype(np.float32).nbytes
+            else:
+                codes = store._shard_codes(store._shards[0])
+                memory = sum(array.nbytes for array in codes) if isinstance(codes, tuple) else codes.nbytes
+            rows.append({
+                "quantization": quantization,
+                "memory": memory,
+                "latencies": latencies,
+                "recall": recall_at_k(found, exact),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vector search on an existing index")
+    parser.add_argument("index_id")
+    parser.add_argument("--queries", type=int, default=200, help="number of synthetic queries")
+    parser.add_argument("--query-file", help="text file with one query per line (embedded with the configured backend)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--chroma-path", default="chroma.db")
+    parser.add_argument("--quantization", action="store_true", help="also report int8 / binary quantized search")
+    parser.add_argument("--rescore", type=int, default=200, help="candidates rescored with full-precision vectors")
+    parser.add_argument("--report", help="write the results as a markdown report to this file")
+    args = parser.parse_args()
+
+    store, settings, ids, embeddings = load_store(args.index_id, args.chroma_path)
+    space = store.space
+    backend = settings.get("backend", "chroma")
+    lines = [
+        f"index {args.index_id}: {len(ids)} vectors, dim {embeddings.shape[1]}, space {space}, backend {backend}",
+    ]
+    print(lines[0])
+
+    if args.query_file:
+        queries = load_text_queries(args.query_file, settings.get("embedding_dim"))
+    else:
+        queries = make_queries(embeddings, args.queries)
+    k = min(args.k, len(ids))
+
+    start = time.perf_counter()
+    index = ExactSearchIndex(embeddings, ids=ids, metric=space, dtype=args.dtype)
+    build_time = time.perf_counter() - start
+    print(f"exact index built in {build_time * 1000:.1f} ms, {index.matrix.nbytes / 1024 / 1024:.1f} MB ({args.dtype})")
+
+    exact, exact_latencies = timed(lambda q: index.search(q, top_k=k)[0], queries)
+    start = time.perf_counter()
+    index.search(queries, top_k=k)
+    batch_time = time.perf_counter() - start
+
+    indexed, indexed_latencies = timed(lambda q: store.query(q, k)[0], queries)
+
+    lines += [
+        f"queries: {len(queries)}, k = {k}",
+        f"  {backend:<13} {latency_summary(indexed_latencies)}  recall@{k} {recall_at_k(indexed, exact):.4f}",
+        f"  exact numpy   {latency_summary(exact_latencies)}  recall@{k} 1.0000",
+        f"  exact batched {batch_time * 1000 / len(queries):7.2f} ms per query",
+    ]
+    for line in lines[1:]:
+        print(line)
+
+    if args.quantization:
+        print(f"quantized mmap stores (rescore {args.rescore}):")
+        lines.append(f"quantized mmap stores (rescore {args.rescore}):")
+        for row in quantization_report(ids, embeddings, queries, exact, space, k, args.rescore):
+            line = (
+                f"  {row['quantization']:<7} {row['memory'] / 1024 / 1024:8.2f} MB  "
+                f"{latency_summary(row['latencies'])}  recall@{k} {row['recall']:.4f}"
+            )
+            print(line)
+            lines.append(line)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write("# Vector search benchmark\n\n```\n" + "\n".join(lines) + "\n```\n")
+        print(f"report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
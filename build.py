@@ -32,6 +32,18 @@ def build_backend():
         "--add-data", "utils.py:.",
         "--add-data", "video_edit.py:.",
         "--add-data", "vstore.py:.",
+        "--add-data", "config.py:.",
+        "--add-data", "job_queue.py:.",
+        "--add-data", "ingest_pipeline.py:.",
+        "--add-data", "vad.py:.",
+        "--add-data", "transcript_cache.py:.",
+        "--add-data", "transcript_store.py:.",
+        "--add-data", "model_manager.py:.",
+        "--add-data", "query_embedder.py:.",
+        "--add-data", "search_cache.py:.",
+        "--add-data", "exact_search.py:.",
+        "--add-data", "vector_store.py:.",
+        "--add-data", "watcher.py:.",
         "--add-data", "./.venv/Lib/site-packages/llama_cpp/lib:./llama_cpp/lib",
         "--collect-data", "chromadb",
         "--hidden-import", "flask",
@@ -0,0 +1,124 @@
+import os
+
+try:
+    # load environment variables from .env file (requires `python-dotenv`)
+    from dotenv import load_dotenv
+
+    load_dotenv()
+except ImportError:
+    print("load env error")
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+# 处理流水线各阶段的并发数：音频解码、语音识别、向量化
+DECODE_WORKERS = _env_int("DECODE_WORKERS", 2)
+ASR_WORKERS = _env_int("ASR_WORKERS", 1)
+EMBED_WORKERS = _env_int("EMBED_WORKERS", 2)
+# 流水线阶段之间的队列长度
+PIPELINE_QUEUE_SIZE = _env_int("PIPELINE_QUEUE_SIZE", 2)
+# 队列中允许的最大待处理任务数，超过后拒绝新的请求
+INGEST_MAX_PENDING = _env_int("INGEST_MAX_PENDING", 200)
+# 单个任务的最大尝试次数
+INGEST_MAX_ATTEMPTS = _env_int("INGEST_MAX_ATTEMPTS", 3)
+
+# 长音频识别方式：chunked（分窗口批量识别）或 sequential（整段顺序识别）
+ASR_LONG_FORM = os.environ.get("ASR_LONG_FORM", "chunked")
+# 识别窗口长度和相邻窗口的重叠长度（秒）
+ASR_CHUNK_LENGTH_S = _env_float("ASR_CHUNK_LENGTH_S", 30.0)
+ASR_STRIDE_LENGTH_S = _env_float("ASR_STRIDE_LENGTH_S", 5.0)
+# 每次送入模型的窗口数
+ASR_BATCH_SIZE = _env_int("ASR_BATCH_SIZE", 4)
+# 开启后不在解码阶段读入整段音频，而是在识别时从ffmpeg按窗口流式读取。
+# 默认关闭：解码阶段把整段音频读入内存，内存占用随视频长度和排队的任务数增长
+ASR_STREAM_DECODE = _env_bool("ASR_STREAM_DECODE", False)
+# 识别前的语音活动检测：off（关闭）、energy（基于能量）或 silero（需要安装 silero-vad）
+VAD_BACKEND = os.environ.get("VAD_BACKEND", "off")
+# 识别结果缓存目录（与 chroma.db 位于同一目录）和缓存大小上限
+TRANSCRIPT_CACHE_DIR = os.environ.get("TRANSCRIPT_CACHE_DIR", "transcript_cache")
+TRANSCRIPT_CACHE_MAX_MB = _env_int("TRANSCRIPT_CACHE_MAX_MB", 1024)
+# 每个文件的转录结果（列式存储，内存映射读取），重新分段和重新计算向量时不需要再识别
+TRANSCRIPT_STORE_DIR = os.environ.get("TRANSCRIPT_STORE_DIR", "transcripts")
+# ASR模型空闲多少秒后释放（0 表示不释放），可用内存低于该值（MB）时也会释放空闲模型
+ASR_IDLE_TIMEOUT_S = _env_int("ASR_IDLE_TIMEOUT_S", 600)
+ASR_MIN_AVAILABLE_MB = _env_int("ASR_MIN_AVAILABLE_MB", 0)
+# 服务启动时预先加载ASR模型
+ASR_PRELOAD = _env_bool("ASR_PRELOAD", False)
+# 向量化后端：http（llama-server）或 llama_cpp（在进程内加载GGUF模型）
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "http")
+# 向量模型名称，用于区分不同模型的缓存
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "nomic-embed-text-v2-moe")
+# 每次请求/每批计算的最大文本数
+EMBEDDING_BATCH_SIZE = _env_int("EMBEDDING_BATCH_SIZE", 32)
+# HTTP后端：多个 llama-server 地址用逗号分隔，请求在这些服务之间分发
+EMBEDDING_URL = os.environ.get("EMBEDDING_URL", "http://localhost:8080/v1/embeddings")
+EMBEDDING_URLS = [u.strip() for u in os.environ.get("EMBEDDING_URLS", EMBEDDING_URL).split(",") if u.strip()]
+# HTTP后端：路由策略（round_robin 或 least_loaded）、并行批次数、超时（秒）、重试次数
+EMBEDDING_ROUTING = os.environ.get("EMBEDDING_ROUTING", "round_robin")
+EMBEDDING_HTTP_PARALLEL = _env_int("EMBEDDING_HTTP_PARALLEL", 4)
+EMBEDDING_TIMEOUT_S = _env_float("EMBEDDING_TIMEOUT_S", 60.0)
+EMBEDDING_RETRIES = _env_int("EMBEDDING_RETRIES", 3)
+# 进程内后端：模型路径、模型实例数、上下文长度、每个实例的线程数（0 为自动）、GPU层数
+EMBEDDING_MODEL_PATH = os.environ.get("EMBEDDING_MODEL_PATH", os.path.join("models", "nomic-embed-text-v2-moe.f16.gguf"))
+EMBEDDING_INSTANCES = _env_int("EMBEDDING_INSTANCES", 1)
+EMBEDDING_N_CTX = _env_int("EMBEDDING_N_CTX", 2048)
+EMBEDDING_THREADS = _env_int("EMBEDDING_THREADS", 0)
+EMBEDDING_GPU_LAYERS = _env_int("EMBEDDING_GPU_LAYERS", 0)
+# 查询向量缓存：最大条目数、合并并发查询的等待时间（毫秒）、持久化文件（为空则只缓存在内存中）
+QUERY_CACHE_SIZE = _env_int("QUERY_CACHE_SIZE", 10000)
+QUERY_BATCH_WINDOW_MS = _env_float("QUERY_BATCH_WINDOW_MS", 5.0)
+QUERY_CACHE_PATH = os.environ.get("QUERY_CACHE_PATH", "")
+# 搜索结果缓存的最大条目数，0表示不缓存
+SEARCH_CACHE_SIZE = _env_int("SEARCH_CACHE_SIZE", 1000)
+# 关键词和查询同时使用时，全文索引命中的文本段不超过该数量则在本地按向量距离排序，否则交给向量库过滤
+FTS_MAX_CANDIDATES = _env_int("FTS_MAX_CANDIDATES", 2000)
+# 混合检索：每一路取前多少个结果参与融合、RRF常数、并行检索的线程数
+HYBRID_CANDIDATES = _env_int("HYBRID_CANDIDATES", 50)
+RRF_K = _env_int("RRF_K", 60)
+SEARCH_WORKERS = _env_int("SEARCH_WORKERS", 8)
+# 新建索引默认使用的向量库：chroma 或 mmap（内存映射文件，按需读入内存）
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "chroma")
+# mmap 向量库的目录；IVF列表数（0表示不使用IVF，精确搜索）、查询时搜索的列表数、k-means迭代次数
+MMAP_STORE_DIR = os.environ.get("MMAP_STORE_DIR", "vector_store")
+MMAP_IVF_LISTS = _env_int("MMAP_IVF_LISTS", 0)
+MMAP_IVF_NPROBE = _env_int("MMAP_IVF_NPROBE", 8)
+MMAP_IVF_ITERATIONS = _env_int("MMAP_IVF_ITERATIONS", 10)
+# mmap 向量库的量化方式：none、int8 或 binary；量化检索后用全精度向量重新计算分数的候选数
+MMAP_QUANTIZATION = os.environ.get("MMAP_QUANTIZATION", "none")
+MMAP_RESCORE_CANDIDATES = _env_int("MMAP_RESCORE_CANDIDATES", 200)
+# 新建索引默认的向量维度（nomic-embed-text-v2 支持 Matryoshka 截断，如 512、256），0 表示完整维度
+EMBEDDING_DIM = _env_int("EMBEDDING_DIM", 0)
+# 新建索引默认的距离：cosine、ip 或 l2（nomic 向量按余弦/内积相似度训练）
+DEFAULT_DISTANCE = os.environ.get("DEFAULT_DISTANCE", "cosine")
+# 索引重建完成后，等待多少秒再删除旧集合（让正在进行的查询结束）
+REBUILD_DROP_DELAY_S = _env_float("REBUILD_DROP_DELAY_S", 30.0)
+# 目录监视：auto（安装了watchdog时使用文件系统事件，否则轮询）、watchdog 或 poll
+WATCH_BACKEND = os.environ.get("WATCH_BACKEND", "auto")
+# 轮询方式下扫描监视目录的间隔；文件最后修改后等待多少秒再入库（避免处理复制中的文件）
+WATCH_POLL_INTERVAL_S = _env_float("WATCH_POLL_INTERVAL_S", 30.0)
+WATCH_SETTLE_S = _env_float("WATCH_SETTLE_S", 2.0)
+# 监视目录中需要入库的媒体文件扩展名
+WATCH_EXTENSIONS = tuple(
+    e.strip().lower() for e in os.environ.get(
+        "WATCH_EXTENSIONS", ".mp4,.mkv,.mov,.avi,.webm,.flv,.m4v,.mp3,.wav,.m4a,.flac"
+    ).split(",") if e.strip()
+)
+# 文本段窗口：目标时长（秒）、最大字符数、相邻窗口重叠的时长（按完整句子重叠，0 表示不重叠）
+SEGMENT_TARGET_S = _env_float("SEGMENT_TARGET_S", 10.0)
+SEGMENT_MAX_CHARS = _env_int("SEGMENT_MAX_CHARS", 300)
+SEGMENT_OVERLAP_S = _env_float("SEGMENT_OVERLAP_S", 0.0)
@@ -1,8 +1,9 @@
+import json
 import sqlite3
 import uuid
 from datetime import datetime
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 # 数据类定义
 @dataclass
@@ -11,6 +12,8 @@ class File:
     index_id: str
     path: str
     status: str
+    progress: float = 0.0
+    duration: Optional[float] = None
 
 @dataclass
 class Index:
@@ -20,15 +23,70 @@ class Index:
     status: str
     files: List[File] = field(default_factory=list)
 
+@dataclass
+class Job:
+    id: int
+    index_id: str
+    path: str
+    status: str
+    attempts: int
+    error: Optional[str] = None
+
+@dataclass
+class Watch:
+    id: int
+    index_id: str
+    path: str
+    recursive: bool
+    create_date: str
+
 class IndexStatus:
     WAITING = "waiting"
     PROCESSING = "processing"
     COMPLETED = "completed"
     ERROR = "error"
 
+class JobStatus:
+    WAITING = "waiting"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+# 全文索引的分词：相邻两个字符组成一个词，以十六进制编码后交给FTS5，
+# 这样中文等没有空格的文本也能按子串匹配，且不受分词器规则影响
+def _bigram_tokens(text: str) -> str:
+    return " ".join(f"{ord(a):x}g{ord(b):x}" for a, b in zip(text, text[1:]))
+
+# 单个字符单独存一列，用于匹配只有一个字的关键词
+def _unigram_tokens(text: str) -> str:
+    return " ".join(sorted({f"{ord(ch):x}" for ch in text}))
+
+# 把关键词转换为FTS5查询，每个关键词是一个短语，所有关键词都必须出现
+def _keyword_match_expression(keywords: List[str]) -> str:
+    phrases = []
+    for keyword in keywords:
+        if len(keyword) == 1:
+            phrases.append(f'unigrams : "{_unigram_tokens(keyword)}"')
+        else:
+            phrases.append(f'bigrams : "{_bigram_tokens(keyword)}"')
+    return " AND ".join(phrases)
+
+# 把自由文本查询转换为FTS5查询，任意一个词出现即可，由BM25决定排序
+def _query_match_expression(query: str) -> Optional[str]:
+    terms = []
+    for piece in query.split():
+        if len(piece) == 1:
+            terms.append(f'unigrams : "{_unigram_tokens(piece)}"')
+        else:
+            terms.extend(f'bigrams : "{token}"' for token in dict.fromkeys(_bigram_tokens(piece).split()))
+    if not terms:
+        return None
+    return " OR ".join(terms)
+
 class Database:
     def __init__(self, db_file: str = 'indexes.db'):
         self.db_file = db_file
+        self.fts_enabled = True
         self.init_db()
     
     # 初始化数据库
@@ -56,12 +114,88 @@ class Database:
                 FOREIGN KEY (index_id) REFERENCES indexes (id)
             )
         ''')
+
+        # 创建任务表
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                index_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                create_date TEXT NOT NULL,
+                update_date TEXT NOT NULL,
+                FOREIGN KEY (index_id) REFERENCES indexes (id)
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+
+        # 创建监视目录表，目录下新增、修改和删除的媒体文件会自动同步到索引
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS watches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                index_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                recursive INTEGER NOT NULL DEFAULT 1,
+                create_date TEXT NOT NULL,
+                UNIQUE (index_id, path),
+                FOREIGN KEY (index_id) REFERENCES indexes (id)
+            )
+        ''')
+
+        # 创建文本段表，保存向量库中每个文本段的副本，用于全文检索
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                index_id TEXT NOT NULL,
+                segment_id TEXT NOT NULL,
+                src_file TEXT NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                UNIQUE (index_id, segment_id)
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_segments_file ON segments (index_id, src_file)')
+        try:
+            c.execute('CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(bigrams, unigrams)')
+        except sqlite3.OperationalError as e:
+            # SQLite未编译FTS5时，关键词搜索仍由向量库完成
+            print(f"全文索引不可用: {str(e)}")
+            self.fts_enabled = False
+
+        # 索引内容每次变化时递增，用于使搜索结果缓存失效；
+        # 旧版本创建的索引没有全文索引数据，在第一次关键词搜索时补建；
+        # settings 保存索引的向量库后端等配置（JSON）
+        self._add_missing_columns(c, 'indexes', {
+            'generation': 'INTEGER NOT NULL DEFAULT 0',
+            'fts_synced': 'INTEGER NOT NULL DEFAULT 0',
+            'settings': "TEXT NOT NULL DEFAULT '{}'",
+        })
+
+        # 旧版本数据库的文件表没有识别进度字段；
+        # size/mtime/hash 记录文件入库时的状态，用于判断监视目录中的文件是否被修改
+        self._add_missing_columns(c, 'files', {
+            'progress': 'REAL NOT NULL DEFAULT 0',
+            'duration': 'REAL',
+            'size': 'INTEGER',
+            'mtime': 'REAL',
+            'hash': 'TEXT',
+        })
         
         conn.commit()
         conn.close()
     
+    # 为已有的表补充新增的字段
+    def _add_missing_columns(self, cursor, table: str, columns: dict):
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row[1] for row in cursor.fetchall()}
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+    
     # 创建索引
-    def create_index(self, name: str, video_files: List[str]) -> Index:
+    def create_index(self, name: str, video_files: List[str], settings: Optional[dict] = None) -> Index:
         conn = sqlite3.connect(self.db_file)
         c = conn.cursor()
         
@@ -73,9 +207,9 @@ class Database:
         
         # 插入索引记录
         c.execute('''
-            INSERT INTO indexes (id, name, create_date, status)
-            VALUES (?, ?, ?, ?)
-        ''', (index_id, name, create_date, IndexStatus.PROCESSING))
+            INSERT INTO indexes (id, name, create_date, status, fts_synced, settings)
+            VALUES (?, ?, ?, ?, 1, ?)
+        ''', (index_id, name, create_date, IndexStatus.PROCESSING, json.dumps(settings or {})))
         
         # 插入文件记录
         files = []
@@ -103,7 +237,7 @@ class Database:
         c = conn.cursor()
         
         # 获取所有索引
-        c.execute('SELECT * FROM indexes')
+        c.execute('SELECT id, name, create_date, status FROM indexes')
         index_rows = c.fetchall()
         
         indexes = []
@@ -111,10 +245,10 @@ class Database:
             index_id, name, create_date, status = row
             
             # 获取该索引的文件
-            c.execute('SELECT id, index_id, path, status FROM files WHERE index_id = ?', (index_id,))
+            c.execute('SELECT id, index_id, path, status, progress, duration FROM files WHERE index_id = ?', (index_id,))
             file_rows = c.fetchall()
             
-            files = [File(id, idx_id, path, status) for id, idx_id, path, status in file_rows]
+            files = [File(*row) for row in file_rows]
             
             indexes.append(Index(index_id, name, create_date, status, files))
         
@@ -127,7 +261,7 @@ class Database:
         c = conn.cursor()
         
         # 获取索引信息
-        c.execute('SELECT * FROM indexes WHERE id = ?', (index_id,))
+        c.execute('SELECT id, name, create_date, status FROM indexes WHERE id = ?', (index_id,))
         row = c.fetchone()
         
         if not row:
@@ -137,10 +271,10 @@ class Database:
         index_id, name, create_date, status = row
         
         # 获取该索引的文件
-        c.execute('SELECT id, index_id, path, status FROM files WHERE index_id = ?', (index_id,))
+        c.execute('SELECT id, index_id, path, status, progress, duration FROM files WHERE index_id = ?', (index_id,))
         file_rows = c.fetchall()
         
-        files = [File(id, idx_id, path, status) for id, idx_id, path, status in file_rows]
+        files = [File(*row) for row in file_rows]
         
         conn.close()
         
@@ -156,11 +290,11 @@ class Database:
             UPDATE indexes SET status = ? WHERE id = ?
         ''', (status, index_id))
         
-        # 如果索引完成，也更新所有文件的状态
+        # 如果索引完成，也更新所有文件的状态（保留处理失败的文件状态）
         if status == IndexStatus.COMPLETED:
             c.execute('''
-                UPDATE files SET status = ? WHERE index_id = ?
-            ''', (IndexStatus.COMPLETED, index_id))
+                UPDATE files SET status = ? WHERE index_id = ? AND status != ?
+            ''', (IndexStatus.COMPLETED, index_id, IndexStatus.ERROR))
         
         conn.commit()
         rows_affected = c.rowcount
@@ -184,6 +318,71 @@ class Database:
         
         return rows_affected > 0
     
+    # 更新文件识别进度
+    def update_file_progress(self, index_id: str, file_path: str, progress: float, duration: Optional[float]) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+        
+        c.execute('''
+            UPDATE files SET progress = ?, duration = COALESCE(?, duration) WHERE index_id = ? AND path = ?
+        ''', (progress, duration, index_id, file_path))
+        
+        conn.commit()
+        rows_affected = c.rowcount
+        conn.close()
+        
+        return rows_affected > 0
+    
+    # 获取索引内容的版本号，索引不存在时返回None
+    def get_index_generation(self, index_id: str) -> Optional[int]:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('SELECT generation FROM indexes WHERE id = ?', (index_id,))
+        row = c.fetchone()
+
+        conn.close()
+        return row[0] if row else None
+
+    # 获取索引配置，索引不存在时返回空字典
+    def get_index_settings(self, index_id: str) -> dict:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('SELECT settings FROM indexes WHERE id = ?', (index_id,))
+        row = c.fetchone()
+
+        conn.close()
+        return json.loads(row[0]) if row else {}
+
+    # 更新索引配置
+    def update_index_settings(self, index_id: str, settings: dict) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('UPDATE indexes SET settings = ? WHERE id = ?', (json.dumps(settings), index_id))
+
+        conn.commit()
+        rows_affected = c.rowcount
+        conn.close()
+
+        return rows_affected > 0
+
+    # 索引内容变化后递增版本号
+    def bump_index_generation(self, index_id: str) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('''
+            UPDATE indexes SET generation = generation + 1 WHERE id = ?
+        ''', (index_id,))
+
+        conn.commit()
+        rows_affected = c.rowcount
+        conn.close()
+
+        return rows_affected > 0
+
     # 更新索引信息
     def update_index(self, index: Index) -> bool:
         conn = sqlite3.connect(self.db_file)
@@ -204,8 +403,11 @@ class Database:
         conn = sqlite3.connect(self.db_file)
         c = conn.cursor()
         
-        # 先删除相关文件记录
+        # 先删除相关文件记录和任务
         c.execute('DELETE FROM files WHERE index_id = ?', (index_id,))
+        c.execute('DELETE FROM jobs WHERE index_id = ?', (index_id,))
+        c.execute('DELETE FROM watches WHERE index_id = ?', (index_id,))
+        self._delete_segments(c, index_id)
         
         # 再删除索引记录
         c.execute('DELETE FROM indexes WHERE id = ?', (index_id,))
@@ -247,6 +449,11 @@ class Database:
         conn = sqlite3.connect(self.db_file)
         c = conn.cursor()
         
+        # 删除未执行的任务
+        c.execute('''
+            DELETE FROM jobs WHERE index_id = ? AND path = ? AND status = ?
+        ''', (index_id, file_path, JobStatus.WAITING))
+
         # 删除文件记录
         c.execute('''
             DELETE FROM files WHERE index_id = ? AND path = ?
@@ -295,5 +502,370 @@ class Database:
         conn.close()
         return files
 
+    # 获取索引中各文件记录的状态，返回 {path: (status, size, mtime, hash)}
+    def get_file_states(self, index_id: str) -> dict:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('''
+            SELECT path, status, size, mtime, hash FROM files WHERE index_id = ?
+        ''', (index_id,))
+        states = {path: (status, size, mtime, file_hash) for path, status, size, mtime, file_hash in c.fetchall()}
+
+        conn.close()
+        return states
+
+    # 记录文件的大小、修改时间和内容哈希
+    def update_file_state(self, index_id: str, file_path: str, size: int, mtime: float,
+                          file_hash: Optional[str]) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('''
+            UPDATE files SET size = ?, mtime = ?, hash = ? WHERE index_id = ? AND path = ?
+        ''', (size, mtime, file_hash, index_id, file_path))
+
+        conn.commit()
+        rows_affected = c.rowcount
+        conn.close()
+
+        return rows_affected > 0
+
+    # 添加监视目录，已存在时更新是否递归
+    def add_watch(self, index_id: str, path: str, recursive: bool = True) -> Watch:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        create_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        c.execute('''
+            INSERT INTO watches (index_id, path, recursive, create_date) VALUES (?, ?, ?, ?)
+            ON CONFLICT (index_id, path) DO UPDATE SET recursive = excluded.recursive
+        ''', (index_id, path, int(recursive), create_date))
+        c.execute('''
+            SELECT id, index_id, path, recursive, create_date FROM watches WHERE index_id = ? AND path = ?
+        ''', (index_id, path))
+        row = c.fetchone()
+
+        conn.commit()
+        conn.close()
+
+        return Watch(row[0], row[1], row[2], bool(row[3]), row[4])
+
+    # 获取监视目录，不指定索引时返回全部
+    def get_watches(self, index_id: Optional[str] = None) -> List[Watch]:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        sql = 'SELECT id, index_id, path, recursive, create_date FROM watches'
+        if index_id is None:
+            c.execute(sql)
+        else:
+            c.execute(sql + ' WHERE index_id = ?', (index_id,))
+        watches = [Watch(row[0], row[1], row[2], bool(row[3]), row[4]) for row in c.fetchall()]
+
+        conn.close()
+        return watches
+
+    # 删除监视目录，已入库的文件保留在索引中
+    def delete_watch(self, index_id: str, path: str) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('DELETE FROM watches WHERE index_id = ? AND path = ?', (index_id, path))
+
+        conn.commit()
+        rows_affected = c.rowcount
+        conn.close()
+
+        return rows_affected > 0
+
+    # 添加处理任务
+    def enqueue_jobs(self, index_id: str, file_paths: List[str], max_pending: Optional[int] = None) -> Optional[List[Job]]:
+        """设置 max_pending 时，未完成的任务加上新任务超过上限则不添加并返回 None"""
+        conn = sqlite3.connect(self.db_file, isolation_level=None)
+        c = conn.cursor()
+
+        # 使用写锁保证检查数量和添加任务是原子的，并发请求不会超过上限
+        c.execute('BEGIN IMMEDIATE')
+        if max_pending is not None:
+            c.execute('''
+                SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)
+            ''', (JobStatus.WAITING, JobStatus.RUNNING))
+            if c.fetchone()[0] + len(file_paths) > max_pending:
+                c.execute('ROLLBACK')
+                conn.close()
+                return None
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        jobs = []
+        for file_path in file_paths:
+            c.execute('''
+                INSERT INTO jobs (index_id, path, status, attempts, create_date, update_date)
+                VALUES (?, ?, ?, 0, ?, ?)
+            ''', (index_id, file_path, JobStatus.WAITING, now, now))
+            jobs.append(Job(c.lastrowid, index_id, file_path, JobStatus.WAITING, 0))
+
+        c.execute('COMMIT')
+        conn.close()
+        return jobs
+
+    # 领取一个等待中的任务
+    def claim_job(self) -> Optional[Job]:
+        conn = sqlite3.connect(self.db_file, isolation_level=None)
+        c = conn.cursor()
+
+        try:
+            # 使用写锁保证多个工作线程（或进程）不会领取同一个任务
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('''
+                SELECT id, index_id, path, attempts FROM jobs
+                WHERE status = ? ORDER BY attempts, id LIMIT 1
+            ''', (JobStatus.WAITING,))
+            row = c.fetchone()
+            if not row:
+                c.execute('COMMIT')
+                return None
+
+            job_id, index_id, path, attempts = row
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            c.execute('''
+                UPDATE jobs SET status = ?, attempts = ?, update_date = ? WHERE id = ?
+            ''', (JobStatus.RUNNING, attempts + 1, now, job_id))
+            c.execute('COMMIT')
+        finally:
+            # 出错时关闭连接会回滚未提交的事务，释放写锁
+            conn.close()
+
+        return Job(job_id, index_id, path, JobStatus.RUNNING, attempts + 1)
+
+    # 标记任务完成
+    def finish_job(self, job_id: int) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        c.execute('''
+            UPDATE jobs SET status = ?, error = NULL, update_date = ? WHERE id = ?
+        ''', (JobStatus.DONE, now, job_id))
+
+        conn.commit()
+        rows_affected = c.rowcount
+        conn.close()
+
+        return rows_affected > 0
+
+    # 标记任务失败，未超过最大尝试次数时重新放回队列
+    def fail_job(self, job: Job, error: str, max_attempts: int) -> bool:
+        """返回任务是否会被重试"""
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        retry = job.attempts < max_attempts
+        status = JobStatus.WAITING if retry else JobStatus.FAILED
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        c.execute('''
+            UPDATE jobs SET status = ?, error = ?, update_date = ? WHERE id = ?
+        ''', (status, error, now, job.id))
+
+        # 重试时文件回到等待状态，否则标记为错误
+        file_status = IndexStatus.WAITING if retry else IndexStatus.ERROR
+        c.execute('''
+            UPDATE files SET status = ? WHERE index_id = ? AND path = ?
+        ''', (file_status, job.index_id, job.path))
+
+        conn.commit()
+        conn.close()
+
+        return retry
+
+    # 恢复上次退出时未完成的任务
+    def recover_jobs(self) -> int:
+        """将运行中的任务重新放回队列，并为没有任务的未完成文件补建任务，返回恢复的任务数"""
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        c.execute('''
+            UPDATE jobs SET status = ?, update_date = ? WHERE status = ?
+        ''', (JobStatus.WAITING, now, JobStatus.RUNNING))
+        recovered = c.rowcount
+
+        c.execute('''
+            SELECT f.index_id, f.path FROM files f
+            WHERE f.status IN (?, ?) AND NOT EXISTS (
+                SELECT 1 FROM jobs j
+                WHERE j.index_id = f.index_id AND j.path = f.path AND j.status = ?
+            )
+        ''', (IndexStatus.WAITING, IndexStatus.PROCESSING, JobStatus.WAITING))
+        for index_id, path in c.fetchall():
+            c.execute('''
+                INSERT INTO jobs (index_id, path, status, attempts, create_date, update_date)
+                VALUES (?, ?, ?, 0, ?, ?)
+            ''', (index_id, path, JobStatus.WAITING, now, now))
+            recovered += 1
+
+        c.execute('''
+            UPDATE files SET status = ? WHERE status = ?
+        ''', (IndexStatus.WAITING, IndexStatus.PROCESSING))
+
+        conn.commit()
+        conn.close()
+
+        return recovered
+
+    # 统计未完成的任务数
+    def count_active_jobs(self, index_id: Optional[str] = None) -> int:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        if index_id is None:
+            c.execute('''
+                SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)
+            ''', (JobStatus.WAITING, JobStatus.RUNNING))
+        else:
+            c.execute('''
+                SELECT COUNT(*) FROM jobs WHERE index_id = ? AND status IN (?, ?)
+            ''', (index_id, JobStatus.WAITING, JobStatus.RUNNING))
+
+        count = c.fetchone()[0]
+        conn.close()
+        return count
+
+    # 保存文本段并加入全文索引，已存在的文本段跳过
+    def add_segments(self, index_id: str, ids: List[str], documents: List[str], metadatas: List[dict]) -> int:
+        if not self.fts_enabled:
+            return 0
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        added = 0
+        for segment_id, document, metadata in zip(ids, documents, metadatas):
+            c.execute('''
+                INSERT OR IGNORE INTO segments (index_id, segment_id, src_file, document, metadata)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (index_id, segment_id, metadata.get('src_file', ''), document, json.dumps(metadata, ensure_ascii=False)))
+            if c.rowcount == 0:
+                continue
+            text = document.removeprefix("search_document: ")
+            c.execute('''
+                INSERT INTO segments_fts (rowid, bigrams, unigrams) VALUES (?, ?, ?)
+            ''', (c.lastrowid, _bigram_tokens(text), _unigram_tokens(text)))
+            added += 1
+
+        conn.commit()
+        conn.close()
+        return added
+
+    # 删除索引（或索引中某个文件、某些ID）的文本段
+    def delete_segments(self, index_id: str, src_file: Optional[str] = None, ids: Optional[List[str]] = None) -> int:
+        if not self.fts_enabled:
+            return 0
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        if ids is None:
+            deleted = self._delete_segments(c, index_id, src_file)
+        else:
+            deleted = 0
+            # 分批删除，避免超过SQLite的参数数量限制
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                condition = f'index_id = ? AND segment_id IN ({", ".join("?" for _ in batch)})'
+                c.execute(f'DELETE FROM segments_fts WHERE rowid IN (SELECT id FROM segments WHERE {condition})',
+                          [index_id] + batch)
+                c.execute(f'DELETE FROM segments WHERE {condition}', [index_id] + batch)
+                deleted += c.rowcount
+
+        conn.commit()
+        conn.close()
+        return deleted
+
+    def _delete_segments(self, cursor, index_id: str, src_file: Optional[str] = None) -> int:
+        if not self.fts_enabled:
+            return 0
+        condition, params = 'index_id = ?', [index_id]
+        if src_file is not None:
+            condition, params = 'index_id = ? AND src_file = ?', [index_id, src_file]
+        cursor.execute(f'DELETE FROM segments_fts WHERE rowid IN (SELECT id FROM segments WHERE {condition})', params)
+        cursor.execute(f'DELETE FROM segments WHERE {condition}', params)
+        return cursor.rowcount
+
+    # 按关键词搜索文本段，返回 (segment_id, document, metadata) 列表，按文件和时间顺序排列
+    def search_segments(self, index_id: str, keywords: List[str], video_paths: Optional[List[str]] = None,
+                        limit: Optional[int] = None) -> List[Tuple[str, str, dict]]:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        sql = '''
+            SELECT s.segment_id, s.document, s.metadata
+            FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid
+            WHERE segments_fts MATCH ? AND s.index_id = ?
+        '''
+        params = [_keyword_match_expression(keywords), index_id]
+        if video_paths is not None:
+            sql += f' AND s.src_file IN ({", ".join("?" for _ in video_paths)})'
+            params.extend(video_paths)
+        sql += ' ORDER BY s.id'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        c.execute(sql, params)
+        rows = [(segment_id, document, json.loads(metadata)) for segment_id, document, metadata in c.fetchall()]
+
+        conn.close()
+        return rows
+
+    # 按BM25相关度搜索文本段，返回 (segment_id, document, metadata) 列表，按相关度从高到低排列
+    def rank_segments(self, index_id: str, query: str, keywords: Optional[List[str]] = None,
+                      video_paths: Optional[List[str]] = None, limit: int = 10) -> List[Tuple[str, str, dict]]:
+        match = _query_match_expression(query)
+        if match is None:
+            return []
+        if keywords:
+            match = f'({match}) AND {_keyword_match_expression(keywords)}'
+
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        sql = '''
+            SELECT s.segment_id, s.document, s.metadata
+            FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid
+            WHERE segments_fts MATCH ? AND s.index_id = ?
+        '''
+        params = [match, index_id]
+        if video_paths is not None:
+            sql += f' AND s.src_file IN ({", ".join("?" for _ in video_paths)})'
+            params.extend(video_paths)
+        sql += ' ORDER BY bm25(segments_fts) LIMIT ?'
+        params.append(limit)
+        c.execute(sql, params)
+        rows = [(segment_id, document, json.loads(metadata)) for segment_id, document, metadata in c.fetchall()]
+
+        conn.close()
+        return rows
+
+    # 索引的文本段是否已全部加入全文索引
+    def is_fts_synced(self, index_id: str) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('SELECT fts_synced FROM indexes WHERE id = ?', (index_id,))
+        row = c.fetchone()
+
+        conn.close()
+        return bool(row and row[0])
+
+    def mark_fts_synced(self, index_id: str) -> bool:
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+
+        c.execute('UPDATE indexes SET fts_synced = 1 WHERE id = ?', (index_id,))
+
+        conn.commit()
+        rows_affected = c.rowcount
+        conn.close()
+
+        return rows_affected > 0
+
 # 全局数据库实例
 db = Database()
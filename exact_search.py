@@ -0,0 +1,110 @@
+import numpy as np
+
+METRICS = ("ip", "cosine", "l2")
+
+
+def top_k_indices(scores, k, threshold=None):
+    """
+    Indices of the `k` highest scores in descending order, optionally keeping only
+    scores >= `threshold`. Uses argpartition, so only the selected k are sorted.
+    """
+    scores = np.asarray(scores)
+    candidates = np.arange(len(scores))
+    if threshold is not None:
+        candidates = np.nonzero(scores >= threshold)[0]
+    if len(candidates) > k:
+        part = np.argpartition(-scores[candidates], k - 1)[:k]
+        candidates = candidates[part]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def score_to_distance(metric, scores):
+    """
+    Convert scores back to Chroma-style distances (smaller is closer).
+    """
+    if metric == "l2":
+        return -np.asarray(scores)
+    return 1.0 - np.asarray(scores)
+
+
+class ExactSearchIndex:
+    """
+    Brute-force exact nearest-neighbour search.
+
+    Embeddings are kept in one contiguous float32 or float16 matrix and every query
+    batch is scored with a single matrix multiplication (float16 matrices are scored
+    block by block in float32). Scores are larger-is-closer: the dot product for "ip",
+    cosine similarity for "cosine" and the negated squared distance for "l2".
+    """
+
+    def __init__(self, embeddings=None, ids=None, metric="ip", dtype=np.float32, block_rows=65536):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        self.metric = metric
+        self.dtype = np.dtype(dtype)
+        self.block_rows = block_rows
+        self.matrix = None
+        self.ids = []
+        self._sq_norms = None
+        if embeddings is not None:
+            self.add(embeddings, ids)
+
+    def __len__(self):
+        return 0 if self.matrix is None else len(self.matrix)
+
+    def add(self, embeddings, ids=None):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("embeddings must be a 2-D array")
+        if ids is None:
+            ids = list(range(len(self), len(self) + len(vectors)))
+        if len(ids) != len(vectors):
+            raise ValueError("ids and embeddings have different lengths")
+        if self.metric == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        if self.matrix is None:
+            self.matrix, self._sq_norms = vectors, sq_norms
+        else:
+            self.matrix = np.concatenate([self.matrix, vectors])
+            self._sq_norms = np.concatenate([self._sq_norms, sq_norms])
+        self.ids.extend(ids)
+
+    def scores(self, queries):
+        """
+        Score queries (one vector or a batch) against every row. Returns (Q, N) float32.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.metric == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if self.matrix is None:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+
+        if self.dtype == np.float32:
+            scores = queries @ self.matrix.T
+        else:
+            # 半精度矩阵没有BLAS加速，分块转换为float32后计算
+            scores = np.empty((len(queries), len(self.matrix)), dtype=np.float32)
+            for start in range(0, len(self.matrix), self.block_rows):
+                block = self.matrix[start:start + self.block_rows].astype(np.float32)
+                scores[:, start:start + len(block)] = queries @ block.T
+
+        if self.metric == "l2":
+            # -(|x|^2 - 2x·q + |q|^2)
+            q_norms = np.einsum("ij,ij->i", queries, queries)
+            scores = 2 * scores - self._sq_norms[None, :] - q_norms[:, None]
+        return scores
+
+    def search(self, queries, top_k=10, threshold=None):
+        """
+        Return the top_k matches of each query as a list of (ids, scores) pairs.
+        A single query vector returns one pair instead of a list.
+        """
+        single = np.asarray(queries).ndim == 1
+        scores = self.scores(queries)
+        results = []
+        for row in scores:
+            indices = top_k_indices(row, top_k, threshold)
+            results.append(([self.ids[i] for i in indices], row[indices]))
+        return results[0] if single else results
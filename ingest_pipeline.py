@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+
+
+class IngestTask:
+    """
+    A single video moving through the ingest pipeline.
+    Each stage stores its intermediate results on the task.
+    """
+
+    def __init__(self, video_path, index_id, on_done=None, on_error=None):
+        self.video_path = video_path
+        self.index_id = index_id
+        self.on_done = on_done
+        self.on_error = on_error
+        self.job = None
+        self.temp_dir = None
+        # 识别结果缓存的键，由视频内容和识别参数计算
+        self.cache_key = None
+        self.audio = None
+        # 识别结果（TranscriptStore 中保存的 Transcript）
+        self.transcript = None
+        # 识别结果统计：音频时长、被VAD跳过的时长
+        self.asr_info = None
+        # 文本段数和实际计算向量的文本段数
+        self.segments = 0
+        self.embedded = 0
+        # 各阶段的处理用时（秒）
+        self.timings = {}
+        self.error = None
+        self._finished = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
+
+    def _finish(self, error=None):
+        self.error = error
+        try:
+            if error is None:
+                if self.on_done is not None:
+                    self.on_done(self)
+            elif self.on_error is not None:
+                self.on_error(self, error)
+        except Exception as e:
+            print(f"处理任务回调时出错: {str(e)}")
+        finally:
+            self._finished.set()
+
+
+class IngestPipeline:
+    """
+    Staged producer/consumer pipeline: decode -> asr -> embed.
+
+    Every stage has its own worker threads and the stages are connected by bounded
+    queues, so decoding of the next file and embedding of the previous file overlap
+    with ASR of the current one, while a slow stage blocks its producers.
+    """
+
+    def __init__(self, stages, queue_size=2, on_failure=None):
+        """
+        stages: list of (name, func, workers), func(task) is called for every task
+        on_failure: func(task, error) called when any stage raises, before the task callbacks
+        """
+        self.stages = stages
+        self.on_failure = on_failure
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for i, (name, func, workers) in enumerate(self.stages):
+                for n in range(workers):
+                    worker = threading.Thread(
+                        target=self._stage_loop, args=(i, name, func), name=f"ingest-{name}-{n}", daemon=True
+                    )
+                    worker.start()
+
+    def submit(self, task):
+        """
+        Put a task into the pipeline, blocking while the first stage queue is full.
+        """
+        self.start()
+        self._queues[0].put(task)
+        return task
+
+    def run(self, tasks):
+        """
+        Run tasks through the pipeline and wait until all of them are finished.
+        """
+        for task in tasks:
+            self.submit(task)
+        for task in tasks:
+            task.wait()
+        return tasks
+
+    def _stage_loop(self, index, name, func):
+        in_queue = self._queues[index]
+        out_queue = self._queues[index + 1] if index + 1 < len(self._queues) else None
+        while True:
+            task = in_queue.get()
+            start = time.perf_counter()
+            try:
+                func(task)
+            except Exception as e:
+                self._fail(task, e)
+                continue
+            finally:
+                task.timings[name] = time.perf_counter() - start
+                in_queue.task_done()
+
+            if out_queue is not None:
+                out_queue.put(task)
+            else:
+                task._finish()
+
+    def _fail(self, task, error):
+        try:
+            if self.on_failure is not None:
+                self.on_failure(task, error)
+        except Exception as e:
+            print(f"处理任务失败回调时出错: {str(e)}")
+        finally:
+            task._finish(error)
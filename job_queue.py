@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+
+from database import db, IndexStatus
+from ingest_pipeline import IngestTask
+
+
+class QueueFullError(Exception):
+    """待处理任务超过队列上限"""
+
+
+class JobQueue:
+    """
+    Persistent ingestion queue backed by the jobs table.
+
+    A dispatcher thread claims jobs from the database and feeds them into the
+    searcher's ingest pipeline, whose long-lived stage workers share the same
+    loaded ASR model. Jobs are only claimed while the pipeline has room.
+    """
+
+    def __init__(self, searcher, max_pending=200, max_attempts=3, poll_interval=5):
+        self.searcher = searcher
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Condition()
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._started = False
+
+    def start(self, recover=True):
+        """
+        Start the dispatcher. Jobs left unfinished by a previous run are re-queued first.
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+            if recover:
+                recovered = db.recover_jobs()
+                if recovered:
+                    print(f"恢复了 {recovered} 个未完成的任务")
+
+            dispatcher = threading.Thread(target=self._dispatch_loop, name="ingest-dispatcher", daemon=True)
+            dispatcher.start()
+
+    def check_capacity(self, count):
+        """
+        Raise QueueFullError if adding `count` jobs would exceed the queue limit.
+        Only a quick early check; `submit` enforces the limit atomically.
+        """
+        pending = db.count_active_jobs()
+        if pending + count > self.max_pending:
+            raise QueueFullError(f"处理队列已满（{pending}/{self.max_pending}），请稍后再试")
+
+    def submit(self, index_id, file_paths):
+        """
+        Persist jobs for the given files and wake up the dispatcher.
+        Raises QueueFullError (and adds nothing) if the jobs would exceed the queue limit.
+        """
+        with self._submit_lock:
+            jobs = db.enqueue_jobs(index_id, file_paths, max_pending=self.max_pending)
+        if jobs is None:
+            raise QueueFullError(f"处理队列已满（上限 {self.max_pending}），请稍后再试")
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        return jobs
+
+    def _dispatch_loop(self):
+        while True:
+            try:
+                job = db.claim_job()
+            except sqlite3.Error as e:
+                # 数据库繁忙（其他线程正在写入）时稍后再试，调度线程不能退出
+                print(f"领取任务失败，稍后重试: {str(e)}")
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            print(f"开始处理任务 {job.id}: {job.path} (第 {job.attempts} 次尝试)")
+            task = IngestTask(job.path, job.index_id, on_done=self._job_done, on_error=self._job_failed)
+            task.job = job
+            # 流水线已满时阻塞，不再领取新任务
+            self.searcher.pipeline.submit(task)
+
+    def _job_done(self, task):
+        db.finish_job(task.job.id)
+        self._update_index_status(task.index_id)
+
+    def _job_failed(self, task, error):
+        job = task.job
+        if db.fail_job(job, str(error), self.max_attempts):
+            print(f"任务 {job.id} 失败，稍后重试: {str(error)}")
+            with self._wakeup:
+                self._wakeup.notify_all()
+        else:
+            print(f"任务 {job.id} 已达到最大尝试次数: {str(error)}")
+            self.searcher.discard_checkpoint(task)
+        self._update_index_status(task.index_id)
+
+    def _update_index_status(self, index_id):
+        # 索引下没有未完成的任务时，更新索引状态
+        if db.count_active_jobs(index_id) == 0:
+            db.update_index_status(index_id, IndexStatus.COMPLETED)
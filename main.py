@@ -1,12 +1,171 @@
+"""
+Bulk ingestion from the command line, without starting the API server.
+
+    python main.py --name 课程录像 videos/ "archive/**/*.mp4"
+    python main.py --index <index_id> new_videos/ --decode-processes 4
+    python main.py --index <index_id> videos/ --reindex
+
+Directories are searched recursively for media files and glob patterns are expanded.
+Files go through the same database records and ingest pipeline as the API; the run
+ends with a per-stage throughput summary.
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from database import db, IndexStatus
+from ingest_pipeline import IngestTask
+from vector_store import VECTOR_STORE_BACKENDS, QUANTIZATIONS, SPACES
 from video_searcher import VideoSpeechContentSearcher
+from watcher import is_media_file
+
+
+def expand_paths(patterns):
+    """
+    Expand directories (recursively) and glob patterns into a sorted list of media files.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for directory, _, files in os.walk(pattern):
+                paths.update(os.path.join(directory, name) for name in files)
+        elif os.path.isfile(pattern):
+            paths.add(pattern)
+        else:
+            paths.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    return sorted(os.path.abspath(p) for p in paths if is_media_file(p))
+
+
+def index_settings(args):
+    settings = {"backend": args.vector_store, "space": args.distance}
+    if args.embedding_dim:
+        settings["embedding_dim"] = args.embedding_dim
+    if args.vector_store == "mmap":
+        settings["quantization"] = args.quantization
+    return settings
+
+
+def prepare_index(args, paths):
+    """
+    Create the index or add the files to an existing one. Returns (index_id, paths to ingest).
+    """
+    if args.index is None:
+        # 一个文件只能属于一个索引
+        todo = []
+        for path in paths:
+            if db.get_index_id_by_file_path(path) is not None:
+                print(f"文件已属于其他索引，跳过: {path}")
+                continue
+            todo.append(path)
+        if not todo:
+            raise SystemExit("所有文件都已属于其他索引")
+        index = db.create_index(args.name, todo, settings=index_settings(args))
+        print(f"创建索引 {index.name} ({index.id})，共 {len(todo)} 个文件，跳过 {len(paths) - len(todo)} 个")
+        return index.id, todo
+
+    index = db.get_index_by_id(args.index)
+    if index is None:
+        raise SystemExit(f"索引不存在: {args.index}")
+    existing = {f.path for f in index.files}
+    todo = []
+    for path in paths:
+        if path in existing:
+            # 已入库的文件只在 --reindex 时重新处理（只为变化的文本段计算向量）
+            if args.reindex:
+                db.update_file_status(index.id, path, IndexStatus.WAITING)
+                todo.append(path)
+            continue
+        try:
+            db.add_file_to_index(index.id, path)
+        except sqlite3.IntegrityError:
+            print(f"文件已属于其他索引，跳过: {path}")
+            continue
+        todo.append(path)
+    print(f"索引 {index.name} ({index.id})：新增 {len(todo)} 个文件，跳过 {len(paths) - len(todo)} 个")
+    return index.id, todo
+
+
+def rate(amount, seconds):
+    return amount / seconds if seconds > 0 else 0.0
+
+
+def print_summary(tasks, wall_time):
+    done = [t for t in tasks if t.error is None]
+    audio = sum((t.asr_info or {}).get("duration") or 0.0 for t in done)
+    segments = sum(t.segments for t in done)
+    embedded = sum(t.embedded for t in done)
+    busy = {name: sum(t.timings.get(name, 0.0) for t in tasks) for name in ("decode", "asr", "embed")}
+
+    print("=" * 60)
+    print(f"files     {len(done)} ok, {len(tasks) - len(done)} failed, wall {wall_time:.1f}s")
+    print(f"audio     {audio:.1f}s, segments {segments} ({embedded} embedded, {segments - embedded} unchanged)")
+    print("stage     busy time     throughput (per worker)")
+    print(f"decode    {busy['decode']:8.1f}s     {rate(audio, busy['decode']):8.1f} audio-s/s")
+    print(f"asr       {busy['asr']:8.1f}s     {rate(audio, busy['asr']):8.1f} audio-s/s")
+    print(f"embed     {busy['embed']:8.1f}s     {rate(embedded, busy['embed']):8.1f} segments/s")
+    print(f"overall   {rate(audio, wall_time):.1f} audio-s/s, {rate(segments, wall_time):.1f} segments/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest videos into an index from the command line")
+    parser.add_argument("paths", nargs="+", help="media files, directories or glob patterns")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--index", help="add to an existing index")
+    target.add_argument("--name", help="create a new index with this name")
+    parser.add_argument("--reindex", action="store_true", help="re-process files already in the index")
+    parser.add_argument("--decode-processes", type=int, default=None,
+                        help="audio decode processes (0 decodes in threads); not used with ASR_STREAM_DECODE")
+    parser.add_argument("--vector-store", choices=VECTOR_STORE_BACKENDS, default=config.VECTOR_STORE_BACKEND)
+    parser.add_argument("--distance", choices=SPACES, default=config.DEFAULT_DISTANCE)
+    parser.add_argument("--embedding-dim", type=int, default=config.EMBEDDING_DIM)
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=config.MMAP_QUANTIZATION)
+    args = parser.parse_args()
+    if args.embedding_dim is not None and args.embedding_dim < 0:
+        parser.error(f"无效的向量维度: {args.embedding_dim}")
+    # 流式解码时识别阶段直接读取媒体文件，不经过解码进程池
+    stream_decode = config.ASR_STREAM_DECODE and config.ASR_LONG_FORM == "chunked"
+    if args.decode_processes is None:
+        args.decode_processes = 0 if stream_decode else config.DECODE_WORKERS
+    elif args.decode_processes > 0 and stream_decode:
+        print("警告: 已启用 ASR_STREAM_DECODE，音频由识别阶段流式读取，--decode-processes 不起作用")
+        args.decode_processes = 0
+
+    paths = expand_paths(args.paths)
+    if not paths:
+        raise SystemExit("没有找到媒体文件")
+    index_id, paths = prepare_index(args, paths)
+    if not paths:
+        return
+
+    vs = VideoSpeechContentSearcher(decode_processes=args.decode_processes)
+    db.update_index_status(index_id, IndexStatus.PROCESSING)
 
+    finished = [0]
+    lock = threading.Lock()
 
-vs = VideoSpeechContentSearcher()
-vs.delete_database("test_db")
-vs.use_database("test_db")
+    def report(task, error=None):
+        with lock:
+            finished[0] += 1
+            if error is None:
+                duration = (task.asr_info or {}).get("duration") or 0.0
+                print(f"[{finished[0]}/{len(paths)}] {task.video_path}: {duration:.1f}s 音频，{task.segments} 个文本段")
+            else:
+                print(f"[{finished[0]}/{len(paths)}] {task.video_path} 失败: {str(error)}")
 
-vs.add_videos(["牛肉丸1.mp4", "牛肉丸2.mp4"])
-vs.user_query()
+    tasks = [IngestTask(path, index_id, on_done=report, on_error=report) for path in paths]
+    start = time.perf_counter()
+    vs.pipeline.run(tasks)
+    wall_time = time.perf_counter() - start
 
+    db.update_index_status(index_id, IndexStatus.COMPLETED)
+    if vs.decode_pool is not None:
+        vs.decode_pool.shutdown()
+    print_summary(tasks, wall_time)
 
 
+if __name__ == "__main__":
+    main()
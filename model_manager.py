@@ -0,0 +1,145 @@
+import gc
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+from wishper import ASR
+
+
+def available_memory_mb():
+    """
+    Available system memory in MB (Linux only), or None if unknown.
+    """
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class ModelManager:
+    """
+    Keeps a model resident between jobs.
+
+    The model is loaded on first use (or by `preload`) and shared by every caller.
+    A background thread frees it once nobody has used it for `idle_timeout` seconds,
+    or earlier when available memory drops below `min_available_mb`.
+    """
+
+    def __init__(self, factory, name="model", idle_timeout=600, min_available_mb=0, check_interval=30):
+        self.factory = factory
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.min_available_mb = min_available_mb
+        self.check_interval = check_interval
+        self.loads = 0
+        self.unloads = 0
+        self._model = None
+        self._users = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._reaper = None
+
+    @contextmanager
+    def acquire(self):
+        """
+        Use the model, loading it if needed. It is never freed while in use.
+        """
+        with self._load_lock:
+            self._ensure_loaded()
+            with self._lock:
+                self._users += 1
+                model = self._model
+        try:
+            yield model
+        finally:
+            with self._lock:
+                self._users -= 1
+                self._last_used = time.time()
+
+    def preload(self, background=True):
+        """
+        Load the model ahead of the first job, e.g. at server start.
+        """
+        def load():
+            with self._load_lock:
+                self._ensure_loaded()
+
+        if background:
+            threading.Thread(target=load, name=f"{self.name}-preload", daemon=True).start()
+        else:
+            load()
+
+    def unload(self):
+        """
+        Free the model if it is not in use. Returns whether it was freed.
+        """
+        # 模型正在加载时不释放
+        if not self._load_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                if self._model is None or self._users > 0:
+                    return False
+                self._model = None
+                self.unloads += 1
+        finally:
+            self._load_lock.release()
+        gc.collect()
+        print(f"{self.name} 模型已释放")
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self._model is not None,
+                "users": self._users,
+                "idleSeconds": time.time() - self._last_used if self._model is not None and self._users == 0 else 0,
+                "loads": self.loads,
+                "unloads": self.unloads,
+            }
+
+    def _ensure_loaded(self):
+        # 调用方持有 _load_lock，加载期间不阻塞 stats 等只读操作
+        if self._model is not None:
+            return
+        print(f"Initializing {self.name} model...")
+        model = self.factory()
+        with self._lock:
+            self._model = model
+            self._last_used = time.time()
+            self.loads += 1
+        print(f"{self.name} model initialized.")
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name=f"{self.name}-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            with self._lock:
+                if self._model is None or self._users > 0:
+                    continue
+                idle = time.time() - self._last_used
+            if self.idle_timeout and idle >= self.idle_timeout:
+                print(f"{self.name} 模型空闲 {int(idle)} 秒，释放模型")
+                self.unload()
+                continue
+            available = available_memory_mb()
+            if self.min_available_mb and available is not None and available < self.min_available_mb:
+                print(f"可用内存不足 ({int(available)} MB)，释放 {self.name} 模型")
+                self.unload()
+
+
+# 全局ASR模型管理器，所有代码通过它获取ASR模型
+asr_manager = ModelManager(
+    ASR,
+    name="ASR",
+    idle_timeout=config.ASR_IDLE_TIMEOUT_S,
+    min_available_mb=config.ASR_MIN_AVAILABLE_MB,
+)
@@ -1,56 +1,136 @@
-from retrieve import embed, dot
-from utils import generate_random_id
+from retrieve import embed
+from exact_search import ExactSearchIndex, top_k_indices
+from utils import segment_id
+import config
+import re
 import time
 
-def preprocess(result_file, src_file=""):
+# 句末标点；英文句号后面需要有空白，避免切开小数
+SENTENCE_END = re.compile(r"(?<=[。！？!?；;…])|(?<=\.)(?=\s)")
+
+
+def read_chunks(result_file):
+    """
+    Yield (text, start, end) for every line of an ASR result file, reading one line at a time.
+    """
     with open(result_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-    
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            text, start, end = line.rsplit(",", 2)
+            start = float(start)
+            # whisper 的最后一个片段可能没有结束时间
+            end = float(end) if end not in ("", "None") else start
+            yield text, start, max(end, start)
+
+
+def split_sentences(text, start, end, max_chars):
+    """
+    Split a chunk at sentence punctuation (and into pieces of at most max_chars),
+    spreading the chunk's time span over the pieces by length.
+    """
+    pieces = []
+    for sentence in SENTENCE_END.split(text):
+        if sentence.strip():
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+    total = sum(len(piece) for piece in pieces)
+    offset = start
+    for i, piece in enumerate(pieces):
+        piece_end = end if i == len(pieces) - 1 else offset + (end - start) * len(piece) / total
+        yield piece, offset, piece_end
+        offset = piece_end
+
+
+def _join_window(window):
+    # 同一个识别片段切出的句子直接拼接，不同片段之间用逗号分隔
+    parts = [window[0][0]]
+    for previous, unit in zip(window, window[1:]):
+        parts.append(unit[0] if unit[3] == previous[3] else "," + unit[0])
+    return "".join(parts).strip(), window[0][1], window[-1][2]
+
+
+def _overlap_tail(window, overlap_seconds):
+    # 下一个窗口以上一个窗口末尾不超过 overlap_seconds 的完整句子开始
+    tail = []
+    for unit in reversed(window[1:]):
+        if window[-1][2] - unit[1] > overlap_seconds:
+            break
+        tail.insert(0, unit)
+    return tail
+
+
+def segment_chunks(chunks, target_seconds=10.0, max_chars=300, overlap_seconds=0.0):
+    """
+    Pack (text, start, end) chunks into windows that end on sentence boundaries: a window
+    closes once it spans target_seconds, or before it would exceed max_chars. Consecutive
+    windows share up to overlap_seconds of whole sentences and the last partial window is
+    always emitted. A generator, so transcripts of any length use constant memory.
+    Yields (text, start, end).
+    """
+    window, chars, fresh = [], 0, 0
+    for n, (text, start, end) in enumerate(chunks):
+        for piece, piece_start, piece_end in split_sentences(text, start, end, max_chars):
+            if window and chars + len(piece) > max_chars:
+                if fresh:
+                    yield _join_window(window)
+                window = _overlap_tail(window, overlap_seconds) if fresh else []
+                chars, fresh = sum(len(unit[0]) for unit in window), 0
+                if chars + len(piece) > max_chars:
+                    window, chars = [], 0
+            window.append((piece, piece_start, piece_end, n))
+            chars += len(piece)
+            fresh += 1
+            if window[-1][2] - window[0][1] >= target_seconds:
+                yield _join_window(window)
+                window = _overlap_tail(window, overlap_seconds)
+                chars, fresh = sum(len(unit[0]) for unit in window), 0
+    # 最后不足一个窗口的部分也要输出
+    if fresh:
+        yield _join_window(window)
+
+
+def iter_segments(chunks, src_file="", target_seconds=None, max_chars=None, overlap_seconds=None):
+    """
+    Stream (id, document, metadata) for the segments of (text, start, end) chunks,
+    e.g. read_chunks() of a result file or a stored Transcript.
+    Window parameters default to the SEGMENT_* settings.
+    """
+    windows = segment_chunks(
+        chunks,
+        target_seconds=config.SEGMENT_TARGET_S if target_seconds is None else target_seconds,
+        max_chars=config.SEGMENT_MAX_CHARS if max_chars is None else max_chars,
+        overlap_seconds=config.SEGMENT_OVERLAP_S if overlap_seconds is None else overlap_seconds,
+    )
+    for text, start, end in windows:
+        start, end = round(start, 3), round(end, 3)
+        document = "search_document: " + text
+        yield segment_id(src_file, start, end, document), document, {"start": start, "end": end, "src_file": src_file}
+
+
+def preprocess_chunks(chunks, src_file="", **kwargs):
     ids, segments, metadatas = [], [], []
-    texts = []
-    start10 = 0
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        
-        text, start, end = line.rsplit(",", 2)
-        if start10 == 0:
-            start10 = float(start)
-        start = float(start)
-        end = float(end)
-        texts.append(text)
-        # 将每10s的文本分割成一个段落
-        if end - start10 > 10:
-            ids.append(generate_random_id())
-            segments.append("search_document: " + ",".join(texts))
-            metadatas.append({"start": start10, "end": end, "src_file": src_file})
-            start10 = 0
-            texts = []
-            # print(f"分割段落: {segments[-1]}, 开始时间: {metadatas[-1]['start']}, 结束时间: {metadatas[-1]['end']}")
-            
-        
-    
+    for seg_id, document, metadata in iter_segments(chunks, src_file, **kwargs):
+        ids.append(seg_id)
+        segments.append(document)
+        metadatas.append(metadata)
     return ids, segments, metadatas
 
 
+def preprocess(result_file, src_file="", **kwargs):
+    return preprocess_chunks(read_chunks(result_file), src_file, **kwargs)
+
+
 def query_search(query, docs_embed, top_k=5, filter_threshold=0.2):
     query_embed = embed(['search_query: ' + query])[0]
     print(f'query: {query!r}')
-    similarities = []
-    for e in docs_embed:
-        similarities.append(dot(query_embed, e))
-        # print(f'similarity {dot(query_embed, e):.2f}: {d!r}')
+    index = ExactSearchIndex(docs_embed)
+    similarities = index.scores(query_embed)[0]
 
     # 查询similarity前top_k的段落，且过滤掉相似度低于filter_threshold的段落
-    top_indices = [i for i, sim in enumerate(similarities) if sim >= filter_threshold]
-    top_indices = sorted(top_indices, key=lambda i: similarities[i], reverse=True)[:top_k]
-
-
+    top_indices = top_k_indices(similarities, top_k, filter_threshold)
 
-    # top_indices = sorted(range(len(similarities)), key=lambda i: similarities[i], reverse=True)[:top_k]
-    
-    return top_indices, similarities
+    return top_indices.tolist(), similarities.tolist()
 
 
 
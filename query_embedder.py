@@ -0,0 +1,201 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+import config
+from retrieve import embed
+
+
+def normalize_query(query):
+    """
+    Normalize query text so trivially different spellings share one cache entry.
+    Only used as the cache key; the query itself is embedded as typed.
+    """
+    query = unicodedata.normalize("NFKC", query)
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+class QueryEmbedder:
+    """
+    Query embeddings with an LRU cache and micro-batching.
+
+    Cache misses that arrive within `batch_window_ms` of each other are merged into a
+    single embedding call, and queries with the same normalized text in flight share
+    one result (the text of the first of them is embedded). With
+    `persist_path` the cache is also written to a SQLite file and survives restarts.
+    """
+
+    def __init__(self, embed_fn, model_id, max_entries=10000, batch_window_ms=5, max_batch=64, persist_path=None):
+        self.embed_fn = embed_fn
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+        self.max_batch_seen = 0
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._pending = []
+        self._leader_active = False
+        self._lock = threading.Lock()
+        if persist_path:
+            conn = sqlite3.connect(persist_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model_id TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    PRIMARY KEY (model_id, query)
+                )
+            ''')
+            conn.commit()
+            conn.close()
+
+    def embed_query(self, query):
+        """
+        Embed one search query (the "search_query: " prefix is added here).
+        """
+        key = normalize_query(query)
+        with self._lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        embedding = self._load_persisted(key)
+        with self._lock:
+            if embedding is not None:
+                self.hits += 1
+                self._remember(key, embedding)
+                return embedding
+            self.misses += 1
+            future = self._inflight.get(key)
+            leader = False
+            if future is None:
+                future = Future()
+                self._inflight[key] = future
+                self._pending.append((key, query))
+                if not self._leader_active:
+                    self._leader_active = True
+                    leader = True
+
+        # 第一个未命中的请求等待一个很短的窗口，把这段时间内到达的查询合并成一次向量化调用
+        if leader:
+            self._run_batches()
+        return future.result()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total else 0.0,
+                "entries": len(self._cache),
+                "batches": self.batches,
+                "avgBatchSize": self.batched_queries / self.batches if self.batches else 0.0,
+                "maxBatchSize": self.max_batch_seen,
+            }
+
+    def _run_batches(self):
+        try:
+            time.sleep(self.batch_window)
+            while True:
+                with self._lock:
+                    pending = self._pending[:self.max_batch]
+                    self._pending = self._pending[self.max_batch:]
+                    if not pending:
+                        self._leader_active = False
+                        return
+                    self.batches += 1
+                    self.batched_queries += len(pending)
+                    self.max_batch_seen = max(self.max_batch_seen, len(pending))
+
+                keys = [key for key, _ in pending]
+                try:
+                    # 归一化的文本只作为缓存键，向量化使用原始查询
+                    embeddings = self.embed_fn(["search_query: " + query for _, query in pending])
+                    if len(embeddings) != len(keys):
+                        raise RuntimeError(f"向量化返回了 {len(embeddings)} 个向量，应为 {len(keys)} 个")
+                except Exception as e:
+                    self._fail(keys, e)
+                    continue
+
+                try:
+                    self._persist(keys, embeddings)
+                except Exception as e:
+                    # 写入持久缓存失败不影响本次查询
+                    print(f"保存查询向量缓存失败: {str(e)}")
+                with self._lock:
+                    futures = []
+                    for key, embedding in zip(keys, embeddings):
+                        self._remember(key, embedding)
+                        futures.append(self._inflight.pop(key))
+                for future, embedding in zip(futures, embeddings):
+                    future.set_result(embedding)
+        except BaseException as e:
+            # 任何意外错误都要让所有等待中的查询失败并交出批处理，否则之后的查询会永远阻塞
+            with self._lock:
+                keys = list(self._inflight)
+                self._pending = []
+                self._leader_active = False
+            self._fail(keys, e if isinstance(e, Exception) else RuntimeError("查询向量化被中断"))
+            raise
+
+    def _fail(self, keys, error):
+        with self._lock:
+            futures = [self._inflight.pop(key) for key in keys if key in self._inflight]
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+    def _remember(self, key, embedding):
+        # 调用方持有 _lock
+        self._cache[key] = embedding
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _load_persisted(self, key):
+        if not self.persist_path:
+            return None
+        conn = sqlite3.connect(self.persist_path)
+        row = conn.execute(
+            'SELECT embedding FROM query_embeddings WHERE model_id = ? AND query = ?', (self.model_id, key)
+        ).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def _persist(self, keys, embeddings):
+        if not self.persist_path:
+            return
+        conn = sqlite3.connect(self.persist_path)
+        conn.executemany(
+            'INSERT OR REPLACE INTO query_embeddings (model_id, query, embedding) VALUES (?, ?, ?)',
+            [(self.model_id, key, np.asarray(e, dtype=np.float32).tobytes()) for key, e in zip(keys, embeddings)],
+        )
+        conn.commit()
+        conn.close()
+
+
+# 全局查询向量缓存
+query_embedder = QueryEmbedder(
+    embed,
+    model_id=config.EMBEDDING_MODEL_NAME,
+    max_entries=config.QUERY_CACHE_SIZE,
+    batch_window_ms=config.QUERY_BATCH_WINDOW_MS,
+    persist_path=config.QUERY_CACHE_PATH or None,
+)
@@ -1,11 +1,250 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import requests
+import requests.adapters
+
+import config
+
 
 def dot(va, vb):
     return sum(a * b for a, b in zip(va, vb))
 
+
+class _Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+
+class HttpEmbeddingBackend:
+    """
+    Embeddings from one or more llama-server instances over HTTP.
+
+    Connections are kept alive in a pooled session. Inputs are split into batches of
+    at most `batch_size` texts and up to `max_in_flight` batches are sent in parallel,
+    routed round-robin or to the least loaded server. Failed requests are retried with
+    exponential backoff, and a server that fails `eject_after` times in a row is left
+    out for `eject_seconds`.
+    """
+
+    def __init__(self, urls, batch_size=32, max_in_flight=4, routing="round_robin", timeout=30,
+                 retries=3, backoff=0.5, eject_after=3, eject_seconds=30):
+        if routing not in ("round_robin", "least_loaded"):
+            raise ValueError(f"Unknown routing policy: {routing}")
+        self.endpoints = [_Endpoint(url) for url in urls]
+        self.batch_size = batch_size
+        self.routing = routing
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self._next = 0
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=len(self.endpoints), pool_maxsize=max(max_in_flight, 1) * 2
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-http")
+
+    def embed(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(texts) if texts else []
+        embeddings = []
+        for result in self._executor.map(self._embed_batch, batches):
+            embeddings.extend(result)
+        return embeddings
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return [{
+                "url": e.url,
+                "healthy": e.down_until <= now,
+                "inFlight": e.in_flight,
+                "requests": e.requests,
+                "failures": e.failures,
+            } for e in self.endpoints]
+
+    def _embed_batch(self, texts):
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            endpoint = self._acquire_endpoint()
+            try:
+                resp = self.session.post(endpoint.url, json={'input': texts}, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._release_endpoint(endpoint, ok=False)
+                last_error = e
+                continue
+            if 400 <= resp.status_code < 500:
+                # 请求本身有问题，换服务重试也不会成功
+                self._release_endpoint(endpoint, ok=True)
+                resp.raise_for_status()
+            try:
+                resp.raise_for_status()
+                data = resp.json()['data']
+            except (requests.RequestException, ValueError, KeyError) as e:
+                self._release_endpoint(endpoint, ok=False)
+                last_error = e
+                continue
+            self._release_endpoint(endpoint, ok=True)
+            data.sort(key=lambda d: d.get('index', 0))
+            return [d['embedding'] for d in data]
+        raise RuntimeError(f"向量化请求失败（已重试 {self.retries} 次）: {str(last_error)}")
+
+    def _acquire_endpoint(self):
+        with self._lock:
+            now = time.time()
+            healthy = [e for e in self.endpoints if e.down_until <= now]
+            if not healthy:
+                # 所有服务都被暂时剔除时，选择最早恢复的一个
+                healthy = [min(self.endpoints, key=lambda e: e.down_until)]
+            if self.routing == "least_loaded":
+                endpoint = min(healthy, key=lambda e: e.in_flight)
+            else:
+                endpoint = healthy[self._next % len(healthy)]
+                self._next += 1
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release_endpoint(self, endpoint, ok):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_after:
+                endpoint.down_until = time.time() + self.eject_seconds
+                endpoint.consecutive_failures = 0
+                print(f"向量化服务 {endpoint.url} 连续失败，暂停使用 {self.eject_seconds} 秒")
+
+
+class LlamaCppEmbeddingBackend:
+    """
+    Embeddings computed in-process with llama-cpp-python.
+
+    `instances` copies of the GGUF model are loaded; inputs are split into batches of
+    `batch_size` texts that run on the copies in parallel from a thread pool, each
+    copy using its share of the CPU threads.
+    """
+
+    def __init__(self, model_path, instances=1, batch_size=32, n_ctx=2048, n_threads=0, n_gpu_layers=0):
+        from llama_cpp import Llama
+
+        self.batch_size = batch_size
+        threads = n_threads or max(1, (os.cpu_count() or 1) // instances)
+        self._models = queue.Queue()
+        for _ in range(instances):
+            self._models.put(Llama(
+                model_path=model_path,
+                embedding=True,
+                n_ctx=n_ctx,
+                n_batch=n_ctx,
+                n_ubatch=n_ctx,
+                n_threads=threads,
+                n_gpu_layers=n_gpu_layers,
+                verbose=False,
+            ))
+        self._executor = ThreadPoolExecutor(max_workers=instances, thread_name_prefix="embed")
+
+    def embed(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(texts) if texts else []
+        embeddings = []
+        for result in self._executor.map(self._embed_batch, batches):
+            embeddings.extend(result)
+        return embeddings
+
+    def _embed_batch(self, texts):
+        # 每个模型实例同一时间只处理一个批次
+        model = self._models.get()
+        try:
+            return model.embed(texts, normalize=True, truncate=True)
+        finally:
+            self._models.put(model)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_embedding_backend():
+    """
+    Get the embedding backend selected by EMBEDDING_BACKEND, creating it on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if config.EMBEDDING_BACKEND == "llama_cpp":
+                print(f"Loading embedding model in-process: {config.EMBEDDING_MODEL_PATH}")
+                _backend = LlamaCppEmbeddingBackend(
+                    config.EMBEDDING_MODEL_PATH,
+                    instances=config.EMBEDDING_INSTANCES,
+                    batch_size=config.EMBEDDING_BATCH_SIZE,
+                    n_ctx=config.EMBEDDING_N_CTX,
+                    n_threads=config.EMBEDDING_THREADS,
+                    n_gpu_layers=config.EMBEDDING_GPU_LAYERS,
+                )
+            elif config.EMBEDDING_BACKEND == "http":
+                _backend = HttpEmbeddingBackend(
+                    config.EMBEDDING_URLS,
+                    batch_size=config.EMBEDDING_BATCH_SIZE,
+                    max_in_flight=config.EMBEDDING_HTTP_PARALLEL,
+                    routing=config.EMBEDDING_ROUTING,
+                    timeout=config.EMBEDDING_TIMEOUT_S,
+                    retries=config.EMBEDDING_RETRIES,
+                )
+            else:
+                raise ValueError(f"Unknown embedding backend: {config.EMBEDDING_BACKEND}")
+        return _backend
+
+
 def embed(texts):
-    resp = requests.post('http://localhost:8080/v1/embeddings', json={'input': texts}).json()
-    return [d['embedding'] for d in resp['data']]
+    return get_embedding_backend().embed(texts)
+
+
+def truncate_embeddings(embeddings, dim):
+    """
+    Matryoshka truncation: keep the first `dim` components and re-normalize.
+    With `dim` None or 0 the embeddings are returned unchanged.
+    """
+    if not dim:
+        return embeddings
+    vectors = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    if vectors.shape[1] < dim:
+        raise ValueError(f"Embedding dimension {vectors.shape[1]} is smaller than the requested {dim}")
+    vectors = vectors[:, :dim]
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors.tolist()
+
+
+def embedding_stats():
+    """
+    Statistics of the embedding backend, without creating it.
+    """
+    backend = _backend
+    if backend is None or not hasattr(backend, "stats"):
+        return None
+    return backend.stats()
 
 
 if __name__ == "__main__":
@@ -18,4 +257,3 @@ if __name__ == "__main__":
     for d, e in zip(docs, docs_embed):
         print(f'similarity {dot(query_embed, e):.2f}: {d!r}')
 
-
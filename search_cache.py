@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+
+
+class SearchResultCache:
+    """
+    In-memory LRU cache of search results.
+
+    Keys start with (index_id, generation). The generation is stored in the indexes
+    table and bumped whenever the index content changes, so stale results are never
+    served. `invalidate` also drops the old entries of an index right away.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, index_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == index_id]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+            }
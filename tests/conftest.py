@@ -0,0 +1,13 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 导入模块时会在当前目录创建数据库等文件，测试在临时目录中运行
+_workdir = tempfile.mkdtemp(prefix="video-search-tests-")
+os.chdir(_workdir)
+atexit.register(shutil.rmtree, _workdir, True)
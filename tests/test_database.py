@@ -0,0 +1,81 @@
+import pytest
+
+from database import Database
+
+
+DOCUMENTS = {
+    "a1": ("a.mp4", "今天介绍向量检索的基本原理"),
+    "a2": ("a.mp4", "向量和检索是两个词"),
+    "a3": ("a.mp4", "训练用了 GPU 集群"),
+    "b1": ("b.mp4", "用 gpu 推理速度很快"),
+    "b2": ("b.mp4", "倒排索引适合关键词检索"),
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    db = Database(str(tmp_path / "indexes.db"))
+    if not db.fts_enabled:
+        pytest.skip("SQLite 不支持 FTS5")
+    index = db.create_index("test", ["a.mp4", "b.mp4"])
+    ids = list(DOCUMENTS)
+    db.add_segments(
+        index.id,
+        ids,
+        ["search_document: " + DOCUMENTS[i][1] for i in ids],
+        [{"src_file": DOCUMENTS[i][0], "start": 0.0, "end": 1.0} for i in ids],
+    )
+    return db, index.id
+
+
+def search(db, index_id, *keywords, **kwargs):
+    return sorted(segment_id for segment_id, _, _ in db.search_segments(index_id, list(keywords), **kwargs))
+
+
+def test_single_character_keyword(index):
+    db, index_id = index
+    assert search(db, index_id, "向") == ["a1", "a2"]
+    assert search(db, index_id, "倒") == ["b2"]
+
+
+def test_two_character_keyword(index):
+    db, index_id = index
+    assert search(db, index_id, "检索") == ["a1", "a2", "b2"]
+
+
+def test_long_keyword_must_appear_contiguously(index):
+    db, index_id = index
+    # a2 中 "向量" 和 "检索" 都出现了，但不相连
+    assert search(db, index_id, "向量检索") == ["a1"]
+    assert search(db, index_id, "向量", "检索") == ["a1", "a2"]
+
+
+def test_ascii_keywords_are_case_sensitive(index):
+    db, index_id = index
+    assert search(db, index_id, "GPU") == ["a3"]
+    assert search(db, index_id, "gpu") == ["b1"]
+
+
+def test_search_filters_by_video(index):
+    db, index_id = index
+    assert search(db, index_id, "检索", video_paths=["b.mp4"]) == ["b2"]
+
+
+def test_rank_segments_orders_by_relevance_and_applies_keywords(index):
+    db, index_id = index
+    ranked = [segment_id for segment_id, _, _ in db.rank_segments(index_id, "向量检索", limit=10)]
+    assert ranked[0] == "a1"
+    assert set(ranked) == {"a1", "a2", "b2"}
+    filtered = [segment_id for segment_id, _, _ in db.rank_segments(index_id, "检索", keywords=["倒排"])]
+    assert filtered == ["b2"]
+
+
+def test_delete_segments_by_id_and_by_file(index):
+    db, index_id = index
+    assert db.delete_segments(index_id, ids=["a1"]) == 1
+    assert search(db, index_id, "检索") == ["a2", "b2"]
+
+    assert db.delete_segments(index_id, src_file="b.mp4") == 2
+    assert search(db, index_id, "检索") == ["a2"]
+    assert search(db, index_id, "gpu") == []
+    assert db.rank_segments(index_id, "倒排索引") == []
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from preprocess import iter_segments, read_chunks, segment_chunks, split_sentences
+
+
+def test_window_starting_at_zero_is_emitted():
+    windows = list(segment_chunks([("第一句。", 0.0, 4.0), ("第二句。", 4.0, 11.0), ("第三句。", 11.0, 13.0)], target_seconds=10))
+    assert windows[0] == ("第一句。,第二句。", 0.0, 11.0)
+    assert windows[0][1] == 0.0
+
+
+def test_trailing_partial_window_is_emitted():
+    windows = list(segment_chunks([("开头。", 0.0, 10.0), ("结尾。", 10.0, 12.0)], target_seconds=10))
+    assert windows == [("开头。", 0.0, 10.0), ("结尾。", 10.0, 12.0)]
+
+
+def test_short_transcript_is_one_window():
+    assert list(segment_chunks([("只有一句", 0.0, 3.0)], target_seconds=10)) == [("只有一句", 0.0, 3.0)]
+
+
+def test_overlap_repeats_the_last_sentences():
+    chunks = [("一。", 0.0, 4.0), ("二。", 4.0, 8.0), ("三。", 8.0, 10.0), ("四。", 10.0, 14.0), ("五。", 14.0, 20.0)]
+    windows = list(segment_chunks(chunks, target_seconds=10, overlap_seconds=3))
+    assert windows[0] == ("一。,二。,三。", 0.0, 10.0)
+    # 下一个窗口以上一个窗口末尾 3 秒内的完整句子开始
+    assert windows[1] == ("三。,四。,五。", 8.0, 20.0)
+
+
+def test_no_overlap_by_default():
+    chunks = [("一。", 0.0, 5.0), ("二。", 5.0, 10.0), ("三。", 10.0, 15.0)]
+    assert [w[0] for w in segment_chunks(chunks, target_seconds=10)] == ["一。,二。", "三。"]
+
+
+def test_max_chars_cuts_windows_and_long_sentences():
+    windows = list(segment_chunks([("甲" * 8 + "。", 0.0, 1.0), ("乙" * 8 + "。", 1.0, 2.0)], target_seconds=100, max_chars=10))
+    assert [w[0] for w in windows] == ["甲" * 8 + "。", "乙" * 8 + "。"]
+    assert all(len(text) <= 10 for text, _, _ in windows)
+
+    pieces = list(split_sentences("丙" * 25, 0.0, 5.0, max_chars=10))
+    assert [len(text) for text, _, _ in pieces] == [10, 10, 5]
+    assert [round(start, 3) for _, start, _ in pieces] == [0.0, 2.0, 4.0]
+    assert pieces[-1][2] == 5.0
+
+
+def test_decimal_point_does_not_split_a_sentence():
+    pieces = list(split_sentences("价格是 3.5 元. 然后下一句", 0.0, 2.0, max_chars=300))
+    assert [text.strip() for text, _, _ in pieces] == ["价格是 3.5 元.", "然后下一句"]
+    assert [text for text, _, _ in split_sentences("版本1.2发布了。好的", 0.0, 1.0, max_chars=300)] == ["版本1.2发布了。", "好的"]
+
+
+def test_segments_have_stable_ids(tmp_path):
+    result_file = tmp_path / "result.txt"
+    result_file.write_text("你好。,0.0,5.0\n世界。,5.0,None\n", encoding="utf-8")
+    chunks = list(read_chunks(result_file))
+    assert chunks == [("你好。", 0.0, 5.0), ("世界。", 5.0, 5.0)]
+
+    first = list(iter_segments(chunks, "v.mp4", target_seconds=10, max_chars=300, overlap_seconds=0))
+    second = list(iter_segments(chunks, "v.mp4", target_seconds=10, max_chars=300, overlap_seconds=0))
+    assert first == second
+    assert first[0][1] == "search_document: 你好。,世界。"
+    assert first[0][2] == {"start": 0.0, "end": 5.0, "src_file": "v.mp4"}
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+
+from query_embedder import QueryEmbedder
+
+
+def make_embedder(embed_fn, **kwargs):
+    return QueryEmbedder(embed_fn, model_id="test", batch_window_ms=1, **kwargs)
+
+
+def test_original_query_is_embedded_and_normalized_text_is_the_key():
+    seen = []
+    embedder = make_embedder(lambda texts: seen.extend(texts) or [[1.0] for _ in texts])
+    embedder.embed_query("Hello  World")
+    embedder.embed_query("hello world")
+    assert seen == ["search_query: Hello  World"]
+    assert embedder.stats()["hits"] == 1
+
+
+def test_embed_error_fails_the_query_and_later_queries_still_work():
+    calls = []
+
+    def embed_fn(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("down")
+        return [[2.0] for _ in texts]
+
+    embedder = make_embedder(embed_fn)
+    with pytest.raises(RuntimeError):
+        embedder.embed_query("a")
+    assert embedder.embed_query("b") == [2.0]
+
+
+def test_short_embedding_result_fails_instead_of_hanging():
+    embedder = make_embedder(lambda texts: [])
+    with pytest.raises(RuntimeError):
+        embedder.embed_query("a")
+    embedder.embed_fn = lambda texts: [[3.0] for _ in texts]
+    assert embedder.embed_query("b") == [3.0]
+
+
+def test_persist_error_does_not_block_later_queries(tmp_path):
+    embedder = make_embedder(lambda texts: [[1.0] for _ in texts], persist_path=str(tmp_path / "q.db"))
+
+    def broken_persist(keys, embeddings):
+        raise OSError("disk full")
+
+    embedder._persist = broken_persist
+    assert embedder.embed_query("a") == [1.0]
+
+    result = []
+    worker = threading.Thread(target=lambda: result.append(embedder.embed_query("b")))
+    worker.start()
+    worker.join(timeout=5)
+    assert result == [[1.0]]
+
+
+def test_unexpected_error_releases_the_batch_leader():
+    embedder = make_embedder(lambda texts: [[1.0] for _ in texts])
+
+    def broken_remember(key, embedding):
+        raise KeyError(key)
+
+    remember = embedder._remember
+    embedder._remember = broken_remember
+    with pytest.raises(KeyError):
+        embedder.embed_query("a")
+    embedder._remember = remember
+    assert embedder.embed_query("b") == [1.0]
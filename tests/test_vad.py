@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip("moviepy")
+
+from vad import remap_chunks
+
+
+# 压缩音频中的 (开始, 原始开始, 长度)：第二段语音在原始音频的 20 秒处
+MAPPING = [(0.0, 5.0, 10.0), (10.0, 20.0, 5.0)]
+
+
+def test_remap_chunks_moves_timestamps_to_original_timeline():
+    chunks = remap_chunks([{"text": "a", "timestamp": (1.0, 9.0)}, {"text": "b", "timestamp": (11.0, 14.0)}], MAPPING)
+    assert [c["timestamp"] for c in chunks] == [(6.0, 14.0), (21.0, 24.0)]
+
+
+def test_remap_chunks_missing_end_becomes_end_of_region():
+    chunks = remap_chunks([{"text": "b", "timestamp": (1.0, None)}], [(0.0, 5.0, 10.0)])
+    assert chunks == [{"text": "b", "timestamp": (6.0, 15.0)}]
+
+    chunks = remap_chunks([{"text": "c", "timestamp": (12.0, None)}], MAPPING)
+    assert chunks[0]["timestamp"] == (22.0, 25.0)
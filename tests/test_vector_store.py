@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from exact_search import ExactSearchIndex
+from vector_store import MmapVectorStore
+
+
+DIM = 16
+
+
+def make_segments(count, seed=0, prefix="s", files=("a.mp4", "b.mp4")):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    ids = [f"{prefix}{i}" for i in range(count)]
+    documents = [f"文本段 {i}" for i in range(count)]
+    metadatas = [{"src_file": files[i % len(files)], "start": float(i), "end": float(i + 1)} for i in range(count)]
+    return ids, vectors, documents, metadatas
+
+
+def exact_ids(ids, vectors, query, k, space):
+    index = ExactSearchIndex(vectors, ids, metric="ip" if space == "ip" else space)
+    return index.search(query, top_k=k)[0]
+
+
+@pytest.mark.parametrize("space", ["l2", "ip", "cosine"])
+def test_query_matches_exact_search(tmp_path, space):
+    ids, vectors, documents, metadatas = make_segments(300)
+    store = MmapVectorStore(str(tmp_path / "store"), space=space)
+    # 分多次写入，覆盖多个分片
+    store.add(ids[:100], vectors[:100], documents[:100], metadatas[:100])
+    store.add(ids[100:], vectors[100:], documents[100:], metadatas[100:])
+
+    query = np.random.default_rng(1).standard_normal(DIM).astype(np.float32)
+    found, found_documents, _, distances = store.query(query, 10)
+    assert found == exact_ids(ids, vectors, query, 10, space)
+    assert found_documents == [documents[ids.index(i)] for i in found]
+    assert distances == sorted(distances)
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_query_rescoring_keeps_recall(tmp_path, quantization):
+    ids, vectors, documents, metadatas = make_segments(500)
+    store = MmapVectorStore(str(tmp_path / "store"), space="cosine", quantization=quantization, rescore=200)
+    store.add(ids, vectors, documents, metadatas)
+
+    rng = np.random.default_rng(2)
+    recall = []
+    for _ in range(20):
+        query = rng.standard_normal(DIM).astype(np.float32)
+        expected = exact_ids(ids, vectors, query, 10, "cosine")
+        found = store.query(query, 10)[0]
+        recall.append(len(set(found) & set(expected)) / 10)
+    assert np.mean(recall) >= 0.9
+
+
+def test_ivf_query_keeps_recall(tmp_path):
+    ids, vectors, documents, metadatas = make_segments(2000)
+    store = MmapVectorStore(str(tmp_path / "store"), space="l2", ivf_lists=8, nprobe=4)
+    store.add(ids, vectors, documents, metadatas)
+    assert (tmp_path / "store" / "centroids.npy").exists()
+
+    rng = np.random.default_rng(3)
+    recall = []
+    for _ in range(20):
+        query = rng.standard_normal(DIM).astype(np.float32)
+        expected = exact_ids(ids, vectors, query, 10, "l2")
+        recall.append(len(set(store.query(query, 10)[0]) & set(expected)) / 10)
+    assert np.mean(recall) >= 0.8
+
+
+def test_query_filters_by_video_and_text(tmp_path):
+    ids, vectors, documents, metadatas = make_segments(50)
+    store = MmapVectorStore(str(tmp_path / "store"))
+    store.add(ids, vectors, documents, metadatas)
+
+    found, _, found_metadatas, _ = store.query(vectors[0], 50, video_paths=["b.mp4"])
+    assert len(found) == 25
+    assert all(m["src_file"] == "b.mp4" for m in found_metadatas)
+    assert store.query(vectors[0], 10, contains=["文本段 7"])[0] == ["s7"]
+
+
+def test_add_replaces_existing_id(tmp_path):
+    ids, vectors, documents, metadatas = make_segments(10)
+    store = MmapVectorStore(str(tmp_path / "store"))
+    store.add(ids, vectors, documents, metadatas)
+    store.add(["s3"], vectors[7:8], ["新的文本"], [metadatas[3]])
+
+    assert store.count() == 10
+    assert store.get(ids=["s3"])["documents"] == ["新的文本"]
+    found, found_documents, _, _ = store.query(vectors[7], 2)
+    assert set(found) == {"s3", "s7"}
+    assert "文本段 3" not in found_documents
+
+
+def test_delete_compact_and_reopen(tmp_path):
+    directory = str(tmp_path / "store")
+    ids, vectors, documents, metadatas = make_segments(40)
+    store = MmapVectorStore(directory, space="cosine")
+    store.add(ids[:20], vectors[:20], documents[:20], metadatas[:20])
+    store.add(ids[20:], vectors[20:], documents[20:], metadatas[20:])
+
+    # 第一个分片删除超过一半时被重写
+    store.delete(ids=ids[:15])
+    assert store.count() == 25
+    assert not (tmp_path / "store" / "shard-00000.npy").exists()
+    store.delete(src_file="a.mp4")
+    live = [i for i in ids[15:] if int(i[1:]) % 2 == 1]
+    assert store.count() == len(live)
+
+    reopened = MmapVectorStore(directory)
+    assert reopened.space == "cosine"
+    assert reopened.count() == len(live)
+    assert sorted(reopened.get()["ids"]) == sorted(live)
+    assert reopened.segment_ids("a.mp4") == []
+    query = vectors[21]
+    assert reopened.query(query, 5)[0] == exact_ids(live, vectors[[ids.index(i) for i in live]], query, 5, "cosine")
+
+    reopened.drop()
+    assert not (tmp_path / "store").exists()
+
+
+def test_embedding_dim_mismatch(tmp_path):
+    directory = str(tmp_path / "store")
+    ids, vectors, documents, metadatas = make_segments(5)
+    store = MmapVectorStore(directory, embedding_dim=DIM)
+    with pytest.raises(ValueError):
+        store.add(ids, vectors[:, :8], documents, metadatas)
+    store.add(ids, vectors, documents, metadatas)
+
+    with pytest.raises(ValueError):
+        MmapVectorStore(directory, embedding_dim=8)
+    with pytest.raises(ValueError):
+        MmapVectorStore(directory).add(["x"], vectors[:1, :8], ["x"], [metadatas[0]])
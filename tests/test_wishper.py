@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from wishper import shift_chunks, stitch_windows
+
+
+def chunk(text, start, end):
+    return {"text": text, "timestamp": (start, end)}
+
+
+def test_sentence_cut_at_window_end_is_taken_from_next_window():
+    # 30 秒窗口，重叠 4 秒：第二个窗口从 26 秒开始
+    first = shift_chunks([chunk("今天讲向量检索。", 0.0, 20.0), chunk("首先介绍", 27.0, None)], 0.0)
+    second = shift_chunks([
+        chunk("检索。", 0.0, 0.5),
+        chunk("首先介绍倒排索引的原理。", 1.0, 6.0),
+        chunk("然后是量化。", 6.0, 9.0),
+    ], 26.0)
+    chunks = stitch_windows([(0.0, 30.0, False, first), (26.0, 10.0, True, second)], 4.0)
+
+    assert [c["text"] for c in chunks] == ["今天讲向量检索。", "首先介绍倒排索引的原理。", "然后是量化。"]
+    assert chunks[1]["timestamp"] == (27.0, 32.0)
+
+
+def test_sentence_started_before_next_window_is_merged():
+    first = shift_chunks([chunk("这一句很长并且跨过了窗口", 20.0, 30.0)], 0.0)
+    second = shift_chunks([chunk("跨过了窗口的边界。", 0.0, 3.0), chunk("下一句。", 3.0, 5.0)], 26.0)
+    chunks = stitch_windows([(0.0, 30.0, False, first), (26.0, 10.0, True, second)], 4.0)
+
+    assert [c["text"] for c in chunks] == ["这一句很长并且跨过了窗口的边界。", "下一句。"]
+    assert chunks[0]["timestamp"] == (20.0, 29.0)
+
+
+def test_chunk_without_start_is_kept():
+    chunks = stitch_windows([(0.0, 10.0, True, shift_chunks([chunk("一", 0.0, 2.0), chunk("二", None, 4.0)], 0.0))], 0.0)
+    assert chunks == [chunk("一", 0.0, 2.0), chunk("二", 2.0, 4.0)]
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+
+class TranscriptCache:
+    """
+    On-disk transcript cache keyed by media content and ASR settings.
+
+    Entries are JSON files named by key, with the ASR checkpoints of unfinished
+    transcripts next to them. The least recently used entries and checkpoints not in
+    use are removed once both together grow beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir="transcript_cache", max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 正在使用的检查点：key -> [锁, 使用者数]
+        self._checkpoints = {}
+        self.checkpoint_dir = os.path.join(cache_dir, "checkpoints")
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+    def make_key(self, media_path, settings):
+        """
+        Hash the media file content together with the ASR settings.
+        """
+        h = hashlib.blake2b(digest_size=20)
+        with open(media_path, "rb") as f:
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                h.update(block)
+        h.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key, count=True):
+        """
+        Return (chunks, info) for a cached transcript, or None.
+        count: whether the lookup is counted in the hit/miss statistics.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # 更新访问时间，用于按最近使用淘汰
+            os.utime(path)
+        except (OSError, ValueError):
+            if count:
+                with self._lock:
+                    self.misses += 1
+            return None
+        if count:
+            with self._lock:
+                self.hits += 1
+        return entry["chunks"], entry["info"]
+
+    def put(self, key, chunks, info):
+        path = self._entry_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"chunks": chunks, "info": info}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self._evict()
+
+    def checkpoint_path(self, key):
+        """
+        Path of the ASR checkpoint for a cache key.
+        """
+        return os.path.join(self.checkpoint_dir, f"{key}.jsonl")
+
+    @contextmanager
+    def checkpoint(self, key):
+        """
+        Hold the ASR checkpoint of a cache key and yield its path. Jobs for files with
+        the same content wait for each other instead of appending to the same file,
+        and a checkpoint in use is never evicted or removed.
+        """
+        with self._lock:
+            entry = self._checkpoints.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield self.checkpoint_path(key)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._checkpoints[key]
+
+    def remove_checkpoint(self, key):
+        """
+        Remove the checkpoint of a cache key, unless another job is using it.
+        """
+        with self._lock:
+            if key in self._checkpoints:
+                return
+            try:
+                os.remove(self.checkpoint_path(key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        entries = self._scan_entries()
+        checkpoints = self._scan_checkpoints()
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hitRate": hits / total if total else 0.0,
+            "entries": len(entries),
+            "checkpoints": len(checkpoints),
+            "bytes": sum(size for _, size, _ in entries + checkpoints),
+            "maxBytes": self.max_bytes,
+        }
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _scan_entries(self):
+        return self._scan(self.cache_dir, ".json")
+
+    def _scan_checkpoints(self):
+        return self._scan(self.checkpoint_dir, ".jsonl")
+
+    def _scan(self, directory, suffix):
+        files = []
+        for e in os.scandir(directory):
+            if e.name.endswith(suffix):
+                try:
+                    stat = e.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, e.path))
+        return files
+
+    def _evict(self):
+        with self._lock:
+            files = self._scan_entries() + self._scan_checkpoints()
+            total = sum(size for _, size, _ in files)
+            in_use = {self.checkpoint_path(key) for key in self._checkpoints}
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                # 正在写入的检查点计入大小但不删除
+                if path in in_use:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+def read_checkpoint(path):
+    """
+    Read an ASR checkpoint, returning {window_index: record}.
+    A partially written last line (the process died while writing) is cut off,
+    so new records are appended after the last complete one.
+    """
+    done = {}
+    valid_bytes = 0
+    try:
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                done[record["window"]] = record
+                valid_bytes += len(line)
+        if valid_bytes < os.path.getsize(path):
+            with open(path, "r+b") as f:
+                f.truncate(valid_bytes)
+    except OSError:
+        pass
+    return done
+
+
+def append_checkpoint(path, records):
+    """
+    Append finished windows to an ASR checkpoint and flush them to disk.
+    """
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
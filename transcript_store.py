@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+
+def _normalize(items):
+    """
+    Turn whisper chunks ({"text", "timestamp": (start, end)}) or (text, start, end)
+    tuples into a list of (text, start, end) sorted by start.
+    """
+    rows = []
+    for item in items:
+        if isinstance(item, dict):
+            text, (start, end) = item["text"], item["timestamp"]
+        else:
+            text, start, end = item
+        start = float(start or 0.0)
+        # whisper 的最后一个片段可能没有结束时间
+        end = float(end) if end is not None else start
+        rows.append((text.strip(), start, max(end, start)))
+    rows.sort(key=lambda row: row[1])
+    return rows
+
+
+def _write_columns(directory, rows):
+    texts = [text.encode("utf-8") for text, _, _ in rows]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    np.save(os.path.join(directory, "starts.npy"), np.array([row[1] for row in rows], dtype=np.float32))
+    np.save(os.path.join(directory, "ends.npy"), np.array([row[2] for row in rows], dtype=np.float32))
+    np.save(os.path.join(directory, "offsets.npy"), offsets)
+    with open(os.path.join(directory, "text.bin"), "wb") as f:
+        f.write(b"".join(texts))
+
+
+class _Columns:
+    """
+    One table of timed text: float32 start/end arrays and a UTF-8 blob addressed
+    by an int64 offsets array, all memory-mapped.
+    """
+
+    def __init__(self, directory):
+        self.starts = np.load(os.path.join(directory, "starts.npy"), mmap_mode="r")
+        self.ends = np.load(os.path.join(directory, "ends.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(directory, "text.bin")
+        # 空文件不能内存映射
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def row(self, i):
+        text = bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+        return text, float(self.starts[i]), float(self.ends[i])
+
+    def between(self, start=None, end=None):
+        """Rows overlapping [start, end), found by binary search on the sorted starts."""
+        lo, hi = 0, len(self)
+        if start is not None:
+            # 开始时间之前的最后一行可能仍与区间重叠
+            lo = max(int(np.searchsorted(self.starts, start, side="right")) - 1, 0)
+        if end is not None:
+            hi = int(np.searchsorted(self.starts, end, side="left"))
+        return [
+            self.row(i) for i in range(lo, hi)
+            if start is None or self.ends[i] > start or self.starts[i] >= start
+        ]
+
+
+class Transcript:
+    """
+    A persisted transcript opened with memory mapping. Iterating yields
+    (text, start, end) chunks, so it can be passed straight to the segmenter.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.chunks = _Columns(directory)
+
+    @property
+    def info(self):
+        return self.meta.get("info") or {}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __getitem__(self, i):
+        return self.chunks.row(i)
+
+    def __iter__(self):
+        for i in range(len(self.chunks)):
+            yield self.chunks.row(i)
+
+    def between(self, start=None, end=None):
+        return self.chunks.between(start, end)
+
+
+class TranscriptStore:
+    """
+    Per-file transcript storage in a compact columnar format.
+
+    Every media file gets a directory (named by a hash of its path) holding versions
+    of its transcript and a `current` file naming the version in use. A version has
+    float32 start/end arrays, an offsets array and one UTF-8 text blob for the ASR
+    chunks, and meta.json with the ASR info and the transcript cache key of the content
+    it was made from. A new transcript is written as a new version and `current` is
+    switched to it, so files still memory-mapped by readers are never renamed or
+    overwritten; old versions are removed once nothing maps them any more.
+    Transcripts outlive the ingest temp folder, so re-segmenting and re-embedding a
+    file, or showing its transcript, never needs ASR again.
+    """
+
+    def __init__(self, directory="transcripts"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, media_path):
+        key = hashlib.blake2b(media_path.encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, key)
+
+    def _current(self, media_path):
+        # 当前版本的目录，没有保存的转录时返回 None
+        path = self._path(media_path)
+        try:
+            with open(os.path.join(path, "current"), "r", encoding="utf-8") as f:
+                return os.path.join(path, f.read().strip())
+        except OSError:
+            return None
+
+    def put(self, media_path, chunks, info=None, key=None):
+        """
+        Save the transcript of a media file, replacing any previous one, and return it opened.
+        """
+        path = self._path(media_path)
+        version = uuid.uuid4().hex
+        version_path = os.path.join(path, version)
+        temp_path = version_path + ".tmp"
+        os.makedirs(temp_path)
+
+        rows = _normalize(chunks)
+        _write_columns(temp_path, rows)
+        meta = {"path": media_path, "count": len(rows), "info": info or {}, "key": key}
+        with open(os.path.join(temp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        with self._lock:
+            os.rename(temp_path, version_path)
+            pointer = os.path.join(path, "current")
+            temp_pointer = f"{pointer}.{threading.get_ident()}.tmp"
+            with open(temp_pointer, "w", encoding="utf-8") as f:
+                f.write(version)
+            os.replace(temp_pointer, pointer)
+            self._remove_old_versions(path, version)
+        return Transcript(version_path)
+
+    def get(self, media_path):
+        """
+        Open the stored transcript of a media file, or return None.
+        """
+        version_path = self._current(media_path)
+        if version_path is None:
+            return None
+        try:
+            return Transcript(version_path)
+        except (OSError, ValueError):
+            return None
+
+    def get_key(self, media_path):
+        """
+        Cache key recorded with the stored transcript of a media file (from meta.json
+        only, nothing is mapped), or None.
+        """
+        version_path = self._current(media_path)
+        if version_path is None:
+            return None
+        try:
+            with open(os.path.join(version_path, "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f).get("key")
+        except (OSError, ValueError):
+            return None
+
+    def delete(self, media_path):
+        path = self._path(media_path)
+        with self._lock:
+            try:
+                os.remove(os.path.join(path, "current"))
+            except OSError:
+                pass
+            self._remove_old_versions(path, None)
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+
+    def _remove_old_versions(self, path, keep):
+        # 调用方持有 _lock；仍被映射的版本（Windows 上无法删除）留到下次替换或删除时再清理
+        for entry in os.scandir(path):
+            # 其他线程正在写入的版本以 .tmp 结尾
+            if entry.is_dir() and entry.name != keep and not entry.name.endswith(".tmp"):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def stats(self):
+        entries, size = 0, 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            if os.path.exists(os.path.join(entry.path, "current")):
+                entries += 1
+            for directory, _, files in os.walk(entry.path):
+                size += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+        return {"entries": entries, "bytes": size}
@@ -1,23 +1,27 @@
+import hashlib
 import uuid
 
 def generate_random_id():
     return str(uuid.uuid4())
 
-# 在当前目录下，创建一个临时文件夹
+# 由源文件、时间窗口和文本内容生成确定的文本段ID，重复处理同一文件时ID不变
+def segment_id(src_file, start, end, text):
+    text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    key = f"{src_file}\x00{start:.3f}\x00{end:.3f}\x00{text_hash}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+# 在当前目录的tmp下，为每个任务创建独立的临时文件夹
 def create_temp_folder():
     import os
-    temp_dir = "tmp"
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    return temp_dir 
-
+    import tempfile
+    root_dir = "tmp"
+    os.makedirs(root_dir, exist_ok=True)
+    return tempfile.mkdtemp(dir=root_dir)
 
-# def create_temp_folder():
-#     import tempfile
-#     temp_dir = tempfile.mkdtemp(dir=".")
-#     return temp_dir
-
-# 删除临时文件夹
+# 删除临时文件夹，只删除单个任务的目录，不会删除共享的tmp根目录
 def delete_temp_folder(temp_dir):
+    import os
     import shutil
+    if os.path.abspath(temp_dir) == os.path.abspath("tmp"):
+        return
     shutil.rmtree(temp_dir, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,186 @@
+import bisect
+import importlib.util
+
+import numpy as np
+
+from video_edit import SAMPLE_RATE
+
+
+class EnergyVAD:
+    """
+    Energy-based voice activity detection.
+
+    Frames whose RMS level is `margin_db` above the estimated noise floor (and above
+    `min_db` dBFS) are speech. Short gaps are bridged, short bursts are dropped and
+    every region is padded so word onsets are not cut off.
+    """
+
+    def __init__(self, frame_ms=30, margin_db=12.0, min_db=-50.0, min_speech_s=0.25, min_silence_s=0.5, pad_s=0.2):
+        self.frame_ms = frame_ms
+        self.margin_db = margin_db
+        self.min_db = min_db
+        self.min_speech_s = min_speech_s
+        self.min_silence_s = min_silence_s
+        self.pad_s = pad_s
+
+    def __call__(self, audio, sample_rate=SAMPLE_RATE):
+        """
+        Return speech regions as a list of (start_seconds, end_seconds).
+        """
+        frame = int(sample_rate * self.frame_ms / 1000)
+        n_frames = len(audio) // frame
+        if n_frames == 0:
+            return []
+
+        # 分块计算每帧能量，避免为长音频复制一份完整数据
+        levels = np.empty(n_frames, dtype=np.float32)
+        block = 10000
+        for i in range(0, n_frames, block):
+            frames = audio[i * frame:min(i + block, n_frames) * frame].reshape(-1, frame)
+            rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-12)
+            levels[i:i + len(frames)] = 20 * np.log10(rms)
+
+        noise_floor = np.percentile(levels, 10)
+        threshold = max(noise_floor + self.margin_db, self.min_db)
+        is_speech = levels > threshold
+
+        # 找出连续的语音帧区间
+        edges = np.diff(is_speech.astype(np.int8), prepend=0, append=0)
+        starts = np.nonzero(edges == 1)[0]
+        ends = np.nonzero(edges == -1)[0]
+
+        frame_s = frame / sample_rate
+        regions = []
+        for start, end in zip((starts * frame_s).tolist(), (ends * frame_s).tolist()):
+            if regions and start - regions[-1][1] < self.min_silence_s:
+                regions[-1][1] = end
+            else:
+                regions.append([start, end])
+
+        duration = len(audio) / sample_rate
+        speech = []
+        for start, end in regions:
+            if end - start < self.min_speech_s:
+                continue
+            start, end = max(0.0, start - self.pad_s), min(duration, end + self.pad_s)
+            if speech and start <= speech[-1][1]:
+                speech[-1] = (speech[-1][0], end)
+            else:
+                speech.append((start, end))
+        return speech
+
+
+class SileroVAD:
+    """
+    Voice activity detection with the silero-vad model (requires `silero-vad`).
+    Better than the energy detector at rejecting music and background noise.
+    """
+
+    def __init__(self, threshold=0.5, min_silence_s=0.5, pad_s=0.2):
+        from silero_vad import load_silero_vad
+
+        self.model = load_silero_vad()
+        self.threshold = threshold
+        self.min_silence_s = min_silence_s
+        self.pad_s = pad_s
+
+    def __call__(self, audio, sample_rate=SAMPLE_RATE):
+        import torch
+        from silero_vad import get_speech_timestamps
+
+        timestamps = get_speech_timestamps(
+            torch.from_numpy(np.ascontiguousarray(audio)),
+            self.model,
+            threshold=self.threshold,
+            sampling_rate=sample_rate,
+            min_silence_duration_ms=int(self.min_silence_s * 1000),
+            speech_pad_ms=int(self.pad_s * 1000),
+            return_seconds=True,
+        )
+        return [(t["start"], t["end"]) for t in timestamps]
+
+
+def resolve_backend(backend):
+    """
+    The VAD backend get_vad() will use for a configured one, without loading any model:
+    None when off, and "energy" for "silero" when silero-vad is not installed.
+    """
+    if backend in (None, "", "off"):
+        return None
+    if backend not in ("energy", "silero"):
+        raise ValueError(f"Unknown VAD backend: {backend}")
+    if backend == "silero" and importlib.util.find_spec("silero_vad") is None:
+        return "energy"
+    return backend
+
+
+def get_vad(backend):
+    """
+    Create a VAD for the given backend name: "off", "energy" or "silero".
+    """
+    backend = resolve_backend(backend)
+    if backend is None:
+        return None
+    if backend == "energy":
+        return EnergyVAD()
+    if backend == "silero":
+        try:
+            return SileroVAD()
+        except ImportError:
+            print("silero-vad 未安装，使用基于能量的VAD")
+            return EnergyVAD()
+
+
+def compact_speech(audio, regions, gap_s=0.3, sample_rate=SAMPLE_RATE):
+    """
+    Concatenate the speech regions of `audio`, separated by `gap_s` of silence.
+    Returns (compact_audio, mapping) where mapping is a list of
+    (compact_start, original_start, length) in seconds, used by `remap_chunks`.
+    """
+    gap = np.zeros(int(gap_s * sample_rate), dtype=np.float32)
+    pieces, mapping = [], []
+    position = 0.0
+    for start, end in regions:
+        samples = audio[int(start * sample_rate):int(end * sample_rate)]
+        if len(samples) == 0:
+            continue
+        if pieces:
+            pieces.append(gap)
+            position += gap_s
+        pieces.append(samples)
+        length = len(samples) / sample_rate
+        mapping.append((position, start, length))
+        position += length
+    if not pieces:
+        return np.zeros(0, dtype=np.float32), []
+    return np.concatenate(pieces), mapping
+
+
+def remap_chunks(chunks, mapping):
+    """
+    Move chunk timestamps from the compacted audio back onto the original timeline.
+    Times inside the inserted gaps snap to the end of the previous region. A missing
+    end (whisper's last chunk often has none) becomes the end of the start's region.
+    """
+    if not mapping:
+        return chunks
+    compact_starts = [m[0] for m in mapping]
+
+    def region(t):
+        return mapping[max(bisect.bisect_right(compact_starts, t) - 1, 0)]
+
+    def to_original(t):
+        compact_start, original_start, length = region(t)
+        return round(float(original_start + min(max(t - compact_start, 0.0), length)), 2)
+
+    remapped = []
+    for chunk in chunks:
+        start, end = chunk["timestamp"]
+        if end is None and start is not None:
+            _, original_start, length = region(start)
+            end = round(float(original_start + length), 2)
+        elif end is not None:
+            end = to_original(end)
+        start = to_original(start) if start is not None else None
+        remapped.append({"text": chunk["text"], "timestamp": (start, end)})
+    return remapped
@@ -0,0 +1,711 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+import config
+from exact_search import top_k_indices, score_to_distance
+from vstore import MyEmbeddingFunction
+
+SPACES = ("l2", "ip", "cosine")
+# Chroma集合可以设置的HNSW参数
+HNSW_PARAMS = ("M", "construction_ef", "search_ef")
+VECTOR_STORE_BACKENDS = ("chroma", "mmap")
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# 每个字节中1的个数，用于计算汉明距离
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def quantize_int8(vectors):
+    """
+    Per-vector symmetric int8 quantization. Returns (codes, norms) where norms holds
+    each row's scale and exact squared norm.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    norms = np.stack([scales, np.einsum("ij,ij->i", vectors, vectors)], axis=1).astype(np.float32)
+    return codes, norms
+
+
+def quantize_binary(vectors):
+    """
+    Sign-bit quantization packed into bytes (one bit per dimension).
+    """
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+class VectorStore:
+    """
+    Storage of one index's segment embeddings, documents and metadata.
+
+    Distances follow Chroma's convention: smaller is closer, measured in the
+    store's `space` ("l2" squared distance, "ip" or "cosine" as 1 - similarity).
+    """
+
+    space = "l2"
+    # 索引使用的向量维度（Matryoshka截断），None表示模型的完整维度
+    embedding_dim = None
+
+    def add(self, ids, embeddings, documents, metadatas):
+        """Add segments. Existing segments with the same id are replaced."""
+        raise NotImplementedError
+
+    def delete(self, ids=None, src_file=None):
+        """Delete segments by id or by source file."""
+        raise NotImplementedError
+
+    def query(self, query_embedding, n_results, video_paths=None, contains=None):
+        """
+        Nearest segments to `query_embedding`, optionally restricted to some source files
+        and to documents containing every string in `contains`. Without an embedding the
+        first matching segments are returned and distances are None.
+        Returns (ids, documents, metadatas, distances).
+        """
+        raise NotImplementedError
+
+    def get(self, ids=None, src_file=None, limit=None, offset=0, include_embeddings=False):
+        """
+        Fetch stored segments. Returns a dict with "ids", "documents", "metadatas"
+        and, if requested, "embeddings".
+        """
+        raise NotImplementedError
+
+    def segment_ids(self, src_file):
+        """Ids of the stored segments of one source file."""
+        return self.get(src_file=src_file)["ids"]
+
+    def count(self):
+        raise NotImplementedError
+
+    def drop(self):
+        """Delete all data of the store."""
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """
+    Vector store backed by a Chroma collection (HNSW graph kept in memory).
+    """
+
+    def __init__(self, client, name, embedding_dim=None, space=None, hnsw=None):
+        self.client = client
+        self.name = name
+        self.embedding_dim = embedding_dim
+        self.create_space = space
+        self.hnsw = hnsw or {}
+        self._collection = None
+
+    @property
+    def space(self):
+        return (self._get_collection().metadata or {}).get("hnsw:space", "l2")
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self._get_collection(create=True).upsert(
+            ids=ids,
+            embeddings=[list(map(float, e)) for e in embeddings],
+            documents=documents,
+            metadatas=metadatas
+        )
+
+    def delete(self, ids=None, src_file=None):
+        where = {"src_file": src_file} if src_file is not None else None
+        self._get_collection().delete(ids=ids, where=where)
+
+    def query(self, query_embedding, n_results, video_paths=None, contains=None):
+        where, where_document = None, None
+        if contains:
+            if len(contains) == 1:
+                where_document = {"$contains": contains[0]}
+            else:
+                where_document = {
+                    "$and": [
+                        {"$contains": keyword} for keyword in contains
+                    ]
+                }
+        if video_paths is not None:
+            where = {"src_file": {"$in": video_paths}}
+
+        collection = self._get_collection()
+        if query_embedding is None:
+            results = collection.get(where=where, where_document=where_document, limit=n_results)
+            return results["ids"], results["documents"], results["metadatas"], None
+
+        results = collection.query(
+            query_embeddings=[list(map(float, query_embedding))],
+            n_results=n_results,
+            where=where,
+            where_document=where_document
+        )
+        return results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+
+    def get(self, ids=None, src_file=None, limit=None, offset=0, include_embeddings=False):
+        where = {"src_file": src_file} if src_file is not None else None
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        results = self._get_collection().get(ids=ids, where=where, limit=limit, offset=offset or None, include=include)
+        return {key: results[key] for key in ["ids"] + include}
+
+    def segment_ids(self, src_file):
+        # 只取ID，不读取文档和元数据；集合还不存在时先创建
+        return self._get_collection(create=True).get(where={"src_file": src_file}, include=[])["ids"]
+
+    def count(self):
+        return self._get_collection().count()
+
+    def drop(self):
+        self.client.delete_collection(name=self.name)
+        self._collection = None
+
+    def _create_metadata(self):
+        # 距离和HNSW参数只能在创建集合时设置；向量维度也记录在元数据中，防止用不同维度的向量写入或查询
+        metadata = {f"hnsw:{name}": value for name, value in self.hnsw.items()}
+        if self.create_space:
+            metadata["hnsw:space"] = self.create_space
+        if self.embedding_dim:
+            metadata["embedding_dim"] = self.embedding_dim
+        return metadata or None
+
+    def _get_collection(self, create=False):
+        if self._collection is None:
+            if create:
+                self._collection = self.client.get_or_create_collection(
+                    name=self.name, embedding_function=MyEmbeddingFunction(), metadata=self._create_metadata()
+                )
+            else:
+                self._collection = self.client.get_collection(name=self.name, embedding_function=MyEmbeddingFunction())
+            recorded = (self._collection.metadata or {}).get("embedding_dim")
+            if recorded and self.embedding_dim and recorded != self.embedding_dim:
+                raise ValueError(f"Collection {self.name} uses {recorded}-d embeddings, index settings say {self.embedding_dim}")
+        return self._collection
+
+
+class _Shard:
+    """
+    One immutable batch of segments: a float32 .npy matrix opened with mmap, its
+    ids/documents/metadata and, once IVF is trained, the coarse list of every row.
+    Everything is loaded lazily so opening a store touches almost no data.
+    """
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.name = name
+        self._matrix = None
+        self._meta = None
+        self._sq_norms = None
+        self._src_files = None
+        self._lists = None
+        self._codes = None
+
+    def path(self, suffix):
+        return os.path.join(self.directory, self.name + suffix)
+
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            self._matrix = np.load(self.path(".npy"), mmap_mode="r")
+        return self._matrix
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            with open(self.path(".json"), "r", encoding="utf-8") as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    @property
+    def sq_norms(self):
+        if self._sq_norms is None:
+            matrix = self.matrix
+            self._sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+        return self._sq_norms
+
+    @property
+    def src_files(self):
+        if self._src_files is None:
+            self._src_files = np.array([m.get("src_file", "") for m in self.meta["metadatas"]], dtype=object)
+        return self._src_files
+
+    @property
+    def lists(self):
+        if self._lists is None and os.path.exists(self.path(".ivf.npy")):
+            self._lists = np.load(self.path(".ivf.npy"), mmap_mode="r")
+        return self._lists
+
+    def __len__(self):
+        return len(self.matrix)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Vector store kept in memory-mapped .npy shards under one directory per index.
+
+    Every `add` writes a new shard; deletes are recorded as tombstones in the
+    manifest and shards are rewritten once more than half of their rows are dead.
+    Vectors are paged in by the OS on demand, so an open store costs little memory.
+    With `ivf_lists` > 0 a k-means coarse quantizer is trained once the store has
+    enough vectors, and queries only scan the `nprobe` closest lists.
+
+    With `quantization` "int8" or "binary" the first pass scores compact codes kept in
+    memory (4x / 32x smaller than float32), and only the best `rescore` candidates are
+    rescored with the full-precision vectors read from the mmap.
+    """
+
+    def __init__(self, directory, space="l2", ivf_lists=0, nprobe=8, quantization="none", rescore=200,
+                 embedding_dim=None):
+        if space not in SPACES:
+            raise ValueError(f"Unknown space: {space}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.directory = directory
+        self.quantization = quantization
+        self.rescore = rescore
+        self.embedding_dim = embedding_dim
+        self.ivf_lists = ivf_lists
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._locations = None
+        self._centroids = None
+
+        manifest_path = os.path.join(directory, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+        else:
+            self._manifest = {"space": space, "dim": None, "shards": [], "next_shard": 0, "deleted": {}}
+        self.space = self._manifest["space"]
+        if embedding_dim and self._manifest["dim"] and self._manifest["dim"] != embedding_dim:
+            raise ValueError(f"Store {directory} uses {self._manifest['dim']}-d embeddings, index settings say {embedding_dim}")
+        self._shards = [_Shard(directory, name) for name in self._manifest["shards"]]
+        self._deleted = {
+            name: self._deleted_mask(name, rows) for name, rows in self._manifest["deleted"].items()
+        }
+        centroids_path = os.path.join(directory, "centroids.npy")
+        if os.path.exists(centroids_path):
+            self._centroids = np.load(centroids_path)
+
+    def add(self, ids, embeddings, documents, metadatas):
+        vectors = self._prepare(embeddings)
+        if len(vectors) != len(ids):
+            raise ValueError("ids and embeddings have different lengths")
+        if len(vectors) == 0:
+            return
+        if self.embedding_dim and vectors.shape[1] != self.embedding_dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the index setting ({self.embedding_dim})")
+        with self._lock:
+            if self._manifest["dim"] is None:
+                self._manifest["dim"] = vectors.shape[1]
+            elif vectors.shape[1] != self._manifest["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self._manifest['dim']})")
+
+            os.makedirs(self.directory, exist_ok=True)
+            shard = self._write_shard(vectors, {"ids": ids, "documents": documents, "metadatas": metadatas})
+
+            # 相同ID的旧数据标记为删除
+            locations = self._load_locations()
+            replaced = [locations.pop(segment_id) for segment_id in ids if segment_id in locations]
+            for row, segment_id in enumerate(ids):
+                locations[segment_id] = (shard.name, row)
+            self._shards.append(shard)
+            self._manifest["shards"].append(shard.name)
+            self._mark_deleted(replaced)
+            self._save_manifest()
+
+            if self.ivf_lists and self._centroids is None and self._live_count() >= self.ivf_lists * 39:
+                self._train_ivf()
+
+    def delete(self, ids=None, src_file=None):
+        with self._lock:
+            locations = self._load_locations()
+            targets = set(ids or [])
+            if src_file is not None:
+                for shard in self._shards:
+                    targets.update(
+                        segment_id for segment_id, metadata in zip(shard.meta["ids"], shard.meta["metadatas"])
+                        if metadata.get("src_file") == src_file
+                    )
+            removed = [locations.pop(segment_id) for segment_id in targets if segment_id in locations]
+            if not removed:
+                return
+            self._mark_deleted(removed)
+            retired = self._compact()
+            self._save_manifest()
+            # 清单更新后再删除被重写的分片文件
+            for shard in retired:
+                for suffix in (".npy", ".json", ".ivf.npy", ".binary.npy", ".int8.npy", ".int8norm.npy"):
+                    try:
+                        os.remove(shard.path(suffix))
+                    except OSError:
+                        pass
+
+    def query(self, query_embedding, n_results, video_paths=None, contains=None):
+        with self._lock:
+            shards = list(self._shards)
+            deleted = dict(self._deleted)
+            centroids = self._centroids
+
+        if query_embedding is None:
+            results = self._scan(shards, deleted, video_paths, contains, limit=n_results)
+            return results["ids"], results["documents"], results["metadatas"], None
+
+        query = self._prepare([query_embedding])[0]
+        probe = None
+        if centroids is not None:
+            probe = top_k_indices(-self._centroid_distances(query[None, :], centroids)[0], self.nprobe)
+
+        if self.quantization != "none":
+            return self._quantized_query(shards, deleted, query, n_results, video_paths, contains, probe)
+
+        candidates = []
+        for shard in shards:
+            rows = self._candidate_rows(shard, deleted.get(shard.name), video_paths, contains, probe)
+            if rows is not None and len(rows) == 0:
+                continue
+            vectors = shard.matrix if rows is None else shard.matrix[rows]
+            scores = vectors @ query
+            if self.space == "l2":
+                sq_norms = shard.sq_norms if rows is None else shard.sq_norms[rows]
+                scores = 2 * scores - sq_norms - query @ query
+            best = top_k_indices(scores, n_results)
+            for i in best.tolist():
+                candidates.append((float(scores[i]), shard, i if rows is None else int(rows[i])))
+
+        return self._top_hits(candidates, n_results)
+
+    def _top_hits(self, candidates, n_results):
+        # candidates 为 (精确分数, 分片, 行号)
+        if not candidates:
+            return [], [], [], []
+        order = top_k_indices(np.array([c[0] for c in candidates]), n_results).tolist()
+        hits = [candidates[i] for i in order]
+        metric = "ip" if self.space == "cosine" else self.space
+        distances = score_to_distance(metric, np.array([score for score, _, _ in hits])).tolist()
+        return (
+            [shard.meta["ids"][row] for _, shard, row in hits],
+            [shard.meta["documents"][row] for _, shard, row in hits],
+            [shard.meta["metadatas"][row] for _, shard, row in hits],
+            distances,
+        )
+
+    def _quantized_query(self, shards, deleted, query, n_results, video_paths, contains, probe):
+        """
+        First pass over the quantized codes, then exact rescoring of the best candidates.
+        """
+        depth = max(self.rescore, n_results)
+        query_bits = quantize_binary(query[None, :])[0] if self.quantization == "binary" else None
+        approximate = []
+        for shard in shards:
+            rows = self._candidate_rows(shard, deleted.get(shard.name), video_paths, contains, probe)
+            if rows is not None and len(rows) == 0:
+                continue
+            codes = self._shard_codes(shard)
+            if self.quantization == "binary":
+                selected = codes if rows is None else codes[rows]
+                scores = -_POPCOUNT[np.bitwise_xor(selected, query_bits)].sum(axis=1, dtype=np.int32).astype(np.float32)
+            else:
+                int8_codes, norms = codes
+                if rows is not None:
+                    int8_codes, norms = int8_codes[rows], norms[rows]
+                scores = np.empty(len(int8_codes), dtype=np.float32)
+                for start in range(0, len(int8_codes), 65536):
+                    block = int8_codes[start:start + 65536].astype(np.float32)
+                    scores[start:start + len(block)] = block @ query
+                scores *= norms[:, 0]
+                if self.space == "l2":
+                    scores = 2 * scores - norms[:, 1] - query @ query
+            for i in top_k_indices(scores, depth).tolist():
+                approximate.append((float(scores[i]), shard, i if rows is None else int(rows[i])))
+
+        # 用全精度向量重新计算候选的分数，只会读入这些行
+        order = top_k_indices(np.array([c[0] for c in approximate]), depth).tolist() if approximate else []
+        by_shard = {}
+        for i in order:
+            _, shard, row = approximate[i]
+            by_shard.setdefault(shard.name, (shard, []))[1].append(row)
+        candidates = []
+        for shard, rows in by_shard.values():
+            rows = np.sort(np.array(rows))
+            vectors = shard.matrix[rows]
+            scores = vectors @ query
+            if self.space == "l2":
+                scores = 2 * scores - np.einsum("ij,ij->i", vectors, vectors) - query @ query
+            candidates.extend((float(score), shard, int(row)) for score, row in zip(scores, rows))
+        return self._top_hits(candidates, n_results)
+
+    def _shard_codes(self, shard):
+        # 量化后的数据常驻内存；旧分片没有量化文件时在第一次查询时生成
+        if shard._codes is None:
+            if self.quantization == "binary":
+                path = shard.path(".binary.npy")
+                if not os.path.exists(path):
+                    self._atomic_save(path, quantize_binary(shard.matrix))
+                shard._codes = np.load(path)
+            else:
+                paths = shard.path(".int8.npy"), shard.path(".int8norm.npy")
+                if not all(os.path.exists(path) for path in paths):
+                    for path, array in zip(paths, quantize_int8(shard.matrix)):
+                        self._atomic_save(path, array)
+                shard._codes = tuple(np.load(path) for path in paths)
+        return shard._codes
+
+    def get(self, ids=None, src_file=None, limit=None, offset=0, include_embeddings=False):
+        with self._lock:
+            shards = list(self._shards)
+            deleted = dict(self._deleted)
+            if ids is not None:
+                locations = self._load_locations()
+                wanted = [locations[segment_id] for segment_id in ids if segment_id in locations]
+
+        if ids is None:
+            return self._scan(shards, deleted, [src_file] if src_file is not None else None, None,
+                              limit=limit, offset=offset, include_embeddings=include_embeddings)
+
+        by_name = {shard.name: shard for shard in shards}
+        results = {"ids": [], "documents": [], "metadatas": []}
+        if include_embeddings:
+            results["embeddings"] = []
+        for name, row in wanted[offset:offset + limit if limit is not None else None]:
+            shard = by_name[name]
+            if src_file is not None and shard.src_files[row] != src_file:
+                continue
+            self._append_row(results, shard, row, include_embeddings)
+        return results
+
+    def count(self):
+        with self._lock:
+            return self._live_count()
+
+    def drop(self):
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._shards = []
+            self._deleted = {}
+            self._locations = {}
+            self._centroids = None
+            self._manifest = {"space": self.space, "dim": None, "shards": [], "next_shard": 0, "deleted": {}}
+
+    def train_ivf(self, lists=None):
+        """
+        Train (or retrain) the IVF coarse quantizer on the stored vectors.
+        """
+        with self._lock:
+            if lists is not None:
+                self.ivf_lists = lists
+            self._train_ivf()
+
+    def _prepare(self, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            vectors = vectors.reshape(len(vectors), -1)
+        # 余弦距离：保存归一化后的向量，查询时直接使用内积
+        if self.space == "cosine":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return np.ascontiguousarray(vectors)
+
+    def _candidate_rows(self, shard, deleted, video_paths, contains, probe):
+        # 返回需要计算的行号，None表示整个分片
+        mask = None
+        if deleted is not None:
+            mask = ~deleted
+        if video_paths is not None:
+            in_paths = np.isin(shard.src_files, video_paths)
+            mask = in_paths if mask is None else mask & in_paths
+        if contains:
+            has_text = np.array(
+                [all(keyword in document for keyword in contains) for document in shard.meta["documents"]], dtype=bool
+            )
+            mask = has_text if mask is None else mask & has_text
+        if probe is not None and shard.lists is not None:
+            in_lists = np.isin(shard.lists, probe)
+            mask = in_lists if mask is None else mask & in_lists
+        if mask is None:
+            return None
+        return np.nonzero(mask)[0]
+
+    def _scan(self, shards, deleted, video_paths, contains, limit=None, offset=0, include_embeddings=False):
+        results = {"ids": [], "documents": [], "metadatas": []}
+        if include_embeddings:
+            results["embeddings"] = []
+        skipped = 0
+        for shard in shards:
+            rows = self._candidate_rows(shard, deleted.get(shard.name), video_paths, contains, None)
+            for row in (range(len(shard)) if rows is None else rows.tolist()):
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                if limit is not None and len(results["ids"]) >= limit:
+                    return results
+                self._append_row(results, shard, row, include_embeddings)
+        return results
+
+    def _append_row(self, results, shard, row, include_embeddings):
+        results["ids"].append(shard.meta["ids"][row])
+        results["documents"].append(shard.meta["documents"][row])
+        results["metadatas"].append(shard.meta["metadatas"][row])
+        if include_embeddings:
+            results["embeddings"].append(np.array(shard.matrix[row]))
+
+    def _write_shard(self, vectors, meta, name=None):
+        # 调用方持有 _lock；先写数据文件，最后更新清单，中途退出只会留下未引用的文件
+        if name is None:
+            name = f"shard-{self._manifest['next_shard']:05d}"
+            self._manifest["next_shard"] += 1
+        shard = _Shard(self.directory, name)
+        self._atomic_save(shard.path(".npy"), vectors)
+        with open(shard.path(".json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(shard.path(".json.tmp"), shard.path(".json"))
+        if self._centroids is not None:
+            self._atomic_save(shard.path(".ivf.npy"), self._assign_lists(vectors))
+        if self.quantization == "binary":
+            self._atomic_save(shard.path(".binary.npy"), quantize_binary(vectors))
+        elif self.quantization == "int8":
+            for suffix, array in zip((".int8.npy", ".int8norm.npy"), quantize_int8(vectors)):
+                self._atomic_save(shard.path(suffix), array)
+        return shard
+
+    def _atomic_save(self, path, array):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+
+    def _save_manifest(self):
+        self._manifest["deleted"] = {
+            name: np.nonzero(mask)[0].tolist() for name, mask in self._deleted.items() if mask.any()
+        }
+        path = os.path.join(self.directory, "manifest.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def _load_locations(self):
+        # 调用方持有 _lock；ID到(分片, 行号)的映射，第一次增删时才建立
+        if self._locations is None:
+            locations = {}
+            for shard in self._shards:
+                mask = self._deleted.get(shard.name)
+                for row, segment_id in enumerate(shard.meta["ids"]):
+                    if mask is None or not mask[row]:
+                        locations[segment_id] = (shard.name, row)
+            self._locations = locations
+        return self._locations
+
+    def _deleted_mask(self, name, rows):
+        mask = np.zeros(len(_Shard(self.directory, name)), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def _mark_deleted(self, locations):
+        # 查询线程持有旧的删除标记，这里替换而不是原地修改
+        by_shard = {}
+        for name, row in locations:
+            by_shard.setdefault(name, []).append(row)
+        for name, rows in by_shard.items():
+            mask = self._deleted.get(name)
+            mask = np.zeros(len(_Shard(self.directory, name)), dtype=bool) if mask is None else mask.copy()
+            mask[rows] = True
+            self._deleted[name] = mask
+
+    def _live_count(self):
+        return sum(len(shard) - int(self._deleted[shard.name].sum()) if shard.name in self._deleted else len(shard)
+                   for shard in self._shards)
+
+    def _compact(self):
+        # 调用方持有 _lock；删除超过一半的分片重写为只包含有效数据的新分片，返回被替换的分片
+        shards, retired = [], []
+        for shard in self._shards:
+            mask = self._deleted.get(shard.name)
+            if mask is None or mask.sum() * 2 <= len(mask):
+                shards.append(shard)
+                continue
+            live = np.nonzero(~mask)[0]
+            if len(live):
+                meta = {key: [shard.meta[key][row] for row in live.tolist()] for key in ("ids", "documents", "metadatas")}
+                new_shard = self._write_shard(np.ascontiguousarray(shard.matrix[live]), meta)
+                shards.append(new_shard)
+                if self._locations is not None:
+                    for row, segment_id in enumerate(meta["ids"]):
+                        self._locations[segment_id] = (new_shard.name, row)
+            del self._deleted[shard.name]
+            retired.append(shard)
+        self._shards = shards
+        self._manifest["shards"] = [shard.name for shard in shards]
+        return retired
+
+    def _train_ivf(self):
+        # 调用方持有 _lock；从有效向量中采样训练k-means粗量化器，再为每个分片分配列表
+        live = []
+        for shard in self._shards:
+            mask = self._deleted.get(shard.name)
+            rows = np.arange(len(shard)) if mask is None else np.nonzero(~mask)[0]
+            live.append((shard, rows))
+        total = sum(len(rows) for _, rows in live)
+        if total < self.ivf_lists:
+            return
+        rng = np.random.default_rng(0)
+        sample_size = min(total, max(self.ivf_lists * 256, 10000))
+        picks = np.sort(rng.choice(total, size=sample_size, replace=False))
+        sample, start = [], 0
+        for shard, rows in live:
+            selected = picks[(picks >= start) & (picks < start + len(rows))] - start
+            if len(selected):
+                sample.append(np.asarray(shard.matrix[rows[selected]]))
+            start += len(rows)
+        sample = np.concatenate(sample)
+        print(f"训练IVF粗量化器: {self.ivf_lists} 个列表, {len(sample)} 个样本")
+
+        centroids = sample[rng.choice(len(sample), size=self.ivf_lists, replace=False)].copy()
+        for _ in range(config.MMAP_IVF_ITERATIONS):
+            assign = self._assign_lists(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=len(centroids))
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+        self._centroids = centroids
+        for shard in self._shards:
+            self._atomic_save(shard.path(".ivf.npy"), self._assign_lists(shard.matrix))
+            shard._lists = None
+        self._atomic_save(os.path.join(self.directory, "centroids.npy"), centroids)
+
+    def _centroid_distances(self, vectors, centroids):
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        return c_norms[None, :] - 2 * (vectors @ centroids.T)
+
+    def _assign_lists(self, vectors, centroids=None, block_rows=65536):
+        centroids = self._centroids if centroids is None else centroids
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_rows):
+            block = np.asarray(vectors[start:start + block_rows])
+            lists[start:start + len(block)] = np.argmin(self._centroid_distances(block, centroids), axis=1)
+        return lists
+
+
+def open_vector_store(index_id, settings, chroma_client):
+    """
+    Open the vector store of an index according to its settings (see Database.get_index_settings).
+    """
+    backend = settings.get("backend", "chroma")
+    if backend == "chroma":
+        return ChromaVectorStore(
+            chroma_client,
+            settings.get("collection", index_id),
+            embedding_dim=settings.get("embedding_dim"),
+            space=settings.get("space"),
+            hnsw=settings.get("hnsw"),
+        )
+    if backend == "mmap":
+        return MmapVectorStore(
+            os.path.join(config.MMAP_STORE_DIR, settings.get("collection", index_id)),
+            space=settings.get("space", "l2"),
+            ivf_lists=settings.get("ivf_lists", config.MMAP_IVF_LISTS),
+            nprobe=config.MMAP_IVF_NPROBE,
+            quantization=settings.get("quantization", "none"),
+            rescore=config.MMAP_RESCORE_CANDIDATES,
+            embedding_dim=settings.get("embedding_dim"),
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
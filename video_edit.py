@@ -1,16 +1,150 @@
+import re
+import subprocess
+
+import numpy as np
 from moviepy import VideoFileClip
 
+# whisper 模型使用的采样率
+SAMPLE_RATE = 16000
+
+
+def get_ffmpeg_exe():
+    """
+    Get the ffmpeg executable, preferring the one bundled with moviepy (imageio-ffmpeg).
+    """
+    try:
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        return "ffmpeg"
+
+
+def load_audio(video_path, sample_rate=SAMPLE_RATE):
+    """
+    Decode the audio track of a video file into a mono float32 NumPy array,
+    piping raw samples from ffmpeg without writing anything to disk.
+    """
+    cmd = [
+        get_ffmpeg_exe(),
+        "-nostdin",
+        "-threads", "0",
+        "-i", video_path,
+        "-vn",
+        "-f", "f32le",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "-",
+    ]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        stderr = proc.stderr.decode("utf-8", errors="ignore").strip().splitlines()
+        raise RuntimeError(f"ffmpeg 解码音频失败: {stderr[-1] if stderr else proc.returncode}")
+    return np.frombuffer(proc.stdout, dtype=np.float32)
+
+
+def probe_duration(media_path):
+    """
+    Read the duration of a media file in seconds from ffmpeg's header output.
+    Returns None if it cannot be determined.
+    """
+    proc = subprocess.run(
+        [get_ffmpeg_exe(), "-nostdin", "-hide_banner", "-i", media_path],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    match = re.search(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", proc.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def stream_audio(video_path, block_s=30, sample_rate=SAMPLE_RATE):
+    """
+    Decode the audio track of a video file block by block, yielding float32 arrays
+    of at most `block_s` seconds, so long files never have to be held in memory.
+    """
+    cmd = [
+        get_ffmpeg_exe(),
+        "-nostdin",
+        "-loglevel", "error",
+        "-i", video_path,
+        "-vn",
+        "-f", "f32le",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "-",
+    ]
+    block_bytes = int(block_s * sample_rate) * 4
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finished = False
+    try:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=np.float32)
+        finished = True
+    finally:
+        proc.stdout.close()
+        # 只在提前停止读取时结束ffmpeg；正常读完时ffmpeg可能已关闭输出但尚未退出
+        if not finished and proc.poll() is None:
+            proc.kill()
+        stderr = proc.stderr.read().decode("utf-8", errors="ignore").strip()
+        proc.stderr.close()
+        returncode = proc.wait()
+    if finished and returncode != 0:
+        raise RuntimeError(f"ffmpeg 解码音频失败: {stderr.splitlines()[-1] if stderr else returncode}")
+
+
+def iter_audio_windows(audio, window_s, stride_s, sample_rate=SAMPLE_RATE):
+    """
+    Split audio into fixed windows that overlap by `stride_s` seconds.
+
+    `audio` is either a float32 NumPy array (windows are views, nothing is copied)
+    or a path that is streamed from ffmpeg (only about one window is buffered).
+    Yields (offset_seconds, samples, is_last).
+    """
+    window = int(window_s * sample_rate)
+    step = window - int(stride_s * sample_rate)
+    if step <= 0:
+        raise ValueError("stride must be shorter than the window")
+
+    if isinstance(audio, np.ndarray):
+        offset = 0
+        while len(audio) - offset > window:
+            yield offset / sample_rate, audio[offset:offset + window], False
+            offset += step
+        if len(audio) > offset:
+            yield offset / sample_rate, audio[offset:], True
+        return
+
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0
+    for block in stream_audio(audio, block_s=window_s, sample_rate=sample_rate):
+        buffer = np.concatenate([buffer, block])
+        while len(buffer) > window:
+            yield offset / sample_rate, buffer[:window], False
+            buffer = buffer[step:]
+            offset += step
+    if len(buffer) > 0:
+        yield offset / sample_rate, buffer, True
+
 
-def convert_video_to_audio(video_path, audio_path):
+def convert_video_to_audio(video_path, audio_path, sample_rate=SAMPLE_RATE):
     """
     Convert video file to audio file.
     """
     video = VideoFileClip(video_path)
-    audio = video.audio
-    audio.write_audiofile(audio_path)
+    try:
+        audio = video.audio
+        audio.write_audiofile(audio_path, fps=sample_rate)
+    finally:
+        video.close()
 
 if __name__ == "__main__":
     video_path = "example_video.mp4"  # Replace with your video file path
     audio_path = "output_audio.wav"  # Desired output audio file path
     convert_video_to_audio(video_path, audio_path)
-    print(f"Audio extracted to: {audio_path}")
\ No newline at end of file
+    print(f"Audio extracted to: {audio_path}")
@@ -1,132 +1,517 @@
 import chromadb
-from vstore import MyEmbeddingFunction
-from video_edit import convert_video_to_audio
-from utils import create_temp_folder, delete_temp_folder
-from wishper import slow_asr, ASR
-from preprocess import preprocess
+from vector_store import open_vector_store
+from retrieve import embed, truncate_embeddings
+from video_edit import convert_video_to_audio, load_audio, SAMPLE_RATE
+from utils import create_temp_folder, delete_temp_folder, generate_random_id
+from wishper import transcript_settings
+from model_manager import asr_manager
+from query_embedder import query_embedder
+from exact_search import ExactSearchIndex, score_to_distance
+from transcript_cache import TranscriptCache
+from transcript_store import TranscriptStore
+from search_cache import SearchResultCache
+from preprocess import preprocess_chunks
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from database import db, IndexStatus
+from ingest_pipeline import IngestPipeline, IngestTask
+import config
+
+SEARCH_MODES = ("vector", "lexical", "hybrid")
 
 class VideoSpeechContentSearcher():
     chroma_client = None
-    asr_model = None
     
-    def __init__(self):
+    def __init__(self, decode_processes=0):
+        """
+        decode_processes: decode audio in a pool of this many processes (one decode
+        thread per process feeds it); 0 decodes in the pipeline's decode threads.
+        """
         self.chroma_client = chromadb.PersistentClient(path="chroma.db")
+        self._stores = {}
+        self._stores_lock = threading.Lock()
+        self._write_locks = {}
+        self._rebuilds = {}
+        # 与模型管理器加载的 ASR() 使用相同的默认参数，不需要加载模型
+        self.asr_settings = transcript_settings()
+        self.transcript_cache = TranscriptCache(
+            config.TRANSCRIPT_CACHE_DIR, max_bytes=config.TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024
+        )
+        self.transcript_store = TranscriptStore(config.TRANSCRIPT_STORE_DIR)
+        self.search_cache = SearchResultCache(config.SEARCH_CACHE_SIZE)
+        self.search_executor = ThreadPoolExecutor(max_workers=config.SEARCH_WORKERS, thread_name_prefix="search")
+        self.decode_pool = ProcessPoolExecutor(max_workers=decode_processes) if decode_processes > 0 else None
+        self.pipeline = IngestPipeline(
+            [
+                ("decode", self._decode_stage, decode_processes or config.DECODE_WORKERS),
+                ("asr", self._asr_stage, config.ASR_WORKERS),
+                ("embed", self._embed_stage, config.EMBED_WORKERS),
+            ],
+            queue_size=config.PIPELINE_QUEUE_SIZE,
+            on_failure=self._ingest_failed,
+        )
+
+    def get_store(self, index_id):
+        """
+        Vector store of an index, opened according to the backend recorded in its settings.
+        """
+        with self._stores_lock:
+            store = self._stores.get(index_id)
+            if store is None:
+                store = open_vector_store(index_id, db.get_index_settings(index_id), self.chroma_client)
+                self._stores[index_id] = store
+            return store
+
+    def _write_lock(self, index_id):
+        # 同一索引的写入和重建时的切换互斥
+        with self._stores_lock:
+            return self._write_locks.setdefault(index_id, threading.Lock())
 
     def delete_database(self, index_id):
-        self.chroma_client.delete_collection(name=index_id)
+        with self._write_lock(index_id):
+            store = self.get_store(index_id)
+            with self._stores_lock:
+                self._stores.pop(index_id, None)
+            store.drop()
+            db.delete_segments(index_id)
+        self.search_cache.invalidate(index_id)
 
     def delete_video(self, index_id, video_path):
-        collection = self.chroma_client.get_collection(name=index_id, embedding_function=MyEmbeddingFunction())
-        collection.delete(where={"src_file": video_path})
+        with self._write_lock(index_id):
+            self.get_store(index_id).delete(src_file=video_path)
+            db.delete_segments(index_id, video_path)
+        self.transcript_store.delete(video_path)
+        self._index_changed(index_id)
+
+    def rebuild_index(self, index_id, space=None, hnsw=None):
+        """
+        Rebuild the vector store of an index with a new distance and/or HNSW parameters
+        in the background. Stored embeddings are copied into a new collection (no ASR or
+        re-embedding), writes made meanwhile are caught up, and the index is switched to
+        the new collection atomically. Returns False if a rebuild is already running.
+        """
+        with self._stores_lock:
+            status = self._rebuilds.get(index_id)
+            if status is not None and status["status"] == "running":
+                return False
+            self._rebuilds[index_id] = {"status": "running", "copied": 0, "error": None,
+                                        "started": time.time(), "finished": None}
+        threading.Thread(
+            target=self._rebuild_worker, args=(index_id, space, hnsw), name=f"rebuild-{index_id}", daemon=True
+        ).start()
+        return True
+
+    def rebuild_status(self, index_id):
+        with self._stores_lock:
+            status = self._rebuilds.get(index_id)
+            return dict(status) if status is not None else None
+
+    def _rebuild_worker(self, index_id, space, hnsw):
+        status = self._rebuilds[index_id]
+        new_store, switched = None, False
+        try:
+            settings = db.get_index_settings(index_id)
+            new_settings = dict(settings)
+            if space is not None:
+                new_settings["space"] = space
+            if hnsw is not None:
+                new_settings["hnsw"] = hnsw
+            new_settings["rebuilds"] = settings.get("rebuilds", 0) + 1
+            # 每次尝试使用新的集合名，失败留下的集合不会被重试复用
+            new_settings["collection"] = f"{index_id}-r{new_settings['rebuilds']}-{generate_random_id()[:8]}"
+            old_store = self.get_store(index_id)
+            new_store = open_vector_store(index_id, new_settings, self.chroma_client)
+            print(f"重建索引 {index_id} -> {new_settings['collection']}")
+
+            # 先不加锁复制全部数据，再在锁内补上复制期间的变化并切换
+            status["copied"] += self._copy_segments(old_store, new_store, old_store.get()["ids"])
+            with self._write_lock(index_id):
+                old_ids = set(old_store.get()["ids"])
+                new_ids = set(new_store.get()["ids"])
+                status["copied"] += self._copy_segments(old_store, new_store, list(old_ids - new_ids))
+                if new_ids - old_ids:
+                    new_store.delete(ids=list(new_ids - old_ids))
+                db.update_index_settings(index_id, new_settings)
+                with self._stores_lock:
+                    self._stores[index_id] = new_store
+                switched = True
+            self._index_changed(index_id)
+            status["status"] = "done"
+            print(f"索引 {index_id} 重建完成，共 {status['copied']} 个文本段")
+
+            # 等待正在使用旧集合的查询结束后再删除
+            time.sleep(config.REBUILD_DROP_DELAY_S)
+            old_store.drop()
+        except Exception as e:
+            status["status"] = "failed"
+            status["error"] = str(e)
+            print(f"索引 {index_id} 重建失败: {str(e)}")
+            # 未切换时删除复制了一半的新集合
+            if new_store is not None and not switched:
+                try:
+                    new_store.drop()
+                except Exception as drop_error:
+                    print(f"删除未完成的集合 {new_settings['collection']} 失败: {str(drop_error)}")
+        finally:
+            status["finished"] = time.time()
+
+    def _copy_segments(self, source, target, ids, batch_size=1000):
+        for start in range(0, len(ids), batch_size):
+            batch = source.get(ids=ids[start:start + batch_size], include_embeddings=True)
+            if batch["ids"]:
+                target.add(batch["ids"], batch["embeddings"], batch["documents"], batch["metadatas"])
+        return len(ids)
+
+    def _index_changed(self, index_id):
+        # 索引内容变化后使该索引的搜索结果缓存失效
+        db.bump_index_generation(index_id)
+        self.search_cache.invalidate(index_id)
 
     def add_videos(self, video_paths, index_id):
         """
-        Add videos to the database.
+        Add videos to the database. Decode, ASR and embedding of different videos run concurrently.
         """
         if index_id == "":
             raise ValueError("Index ID cannot be empty.")
 
-        if self.asr_model is None:
-            print("Initializing ASR model...")
-            self.asr_model = ASR()
-            print("ASR model initialized.")
-        for video_path in video_paths:
-            self._add_video(video_path, index_id)
-            print("-" * 50)
-        if self.asr_model is not None:
-            del self.asr_model
+        tasks = [IngestTask(video_path, index_id) for video_path in video_paths]
+        self.pipeline.run(tasks)
+        print("-" * 50)
+        return tasks
     
-    def _add_video(self, video_path, index_id):
+    def add_video(self, video_path, index_id):
         """
-        Add a single video to the database.
+        Add a single video to the database. Errors are re-raised after the file is marked as failed.
         """
+        task = IngestTask(video_path, index_id)
         try:
-            db.update_file_status(index_id, video_path, IndexStatus.PROCESSING)
-            print(f"Adding video: {video_path}")
-            # Placeholder for video processing logic
-            # Here you would extract audio and process it as needed
-            temp_dir = create_temp_folder()
-
-            # Extract audio from video
-            print(f"Extracting audio from video: {video_path}")
-            audio_path = os.path.join(temp_dir, "output_audio.wav")
-            convert_video_to_audio(video_path, audio_path)
-            print(f"Audio extracted to: {audio_path}")
-
-            # Perform ASR on the audio file
-            print("Performing ASR on the audio file...")
-            text_path = os.path.join(temp_dir, "text.txt")
-            self.asr_model.asr(audio_path, result_path=text_path)
-            print(f"ASR result saved to: {text_path}")
-
-            # Add the processed audio text to the database
-            print(f"Adding text to database {index_id}")
-            self._add_emebedding(text_path, src_file=video_path, index_id=index_id)
-            print(f"Video {video_path} added to database {index_id}")
-
-            # 更新文件状态为已完成
-            db.update_file_status(index_id, video_path, IndexStatus.COMPLETED)
-
-            delete_temp_folder(temp_dir)
+            for _, stage, _ in self.pipeline.stages:
+                stage(task)
         except Exception as e:
-            # 更新文件状态为错误
-            db.update_file_status(index_id, video_path, IndexStatus.ERROR)
-            print(f"处理视频 {video_path} 时出错: {str(e)}")
-
-
-    def _add_emebedding(self, text_file, src_file, index_id):
-        collection = self.chroma_client.get_or_create_collection(name=index_id, embedding_function=MyEmbeddingFunction())
-        ids, documents, metadatas = preprocess(text_file, src_file) 
-        collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
-        )
+            self._ingest_failed(task, e)
+            raise
+
+    def _decode_stage(self, task):
+        db.update_file_status(task.index_id, task.video_path, IndexStatus.PROCESSING)
+        print(f"Adding video: {task.video_path}")
 
-    def search_content(self, index_id, n_results=10, query=None, video_paths=None, keyword=None):
-        collection = self.chroma_client.get_collection(name=index_id, embedding_function=MyEmbeddingFunction())
-        query_texts, where, where_document = None, None, None
-        if query is not None:
-            query_texts = ["search_query: " + query]
-        if keyword is not None:
-            keywords = keyword.split(",")
-            if len(keywords) == 1:
-                where_document = {"$contains": keyword}
+        # 文件内容和识别参数都没变时直接使用保存的转录；相同内容的视频已经识别过时，跳过解码和识别
+        task.cache_key = self.transcript_cache.make_key(task.video_path, self.asr_settings)
+        # 只读取 meta.json 比较，过期的转录不打开，避免替换时仍被映射
+        if self.transcript_store.get_key(task.video_path) == task.cache_key:
+            task.transcript = self.transcript_store.get(task.video_path)
+        if task.transcript is not None:
+            task.asr_info = task.transcript.info
+            print(f"Stored transcript reused: {task.video_path}")
+        else:
+            cached = self.transcript_cache.get(task.cache_key)
+            if cached is not None:
+                chunks, task.asr_info = cached
+                task.transcript = self.transcript_store.put(task.video_path, chunks, task.asr_info, key=task.cache_key)
+                print(f"Transcript cache hit: {task.video_path}")
+        if task.transcript is not None:
+            duration = task.asr_info.get("duration")
+            db.update_file_progress(task.index_id, task.video_path, duration or 0.0, duration)
+            return
+
+        # 流式解码时由识别阶段按窗口读取音频，内存占用与视频长度无关
+        if config.ASR_STREAM_DECODE and config.ASR_LONG_FORM == "chunked":
+            task.audio = task.video_path
+            return
+
+        # Extract audio from video
+        print(f"Extracting audio from video: {task.video_path}")
+        try:
+            # 通过ffmpeg管道直接解码到内存，不写临时文件
+            if self.decode_pool is not None:
+                task.audio = self.decode_pool.submit(load_audio, task.video_path).result()
             else:
-                where_document = {
-                    "$and": [
-                        {"$contains": keyword} for keyword in keywords
-                    ]
-                }
-        if video_paths is not None:
-            where = {"src_file": {"$in": video_paths}}
-        results = collection.query(
-            query_texts=query_texts,
-            n_results=n_results,
-            where=where,
-            where_document=where_document
+                task.audio = load_audio(task.video_path)
+            print(f"Audio decoded in memory: {len(task.audio) / SAMPLE_RATE:.1f}s")
+        except Exception as e:
+            # 解码失败时回退到moviepy，写入本任务独立的临时目录
+            print(f"In-memory decode failed ({str(e)}), falling back to moviepy")
+            task.audio = os.path.join(self._get_task_temp_dir(task), "output_audio.wav")
+            convert_video_to_audio(task.video_path, task.audio)
+            print(f"Audio extracted to: {task.audio}")
+
+    def _asr_stage(self, task):
+        # 命中保存的转录或识别结果缓存
+        if task.transcript is not None:
+            return
+
+        # Perform ASR on the audio
+        print("Performing ASR on the audio...")
+
+        # 识别进度写入数据库，中断后从检查点继续
+        def report_progress(processed, total):
+            db.update_file_progress(task.index_id, task.video_path, processed, total)
+
+        # 相同内容的任务共用一个检查点，依次执行
+        with self.transcript_cache.checkpoint(task.cache_key) as checkpoint_path:
+            # 等待期间另一个相同内容的任务可能已经识别完成
+            cached = self.transcript_cache.get(task.cache_key, count=False)
+            if cached is not None:
+                chunks, task.asr_info = cached
+            else:
+                # 模型在任务之间保持加载，空闲超时后由模型管理器释放
+                with asr_manager.acquire() as asr_model:
+                    chunks, task.asr_info = asr_model.asr(
+                        task.audio,
+                        result_path=None,
+                        checkpoint_path=checkpoint_path,
+                        progress_callback=report_progress,
+                    )
+                self.transcript_cache.put(task.cache_key, chunks, task.asr_info)
+        self.transcript_cache.remove_checkpoint(task.cache_key)
+        # 识别完成后释放音频数据
+        task.audio = None
+        task.transcript = self.transcript_store.put(task.video_path, chunks, task.asr_info, key=task.cache_key)
+        print(f"ASR result saved to: {task.transcript.directory}")
+
+    def _embed_stage(self, task):
+        # Add the processed audio text to the database
+        print(f"Adding text to database {task.index_id}")
+        task.segments, task.embedded = self._add_emebedding(task.transcript, src_file=task.video_path, index_id=task.index_id)
+        print(f"Video {task.video_path} added to database {task.index_id}")
+
+        # 更新文件状态为已完成
+        db.update_file_status(task.index_id, task.video_path, IndexStatus.COMPLETED)
+        self._cleanup_task(task)
+
+    def _ingest_failed(self, task, error):
+        # 更新文件状态为错误
+        db.update_file_status(task.index_id, task.video_path, IndexStatus.ERROR)
+        print(f"处理视频 {task.video_path} 时出错: {str(error)}")
+        # 不会重试的任务不再需要检查点；队列中的任务由队列在最后一次失败后删除
+        if task.job is None:
+            self.discard_checkpoint(task)
+        self._cleanup_task(task)
+
+    def discard_checkpoint(self, task):
+        if task.cache_key is not None:
+            self.transcript_cache.remove_checkpoint(task.cache_key)
+
+    def _get_task_temp_dir(self, task):
+        if task.temp_dir is None:
+            task.temp_dir = create_temp_folder()
+        return task.temp_dir
+
+    def _cleanup_task(self, task):
+        task.audio = None
+        task.transcript = None
+        if task.temp_dir is not None:
+            delete_temp_folder(task.temp_dir)
+            task.temp_dir = None
+
+
+    def _add_emebedding(self, chunks, src_file, index_id):
+        ids, documents, metadatas = preprocess_chunks(chunks, src_file)
+        # 文本段ID由内容决定：已存在的文本段不再计算向量，只写入新增的，删除不再出现的
+        store = self.get_store(index_id)
+        existing = set(store.segment_ids(src_file))
+        new = [i for i, segment_id in enumerate(ids) if segment_id not in existing]
+        stale = list(existing - set(ids))
+        print(f"{src_file}: {len(ids)} 个文本段，新增 {len(new)}，删除 {len(stale)}，未变化 {len(ids) - len(new)}")
+
+        # 按索引设置的维度截断并重新归一化
+        embeddings = truncate_embeddings(embed([documents[i] for i in new]), store.embedding_dim) if new else []
+        with self._write_lock(index_id):
+            store = self.get_store(index_id)
+            if stale:
+                store.delete(ids=stale)
+                db.delete_segments(index_id, ids=stale)
+            if new:
+                store.add(
+                    ids=[ids[i] for i in new],
+                    embeddings=embeddings,
+                    documents=[documents[i] for i in new],
+                    metadatas=[metadatas[i] for i in new]
+                )
+            # 已存在的ID会被忽略，同时补齐全文索引中缺少的文本段
+            db.add_segments(index_id, ids, documents, metadatas)
+        if new or stale:
+            self._index_changed(index_id)
+        return len(ids), len(new)
+
+    def search_content(self, index_id, n_results=10, query=None, video_paths=None, keyword=None, mode="vector"):
+        """
+        Search an index. `mode` is "vector" (embedding similarity), "lexical" (BM25 over
+        the full-text index) or "hybrid" (both legs run concurrently, fused with RRF).
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+
+        # 索引内容没有变化时直接返回缓存的结果
+        generation = db.get_index_generation(index_id)
+        cache_key = (
+            index_id, generation, query, keyword,
+            tuple(video_paths) if video_paths is not None else None, n_results, mode,
+        )
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        store = self.get_store(index_id)
+        keywords = [k for k in keyword.split(",") if k] if keyword is not None else []
+        # 没有查询内容或全文索引不可用时，只能使用向量检索
+        if query is None or not db.fts_enabled:
+            mode = "vector"
+
+        if mode == "lexical":
+            self._ensure_fts(index_id, store)
+            rows = db.rank_segments(index_id, query, keywords, video_paths, limit=n_results)
+            result = [row[1] for row in rows], [row[2] for row in rows]
+        elif mode == "hybrid":
+            result = self._hybrid_search(store, index_id, query, keyword, keywords, video_paths, n_results)
+        else:
+            query_embeddings = [self._query_embedding(store, query)] if query is not None else None
+            _, documents, metadatas, _ = self._vector_search(
+                store, index_id, query_embeddings, keyword, keywords, video_paths, n_results
+            )
+            result = documents, metadatas
+        self.search_cache.put(cache_key, result)
+        return result
+
+    def search_indexes(self, index_ids, n_results=10, query=None, video_paths=None, keyword=None):
+        """
+        Vector search over several indexes at once. The query is embedded once and the
+        indexes are searched concurrently; results are merged by similarity score
+        (distance converted per vector store space) and cut to one global top-k.
+        Returns (results, timings) where results are (index_id, document, metadata, score)
+        and timings are per-index dicts with the elapsed time or the error.
+        """
+        query_embedding = query_embedder.embed_query(query) if query is not None else None
+        keywords = [k for k in keyword.split(",") if k] if keyword is not None else []
+
+        def search_one(index_id):
+            start = time.perf_counter()
+            store = self.get_store(index_id)
+            # 各索引的向量维度可能不同，查询向量按索引分别截断
+            query_embeddings = None
+            if query_embedding is not None:
+                query_embeddings = [truncate_embeddings([query_embedding], store.embedding_dim)[0]]
+            _, documents, metadatas, distances = self._vector_search(
+                store, index_id, query_embeddings, keyword, keywords, video_paths, n_results
+            )
+            space = store.space
+            scores = [None] * len(documents) if distances is None else [self._distance_to_score(space, d) for d in distances]
+            return list(zip(documents, metadatas, scores)), time.perf_counter() - start
+
+        futures = [(index_id, self.search_executor.submit(search_one, index_id)) for index_id in index_ids]
+        results, timings = [], []
+        for index_id, future in futures:
+            try:
+                hits, elapsed = future.result()
+            except Exception as e:
+                timings.append({"indexId": index_id, "error": str(e)})
+                continue
+            timings.append({"indexId": index_id, "timeMs": round(elapsed * 1000, 2), "count": len(hits)})
+            results.extend((index_id, document, metadata, score) for document, metadata, score in hits)
+
+        # 没有查询内容时没有分数，保持各索引内的顺序
+        if query_embedding is not None:
+            results.sort(key=lambda r: r[3], reverse=True)
+        return results[:n_results], timings
+
+    def _query_embedding(self, store, query):
+        # 查询向量经过缓存，并发的未命中查询会合并成一次向量化请求；
+        # 再按索引的维度截断，与入库时的处理一致
+        return truncate_embeddings([query_embedder.embed_query(query)], store.embedding_dim)[0]
+
+    def _distance_to_score(self, space, distance):
+        # 把不同距离空间的距离转换为相似度（向量已归一化），使不同索引的结果可以比较
+        if space == "l2":
+            return 1.0 - float(distance) / 2
+        return 1.0 - float(distance)
+
+    def _vector_search(self, store, index_id, query_embeddings, keyword, keywords, video_paths, n_results):
+        result = None
+        if keywords and db.fts_enabled:
+            result = self._search_keywords(store, index_id, keywords, query_embeddings, video_paths, n_results)
+        if result is None:
+            result = store.query(
+                query_embeddings[0] if query_embeddings is not None else None,
+                n_results,
+                video_paths=video_paths,
+                contains=keyword.split(",") if keyword is not None else None,
+            )
+        return result
+
+    def _hybrid_search(self, store, index_id, query, keyword, keywords, video_paths, n_results):
+        """
+        Run BM25 and vector search concurrently over the top `HYBRID_CANDIDATES`
+        of each leg and fuse the rankings with reciprocal rank fusion.
+        """
+        depth = max(n_results, config.HYBRID_CANDIDATES)
+        self._ensure_fts(index_id, store)
+        lexical = self.search_executor.submit(db.rank_segments, index_id, query, keywords, video_paths, depth)
+        query_embeddings = [self._query_embedding(store, query)]
+        vector_ids, vector_documents, vector_metadatas, _ = self._vector_search(
+            store, index_id, query_embeddings, keyword, keywords, video_paths, depth
         )
-        documents, metadatas = results['documents'][0], results['metadatas'][0]
-        return documents, metadatas
+        lexical_rows = lexical.result()
+
+        scores, segments = {}, {}
+        rankings = [
+            list(zip(vector_ids, vector_documents, vector_metadatas)),
+            lexical_rows,
+        ]
+        for ranking in rankings:
+            for rank, (segment_id, document, metadata) in enumerate(ranking):
+                scores[segment_id] = scores.get(segment_id, 0.0) + 1.0 / (config.RRF_K + rank + 1)
+                segments[segment_id] = (document, metadata)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:n_results]
+        return [segments[i][0] for i in ranked], [segments[i][1] for i in ranked]
+
+    def _search_keywords(self, store, index_id, keywords, query_embeddings, video_paths, n_results):
+        """
+        Keyword search through the SQLite full-text index. Without a query the matches
+        are returned in file/time order; with a query the matching segments are ranked
+        by vector distance. Returns None when there are too many candidates to rank
+        locally, so the caller falls back to the vector store filter.
+        """
+        self._ensure_fts(index_id, store)
+        if query_embeddings is None:
+            rows = db.search_segments(index_id, keywords, video_paths, limit=n_results)
+            return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows], None
+
+        rows = db.search_segments(index_id, keywords, video_paths, limit=config.FTS_MAX_CANDIDATES + 1)
+        if len(rows) > config.FTS_MAX_CANDIDATES:
+            return None
+        if not rows:
+            return [], [], [], []
+        results = store.get(ids=[row[0] for row in rows], include_embeddings=True)
+        # 与向量库使用相同的距离计算方式，保证排序一致
+        metric = store.space
+        index = ExactSearchIndex(results["embeddings"], metric=metric)
+        order, scores = index.search(query_embeddings[0], top_k=n_results)
+        return (
+            [results["ids"][i] for i in order],
+            [results["documents"][i] for i in order],
+            [results["metadatas"][i] for i in order],
+            score_to_distance(metric, scores).tolist(),
+        )
+
+    def _ensure_fts(self, index_id, store):
+        # 旧版本创建的索引第一次关键词搜索时，从向量库补建全文索引
+        if db.is_fts_synced(index_id):
+            return
+        print(f"为索引 {index_id} 建立全文索引...")
+        results = store.get()
+        db.add_segments(index_id, results["ids"], results["documents"], results["metadatas"])
+        db.mark_fts_synced(index_id)
 
     def get_content(self, index_id, limit=100, offset=0, video_path=None):
-        where = None
-        if video_path is not None:
-            where = {"src_file": video_path}
-            
-        collection = self.chroma_client.get_collection(name=index_id, embedding_function=MyEmbeddingFunction())
-        results = collection.get(limit=limit, offset=offset, where=where)
-        documents, metadatas = results['documents'][0], results['metadatas'][0]
-        return documents, metadatas
+        results = self.get_store(index_id).get(src_file=video_path, limit=limit, offset=offset)
+        return results['documents'], results['metadatas']
 
     def get_all_documents_for_video(self, index_id, video_path):
         """获取视频的所有索引文本"""
-        collection = self.chroma_client.get_collection(name=index_id, embedding_function=MyEmbeddingFunction())
-        
         # 获取所有匹配的文档
-        results = collection.get(where={"src_file": video_path})
+        results = self.get_store(index_id).get(src_file=video_path)
         
         # 按起始时间排序
         documents = results['documents']
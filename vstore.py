@@ -5,7 +5,6 @@ from retrieve import embed
 from preprocess import preprocess
 from huggingface_hub import hf_hub_download
 import os
-from llama_cpp import Llama
 
 class MyEmbeddingFunction(EmbeddingFunction):
 
@@ -17,19 +16,11 @@ class MyEmbeddingFunction(EmbeddingFunction):
         model_path = os.path.join("models", self.model_file)
         if not os.path.exists(model_path):
             hf_hub_download(repo_id=self.model_id, filename=self.model_file, local_dir="models")
-        # self.model = Llama(
-        #     model_path=model_path,
-        #     n_batch=1,
-        #     embedding=True,
-        #     n_gpu_layers=-1, # Uncomment to use GPU acceleration
-        # )
 
 
     def __call__(self, input: Documents) -> Embeddings:
-        # embed the documents somehow
-        # embed = self.model.embed_documents(input)
+        # 由 EMBEDDING_BACKEND 选择 llama-server 或进程内模型
         return embed(input)
-        # return self.model.embed(input)
 
 
 
@@ -0,0 +1,277 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from database import db, IndexStatus
+from job_queue import QueueFullError
+
+try:
+    # inotify (Linux) / FSEvents / ReadDirectoryChangesW，未安装时使用轮询
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_media_file(path):
+    return os.path.splitext(path)[1].lower() in config.WATCH_EXTENSIONS
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher, key):
+        self.watcher = watcher
+        self.key = key
+
+    def on_any_event(self, event):
+        # 只打开或读取文件不会改变内容
+        if event.event_type in ("opened", "closed_no_write"):
+            return
+        self.watcher._mark_dirty(self.key, event.src_path)
+        if getattr(event, "dest_path", ""):
+            self.watcher._mark_dirty(self.key, event.dest_path)
+
+
+class FolderWatcher:
+    """
+    Keeps indexes in sync with watched directory trees.
+
+    Every file in the files table records its size, mtime and content hash. A file is
+    queued for ingest when it is new or when its size/mtime changed and the hash differs;
+    files that disappear are removed from the index. Changes are picked up from
+    filesystem events (watchdog, inotify on Linux) or, without watchdog, by rescanning
+    every watched tree every `poll_interval` seconds. All watched trees are also
+    rescanned on start, so changes made while the service was down are not missed.
+    """
+
+    def __init__(self, searcher, job_queue, backend="auto", poll_interval=30.0, settle_seconds=2.0):
+        self.searcher = searcher
+        self.job_queue = job_queue
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self._watches = {}
+        self._handles = {}
+        self._dirty = {}
+        self._observer = None
+        self._started = False
+        self._last_poll = 0.0
+        self._wakeup = threading.Condition()
+
+    def start(self):
+        """
+        Load the watches from the database, scan them once and start watching.
+        """
+        with self._wakeup:
+            if self._started:
+                return
+            self._started = True
+
+        if self.backend != "poll":
+            if Observer is not None:
+                self._observer = Observer()
+                self._observer.daemon = True
+                self._observer.start()
+            else:
+                print("未安装watchdog，使用轮询方式监视目录")
+
+        for watch in db.get_watches():
+            self._add(watch)
+
+        worker = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        worker.start()
+
+    def watch(self, index_id, path, recursive=True):
+        """
+        Watch a directory for an index. Existing media files are ingested right away.
+        """
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            raise ValueError(f"目录不存在: {path}")
+        self.start()
+        watch = db.add_watch(index_id, path, recursive)
+        self._remove((index_id, path))
+        self._add(watch)
+        return watch
+
+    def unwatch(self, index_id, path):
+        """
+        Stop watching a directory. Files already ingested stay in the index.
+        """
+        path = os.path.abspath(path)
+        self._remove((index_id, path))
+        return db.delete_watch(index_id, path)
+
+    def unwatch_index(self, index_id):
+        for key in [key for key in list(self._watches) if key[0] == index_id]:
+            self._remove(key)
+
+    def _add(self, watch):
+        key = (watch.index_id, watch.path)
+        with self._wakeup:
+            self._watches[key] = watch
+        if self._observer is not None and os.path.isdir(watch.path):
+            self._handles[key] = self._observer.schedule(
+                _EventHandler(self, key), watch.path, recursive=watch.recursive
+            )
+        # 新增的监视目录立即扫描一次
+        self._mark_dirty(key, watch.path, delay=0)
+
+    def _remove(self, key):
+        with self._wakeup:
+            self._watches.pop(key, None)
+            self._dirty = {path: entry for path, entry in self._dirty.items() if entry[0] != key}
+        handle = self._handles.pop(key, None)
+        if handle is not None:
+            self._observer.unschedule(handle)
+
+    def _mark_dirty(self, key, path, delay=None):
+        # 同一路径的连续事件合并，等文件稳定一段时间后再处理
+        delay = self.settle_seconds if delay is None else delay
+        with self._wakeup:
+            self._dirty[os.path.abspath(path)] = (key, time.time() + delay)
+            self._wakeup.notify_all()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                now = time.time()
+                due = [(path, key) for path, (key, deadline) in self._dirty.items() if deadline <= now]
+                for path, _ in due:
+                    del self._dirty[path]
+                poll = self._observer is None and now - self._last_poll >= self.poll_interval
+                if poll:
+                    self._last_poll = now
+                    due += [(watch.path, key) for key, watch in self._watches.items()]
+                if not due:
+                    deadlines = [deadline for _, deadline in self._dirty.values()]
+                    if self._observer is None:
+                        deadlines.append(self._last_poll + self.poll_interval)
+                    self._wakeup.wait(max(min(deadlines, default=now + 60) - now, 0.05))
+                    continue
+
+            for path, key in due:
+                watch = self._watches.get(key)
+                if watch is None:
+                    continue
+                try:
+                    self._sync(watch, path)
+                except Exception as e:
+                    print(f"同步监视目录 {watch.path} 时出错: {str(e)}")
+
+    def _in_scope(self, watch, path):
+        if watch.recursive:
+            return path.startswith(watch.path + os.sep)
+        return os.path.dirname(path) == watch.path
+
+    def _sync(self, watch, path):
+        # 监视目录本身不存在（例如移动硬盘未挂载）时不能当作文件全部删除
+        if not os.path.isdir(watch.path):
+            print(f"监视目录不可用，跳过同步: {watch.path}")
+            return
+        states = db.get_file_states(watch.index_id)
+        if os.path.isdir(path):
+            self._scan(watch, path, states)
+        elif os.path.isfile(path):
+            if self._in_scope(watch, path) and is_media_file(path):
+                self._check_file(watch, path, states.get(path))
+        elif os.path.isdir(os.path.dirname(path)):
+            # 文件或目录已删除（所在目录仍然存在）
+            for file_path in states:
+                if (file_path == path or file_path.startswith(path + os.sep)) and self._in_scope(watch, file_path):
+                    self._remove_file(watch, file_path)
+
+    def _scan(self, watch, root, states):
+        if not watch.recursive and root != watch.path:
+            return
+        seen = set()
+        for directory, dirs, files in os.walk(root):
+            if not watch.recursive:
+                dirs[:] = []
+            for name in files:
+                path = os.path.join(directory, name)
+                if is_media_file(path):
+                    seen.add(path)
+                    self._check_file(watch, path, states.get(path))
+
+        # 遍历时出错的目录中的文件不会出现在 seen 中，只删除确实不存在的
+        for file_path in states:
+            if (file_path.startswith(root + os.sep) and self._in_scope(watch, file_path)
+                    and file_path not in seen and not os.path.exists(file_path)):
+                self._remove_file(watch, file_path)
+
+    def _check_file(self, watch, path, state):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        # 文件还在写入时稍后再检查
+        if time.time() - stat.st_mtime < self.settle_seconds:
+            self._mark_dirty((watch.index_id, watch.path), path)
+            return
+
+        if state is None:
+            self._ingest(watch, path, stat, new=True)
+            return
+
+        status, size, mtime, recorded_hash = state
+        if size == stat.st_size and mtime == stat.st_mtime:
+            return
+        current_hash = file_hash(path)
+        # 通过接口添加的文件没有记录状态，只补记录；内容没变时只更新修改时间
+        if size is None or current_hash == recorded_hash:
+            db.update_file_state(watch.index_id, path, stat.st_size, stat.st_mtime, current_hash)
+            return
+        self._ingest(watch, path, stat, new=False, current_hash=current_hash, status=status)
+
+    def _ingest(self, watch, path, stat, new, current_hash=None, status=None):
+        try:
+            self.job_queue.check_capacity(1)
+        except QueueFullError as e:
+            print(f"{str(e)}，稍后再处理: {path}")
+            self._mark_dirty((watch.index_id, watch.path), path, delay=self.poll_interval)
+            return
+
+        if new:
+            try:
+                db.add_file_to_index(watch.index_id, path)
+            except sqlite3.IntegrityError:
+                print(f"文件已属于其他索引，跳过: {path}")
+                return
+            print(f"监视目录发现新文件: {path}")
+        else:
+            db.update_file_status(watch.index_id, path, IndexStatus.WAITING)
+            db.update_index_status(watch.index_id, IndexStatus.PROCESSING)
+            print(f"监视目录中的文件已修改: {path}")
+
+        try:
+            self.job_queue.submit(watch.index_id, [path])
+        except QueueFullError as e:
+            # 并发提交使队列已满：撤销本次修改，稍后再处理
+            if new:
+                db.remove_file_from_index(watch.index_id, path)
+            else:
+                db.update_file_status(watch.index_id, path, status)
+            print(f"{str(e)}，稍后再处理: {path}")
+            self._mark_dirty((watch.index_id, watch.path), path, delay=self.poll_interval)
+            return
+        db.update_file_state(watch.index_id, path, stat.st_size, stat.st_mtime, current_hash or file_hash(path))
+
+    def _remove_file(self, watch, path):
+        print(f"监视目录中的文件已删除: {path}")
+        db.remove_file_from_index(watch.index_id, path)
+        self.searcher.delete_video(watch.index_id, path)
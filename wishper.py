@@ -6,6 +6,14 @@ from tqdm import tqdm
 
 import threading
 import time
+import numpy as np
+
+from video_edit import SAMPLE_RATE, iter_audio_windows, load_audio, probe_duration
+from transcript_cache import read_checkpoint, append_checkpoint
+from vad import get_vad, resolve_backend, compact_speech, remap_chunks
+import config
+
+MODEL_ID = "openai/whisper-large-v3-turbo"
 
 
 class ASR:
@@ -18,22 +26,29 @@ class ASR:
     model = None # Placeholder for the ASR model
 
     # Define the generation parameters
-    def __init__(self):
-        self.generate_kwargs = {
-            "max_new_tokens": 440,
-            "num_beams": 1,
-            "condition_on_prev_tokens": False,
-            "compression_ratio_threshold": 1.35,  # zlib compression ratio threshold (in token space)
-            "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
-            "logprob_threshold": -1.0,
-            "no_speech_threshold": 0.6,
-            "return_timestamps": True,
-            "language": "chinese"
-        }
+    def __init__(self, long_form=None, chunk_length_s=None, stride_length_s=None, batch_size=None, vad=None):
+        # 多个工作线程共享同一个模型，推理时串行执行
+        self._lock = threading.Lock()
+        # 长音频识别方式：chunked 按固定窗口分批识别，sequential 整段交给模型顺序识别
+        self.long_form = long_form or config.ASR_LONG_FORM
+        self.chunk_length_s = chunk_length_s or config.ASR_CHUNK_LENGTH_S
+        self.stride_length_s = stride_length_s if stride_length_s is not None else config.ASR_STRIDE_LENGTH_S
+        self.batch_size = batch_size or config.ASR_BATCH_SIZE
+        # 识别前的语音活动检测，跳过静音和无人声片段
+        self.vad_backend = resolve_backend(vad or config.VAD_BACKEND)
+        self.vad = get_vad(self.vad_backend)
+        if self.long_form not in ("chunked", "sequential"):
+            raise ValueError(f"Unknown long-form mode: {self.long_form}")
+        if self.chunk_length_s > 30:
+            raise ValueError("Whisper windows cannot be longer than 30 seconds.")
+        if not 0 <= self.stride_length_s * 2 < self.chunk_length_s:
+            raise ValueError("Stride must be shorter than half of the window.")
+
+        self.generate_kwargs = dict(generate_kwargs)
         device = "cuda:0" if torch.cuda.is_available() else "cpu"
         torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
         print("Using device: ", device)
-        model_id = "openai/whisper-large-v3-turbo"
+        model_id = MODEL_ID
 
         self.model = AutoModelForSpeechSeq2Seq.from_pretrained(
             model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=True, use_safetensors=True
@@ -51,21 +66,153 @@ class ASR:
             device=device,
         )
 
-    def asr(self, audio_path, result_path="result.txt"):
+    def asr(self, audio, result_path="result.txt", checkpoint_path=None, progress_callback=None):
         """
-        Perform ASR on the given audio file and save the result to a text file.
+        Perform ASR on the given audio and save the result to a text file (skipped if result_path is None).
+        `audio` is either a path to an audio/video file or a 16 kHz mono float32 NumPy array.
+        See `transcribe` for `checkpoint_path` and `progress_callback`.
         """
         start_time = time.time()
         stop_event = threading.Event()
         t = threading.Thread(target=print_elapsed, args=(start_time, stop_event))
         t.start()
 
-        result = self.pipe([audio_path], return_timestamps=True, generate_kwargs=self.generate_kwargs)
-
-        stop_event.set()
-        t.join()
-        print(f"总用时: {int(time.time() - start_time)} 秒")
-        write_result(result, result_path)
+        try:
+            chunks, info = self.transcribe(audio, checkpoint_path=checkpoint_path, progress_callback=progress_callback)
+        finally:
+            stop_event.set()
+            t.join()
+        print(f"总用时: {int(time.time() - start_time)} 秒, 音频时长: {int(info['duration'])} 秒, "
+              f"跳过无语音部分: {int(info['skipped'])} 秒")
+        if result_path is not None:
+            write_result(chunks, result_path)
+        return chunks, info
+
+    def transcribe(self, audio, checkpoint_path=None, progress_callback=None):
+        """
+        Transcribe audio and return (chunks, info), where chunks are whisper chunks
+        ({"text", "timestamp": (start, end)}) on the timeline of the original audio and
+        info holds the audio duration and the seconds skipped by VAD.
+
+        In chunked mode every finished window is appended to `checkpoint_path`, and
+        windows already recorded there are not decoded again, so an interrupted run
+        resumes where it stopped. `progress_callback(processed_seconds, total_seconds)`
+        is called after every batch.
+        """
+        if self.vad is not None:
+            if isinstance(audio, np.ndarray) or self.long_form == "sequential":
+                return self._transcribe_speech(audio, checkpoint_path, progress_callback)
+            # 流式读取时无法预先检测整段音频，改为跳过没有语音的窗口
+            return self._transcribe_chunked(audio, checkpoint_path, progress_callback, skip_silence=True)
+        if self.long_form == "sequential":
+            return self._transcribe_sequential(audio)
+        return self._transcribe_chunked(audio, checkpoint_path, progress_callback)
+
+    def _transcribe_speech(self, audio, checkpoint_path=None, progress_callback=None):
+        """
+        Run VAD first and only send the speech regions to whisper. The regions are
+        concatenated for decoding and the timestamps are mapped back afterwards.
+        """
+        if not isinstance(audio, np.ndarray):
+            audio = load_audio(audio)
+        duration = len(audio) / SAMPLE_RATE
+        compact, mapping = compact_speech(audio, self.vad(audio))
+        speech = sum(length for _, _, length in mapping)
+        chunks = []
+        if len(compact) > 0:
+            if self.long_form == "sequential":
+                chunks, _ = self._transcribe_sequential(compact)
+            else:
+                # 进度按压缩后的音频计算，再换算到原始时长
+                callback = None
+                if progress_callback is not None:
+                    callback = lambda processed, total: progress_callback(processed / total * duration, duration)
+                chunks, _ = self._transcribe_chunked(compact, checkpoint_path, callback)
+            chunks = remap_chunks(chunks, mapping)
+        return chunks, {"duration": duration, "skipped": max(duration - speech, 0.0)}
+
+    def _transcribe_sequential(self, audio):
+        duration = None
+        if isinstance(audio, np.ndarray):
+            duration = len(audio) / SAMPLE_RATE
+            audio = {"raw": audio, "sampling_rate": SAMPLE_RATE}
+        with self._lock:
+            result = self.pipe([audio], return_timestamps=True, generate_kwargs=self.generate_kwargs)
+        chunks = result[0]["chunks"]
+        if duration is None:
+            duration = max((c["timestamp"][1] or c["timestamp"][0] for c in chunks), default=0.0)
+        return chunks, {"duration": duration, "skipped": 0.0}
+
+    def _transcribe_chunked(self, audio, checkpoint_path=None, progress_callback=None, skip_silence=False):
+        """
+        Long-form mode: split the audio into overlapping fixed windows and decode them
+        `batch_size` windows at a time. Only one batch of windows is alive at once, so peak
+        memory does not depend on the length of the recording.
+        """
+        if isinstance(audio, np.ndarray):
+            total = len(audio) / SAMPLE_RATE
+        else:
+            total = probe_duration(audio)
+
+        done = read_checkpoint(checkpoint_path) if checkpoint_path else {}
+        if done:
+            print(f"从检查点恢复，已完成 {len(done)} 个窗口")
+
+        # 每个窗口识别出的全部片段，全部窗口完成后再在重叠处拼接
+        windows = {}
+        duration = 0.0
+        skipped = 0.0
+        batch = []
+        for window, (offset, samples, is_last) in enumerate(
+            iter_audio_windows(audio, self.chunk_length_s, self.stride_length_s)
+        ):
+            length = len(samples) / SAMPLE_RATE
+            duration = offset + length
+            if window in done:
+                windows[window] = (offset, length, is_last, done[window]["chunks"])
+                skipped += done[window].get("skipped", 0.0)
+                continue
+            if skip_silence and not self.vad(samples):
+                # 只统计本窗口新增的部分，重叠部分已计入上一个窗口
+                window_skipped = length - (self.stride_length_s if offset > 0 else 0)
+                skipped += window_skipped
+                windows[window] = (offset, length, is_last, [])
+                if checkpoint_path:
+                    append_checkpoint(checkpoint_path, [{"window": window, "chunks": [], "skipped": window_skipped}])
+                continue
+            batch.append((window, offset, samples, is_last))
+            if len(batch) == self.batch_size:
+                windows.update(self._transcribe_batch(batch, checkpoint_path))
+                batch = []
+                if progress_callback is not None:
+                    progress_callback(duration, total)
+        if batch:
+            windows.update(self._transcribe_batch(batch, checkpoint_path))
+        if progress_callback is not None:
+            progress_callback(duration, duration)
+        chunks = stitch_windows([windows[i] for i in sorted(windows)], self.stride_length_s)
+        return chunks, {"duration": duration, "skipped": max(skipped, 0.0)}
+
+    def _transcribe_batch(self, batch, checkpoint_path=None):
+        inputs = [{"raw": samples, "sampling_rate": SAMPLE_RATE} for _, _, samples, _ in batch]
+        with self._lock:
+            results = self.pipe(
+                inputs, batch_size=len(inputs), return_timestamps=True, generate_kwargs=self.generate_kwargs
+            )
+        windows, records = {}, []
+        for (window, offset, samples, is_last), result in zip(batch, results):
+            window_chunks = shift_chunks(result["chunks"], offset)
+            windows[window] = (offset, len(samples) / SAMPLE_RATE, is_last, window_chunks)
+            records.append({"window": window, "chunks": window_chunks})
+        if checkpoint_path:
+            append_checkpoint(checkpoint_path, records)
+        return windows
+
+    def transcript_settings(self):
+        """
+        Settings of this instance that change the transcript it produces.
+        """
+        return transcript_settings(self.long_form, self.chunk_length_s, self.stride_length_s, self.vad_backend or "off")
 
     def __del__(self):
         """
@@ -92,6 +239,106 @@ generate_kwargs = {
     "language": "chinese"
 }
 
+def shift_chunks(chunks, offset):
+    """
+    Move window-relative chunk timestamps onto the original timeline. A missing start
+    becomes the end of the previous chunk; a missing end (the sentence was cut off at
+    the end of the window) stays None.
+    """
+    shifted = []
+    previous_end = 0.0
+    for chunk in chunks:
+        start, end = chunk["timestamp"]
+        start = previous_end if start is None else start
+        if end is not None:
+            previous_end = end
+        shifted.append({
+            "text": chunk["text"],
+            "timestamp": (round(offset + start, 2), None if end is None else round(offset + end, 2)),
+        })
+    return shifted
+
+
+def _merge_overlap(head, tail):
+    # 两个窗口都听到了重叠部分：去掉 tail 开头与 head 结尾重复的文字
+    for size in range(min(len(head), len(tail)), 1, -1):
+        if head.endswith(tail[:size]):
+            return head + tail[size:]
+    return head + tail
+
+
+def stitch_windows(windows, stride_length_s):
+    """
+    Join the chunks of overlapping windows, given in order as
+    (offset, length, is_last, shifted chunks), into one transcript.
+
+    Each window owns the chunks that start in its part of the audio, up to the middle
+    of each overlap, so nothing is emitted twice. A sentence cut off at the end of a
+    window is taken from the next window instead: if the next window heard its start,
+    the next window's chunk replaces it; otherwise the next window's first chunk
+    continues it and the text both windows heard is merged.
+    """
+    half_stride = stride_length_s / 2
+    stitched = []
+    pending = None
+    for offset, length, is_last, chunks in windows:
+        window_end = offset + length
+        low = offset + half_stride if offset > 0 else offset
+        high = float("inf") if is_last else window_end - half_stride
+        chunks = [(c["text"], c["timestamp"][0], c["timestamp"][1]) for c in chunks]
+
+        # 本窗口中覆盖上一窗口被截断句子开头的片段
+        following = []
+        if pending is not None:
+            following = [i for i, (_, _, end) in enumerate(chunks) if end is None or end > pending[1]]
+        if following:
+            i = following[0]
+            text, start, _ = pending
+            if start >= offset:
+                # 本窗口听到了整句，直接替换
+                kept = [chunks[i]]
+            else:
+                kept = [(_merge_overlap(text, chunks[i][0]), start, chunks[i][2])]
+            # 被截断的句子之后的内容只在本窗口中
+            kept += [chunk for chunk in chunks[i + 1:] if chunk[1] < high]
+        else:
+            if pending is not None:
+                stitched.append(pending)
+            kept = [chunk for chunk in chunks if low <= chunk[1] < high]
+        pending = None
+
+        if kept and not is_last:
+            text, start, end = kept[-1]
+            if end is None or end >= window_end:
+                pending = (text, start, window_end)
+                kept.pop()
+        for text, start, end in kept:
+            stitched.append((text, start, window_end if end is None else min(end, window_end)))
+    if pending is not None:
+        stitched.append(pending)
+
+    return [
+        {"text": text, "timestamp": (round(start, 2), round(max(end, start), 2))}
+        for text, start, end in stitched
+    ]
+
+
+def transcript_settings(long_form=None, chunk_length_s=None, stride_length_s=None, vad=None):
+    """
+    Settings that change the transcript produced by ASR() with the same arguments
+    (defaults from config), including the VAD backend actually used (silero falls back
+    to the energy VAD when not installed). Nothing is loaded, so it is cheap enough to
+    key cached transcripts before deciding whether ASR is needed at all.
+    """
+    return {
+        "model_id": MODEL_ID,
+        "generate_kwargs": generate_kwargs,
+        "long_form": long_form or config.ASR_LONG_FORM,
+        "chunk_length_s": chunk_length_s or config.ASR_CHUNK_LENGTH_S,
+        "stride_length_s": stride_length_s if stride_length_s is not None else config.ASR_STRIDE_LENGTH_S,
+        "vad": resolve_backend(vad or config.VAD_BACKEND),
+    }
+
 def print_elapsed(start_time, stop_event):
     while not stop_event.is_set():
         elapsed = time.time() - start_time
@@ -99,9 +346,9 @@ def print_elapsed(start_time, stop_event):
         stop_event.wait(10)  # 每10秒输出一次
 
 
-def write_result(result, result_path):
+def write_result(chunks, result_path):
     with open(result_path, "w", encoding="utf-8") as f:
-        for item in result[0]['chunks']:
+        for item in chunks:
             f.write(item["text"] + ",")
             f.write(str(item['timestamp'][0])+",")
             f.write(str(item['timestamp'][1]) + "\n")
@@ -145,7 +392,7 @@ def slow_asr(audio_path, result_path="result.txt"):
     stop_event.set()
     t.join()
     print(f"总用时: {int(time.time() - start_time)} 秒")
-    write_result(result, result_path)
+    write_result(result[0]['chunks'], result_path)
 
 
 def fast_asr(audio_path, result_path="result.txt"):
@@ -198,7 +445,7 @@ def fast_asr(audio_path, result_path="result.txt"):
     stop_event.set()
     t.join()
     print(f"总用时: {int(time.time() - start_time)} 秒")
-    write_result(result, result_path)
+    write_result(result[0]['chunks'], result_path)
 
 if __name__ == "__main__":
     # audio_path = "1753363872220364059-294138122944649.mp3"